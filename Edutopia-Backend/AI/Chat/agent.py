@@ -1,179 +1,352 @@
-from langchain.agents import AgentExecutor, create_react_agent
 from langchain.tools import BaseTool
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
-from langchain_groq import ChatGroq
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
-from typing import Dict, TypedDict, Annotated, Sequence, List, Any
-from langchain_huggingface import HuggingFaceEmbeddings
+from typing import Dict, TypedDict, Any
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
 from langchain_community.vectorstores import Chroma
+import chromadb
 from langchain.memory import ConversationSummaryBufferMemory
 import os
-import json
-import sqlite3
-from datetime import datetime
+import sys
+import uuid
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from functools import lru_cache
+
+# Make the shared AI helpers importable when running this service directly
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.embeddings import get_embeddings, CachedQueryEmbeddings
+from shared.context_packing import pack_documents
+from shared.llm import create_llm, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from shared.hybrid_retrieval import HybridRetriever
+from chat_sessions import SessionRegistry, SessionIndex, ChatSession, SessionNotLoaded
+from memory_store import MemoryStore
+from answer_cache import SemanticAnswerCache, depends_on_history
+from question_bank import QuestionBank
+from question_parsing import QuestionStreamParser, QuestionParseStats, validate_question
 
 # Suppress HuggingFace tokenizers warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
-# Load the Groq API key
-try:
-    groq_api_key = os.environ['GROQ_API_KEY']
-except KeyError:
-    logger.error("GROQ_API_KEY environment variable not set")
+# Load the Groq API key; replaying an LLM cassette needs none
+groq_api_key = os.getenv('GROQ_API_KEY')
+if not groq_api_key and os.getenv("LLM_CASSETTE_MODE", "").lower() != "replay":
+    print("GROQ_API_KEY environment variable not set")
     sys.exit(1)
 
-# Initialize LLM
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile",
-    api_key=GROQ_API_KEY,
-    temperature=0.7
+# Initialize LLM; chat answers go ahead of question generation
+llm = create_llm(
+    "llama-3.3-70b-versatile",
+    temperature=0.7,
+    priority=PRIORITY_INTERACTIVE,
+    api_key=groq_api_key,
+    call_site="chat"
+)
+rag_llm = llm.with_call_site("rag_tool")
+memory_llm = llm.with_call_site("memory_summary")
+question_llm = llm.with_priority(PRIORITY_BACKGROUND).with_call_site("question_generator")
+
+# Non-streamed question replies use Groq's JSON mode (QUESTION_JSON_MODE=0 turns it off)
+QUESTION_JSON_KWARGS = (
+    {"response_format": {"type": "json_object"}} if os.getenv("QUESTION_JSON_MODE", "1") != "0" else {}
 )
+question_stats = QuestionParseStats()
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings()
+# Initialize embeddings; repeated questions reuse their query vector
+embeddings = CachedQueryEmbeddings(get_embeddings(), max_size=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")))
 
-def parse_conversation_data(user_str: str, ai_str: str) -> ConversationSummaryBufferMemory:
-    try:
-        # Initialize memory
-        memory = ConversationSummaryBufferMemory(
-            llm=llm,
-            max_token_limit=2000,
-            return_messages=True
+# Retrieved chunks are merged and trimmed to this many prompt tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Questions whose best chunk has a lower cosine similarity skip the RAG prompt
+RAG_RELEVANCE_THRESHOLD = float(os.getenv("RAG_RELEVANCE_THRESHOLD", "0.3"))
+# Below this score (and above the threshold) the general answer is generated in
+# parallel with the RAG answer, in case the context turns out not to answer; 0 disables
+RAG_SPECULATIVE_BELOW = float(os.getenv("RAG_SPECULATIVE_BELOW", "0"))
+speculation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative")
+
+# Answers to standalone questions, shared by the sessions of one context
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+)
+
+# How RAG tool calls were answered
+routing_stats = {'rag': 0, 'general': 0, 'fallback': 0, 'speculative_used': 0, 'speculative_wasted': 0}
+routing_lock = threading.Lock()
+
+def count_route(route: str):
+    with routing_lock:
+        routing_stats[route] += 1
+
+# Requests without a session ID share this session
+DEFAULT_SESSION_ID = "default"
+
+# Conversation memory of every session survives restarts and context reloads
+memory_store = MemoryStore(os.getenv("CHAT_MEMORY_DB", str(Path(__file__).resolve().parent / "chat_memory.sqlite3")))
+
+def new_memory() -> ConversationSummaryBufferMemory:
+    return ConversationSummaryBufferMemory(
+        llm=memory_llm,
+        max_token_limit=2000,
+        return_messages=True
+    )
+
+def split_conversation(user_str: str, ai_str: str) -> list:
+    """Turn the legacy comma-joined history strings into ``(user message, answer)`` pairs"""
+    # Split the strings into lists
+    user_messages = [msg.strip() for msg in user_str.split(',')]
+    ai_messages = [msg.strip() for msg in ai_str.split(',')]
+    
+    # Ensure both lists have the same length
+    if len(user_messages) != len(ai_messages):
+        print("Warning: Number of user messages does not match number of AI messages")
+        min_length = min(len(user_messages), len(ai_messages))
+        user_messages = user_messages[:min_length]
+        ai_messages = ai_messages[:min_length]
+    # Only non-empty messages are conversation turns
+    return [(user_msg, ai_msg) for user_msg, ai_msg in zip(user_messages, ai_messages) if user_msg and ai_msg]
+
+def turns_from_messages(messages: list) -> list:
+    """Pair a JSON message array (``{"role": "user"|"assistant", "content": ...}``) into turns"""
+    if not isinstance(messages, list):
+        raise ValueError("'messages' must be a list")
+    turns = []
+    question = None
+    for message in messages:
+        if not isinstance(message, dict) or not isinstance(message.get('content'), str):
+            raise ValueError("Each message needs a 'role' and a string 'content'")
+        if message.get('role') == 'user':
+            question = message['content']
+        elif message.get('role') == 'assistant':
+            if question is None:
+                raise ValueError("An assistant message must follow a user message")
+            turns.append((question, message['content']))
+            question = None
+        else:
+            raise ValueError(f"Unknown message role: {message.get('role')!r}")
+    return turns
+
+def turns_to_messages(turns: list) -> list:
+    messages = []
+    for user_msg, ai_msg in turns:
+        messages.append({"role": "user", "content": user_msg})
+        messages.append({"role": "assistant", "content": ai_msg})
+    return messages
+
+def build_memory(turns: list, session_id: str = None, logged_turns: int = None) -> tuple:
+    """Build a session's memory from its turns; returns ``(memory, turns seen)``.
+
+    The summary and buffer saved for the session are restored without LLM calls,
+    and only turns that the saved memory has not seen are replayed. With
+    ``logged_turns`` (leading turns that match the session's log) the saved
+    memory is only used if it does not go beyond them.
+    """
+    memory = new_memory()
+    restored_turns = 0
+    saved = memory_store.load(session_id) if session_id else None
+    restored = saved is not None and (logged_turns is None or saved[2] <= logged_turns)
+    if restored:
+        summary, messages, restored_turns = saved
+        memory.moving_summary_buffer = summary
+        memory.chat_memory.messages = messages
+        print(f"Restored memory of {restored_turns} turns for session {session_id}")
+    
+    # Save each conversation pair the restored memory has not seen
+    for user_msg, ai_msg in turns[restored_turns:]:
+        memory.save_context(
+            {"input": user_msg},
+            {"output": ai_msg}
         )
-        
-        # Split the strings into lists
-        user_messages = [msg.strip() for msg in user_str.split(',')]
-        ai_messages = [msg.strip() for msg in ai_str.split(',')]
-        
-        # Ensure both lists have the same length
-        if len(user_messages) != len(ai_messages):
-            print("Warning: Number of user messages does not match number of AI messages")
-            min_length = min(len(user_messages), len(ai_messages))
-            user_messages = user_messages[:min_length]
-            ai_messages = ai_messages[:min_length]
-        
-        # Save each conversation pair to memory
-        for user_msg, ai_msg in zip(user_messages, ai_messages):
-            if user_msg and ai_msg:  # Only save non-empty messages
-                memory.save_context(
-                    {"input": user_msg},
-                    {"output": ai_msg}
-                )
-        
-        return memory
-        
+    
+    total_turns = max(restored_turns, len(turns))
+    if session_id and not (restored and total_turns == restored_turns):
+        memory_store.save(session_id, memory, total_turns)
+    return memory, total_turns
+
+def parse_conversation_data(user_str: str, ai_str: str, session_id: str = None,
+                            messages: list = None) -> tuple:
+    """Memory for a session from a JSON message array or the legacy history strings.
+
+    A message array replaces the session's turn log; the strings are not logged.
+    Once the session has saved memory the strings are ignored: answered queries
+    are logged by the server, and the strings split into extra "turns" whenever
+    a message contains a comma, so they cannot be lined up with the saved memory.
+    """
+    if messages is not None:
+        turns = turns_from_messages(messages)
+        logged_turns = memory_store.replace_turns(session_id, turns) if session_id else None
+        return build_memory(turns, session_id, logged_turns)
+    try:
+        if session_id and memory_store.load(session_id) is not None:
+            return build_memory([], session_id)
+        return build_memory(split_conversation(user_str or "", ai_str or ""), session_id)
     except Exception as e:
         print(f"Error parsing conversation data: {str(e)}")
         # Return fresh memory if parsing fails
-        return ConversationSummaryBufferMemory(
-            llm=llm,
-            max_token_limit=2000,
-            return_messages=True
+        return new_memory(), 0
+
+RAG_PROMPT = ChatPromptTemplate.from_template(
+    """
+    You are a helpful assistant. Answer the question **ONLY** using the provided context. 
+    If the context does not contain relevant information, respond with:  
+    "I don't know based on the provided context."  
+      
+    Context:  
+    {context}  
+    
+    Question: {input}  
+    """
+)
+rag_chain = create_stuff_documents_chain(rag_llm, RAG_PROMPT)
+
+@lru_cache(maxsize=1)
+def embedding_dimensions() -> int:
+    return len(embeddings.embed_query("dimensions"))
+
+def chunk_id(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# In-process Chroma client of the session collections, held here so chunk metadata can be
+# updated through chromadb's own API
+chroma_client = chromadb.EphemeralClient()
+
+def build_session_index(context_string: str, previous: SessionIndex = None) -> SessionIndex:
+    """Split a context into its own Chroma collection and build its hybrid retriever.
+
+    With the session's previous index, chunks are diffed by content hash: only new
+    chunks are embedded and only removed ones are deleted from the collection.
+    """
+    print("Creating new text chunks...")
+    # Start offsets let the context packer merge overlapping chunks exactly
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    final_documents = []
+    ids = []
+    for doc in text_splitter.create_documents([context_string]):
+        doc_id = chunk_id(doc.page_content)
+        if doc_id not in ids:  # repeated text adds nothing to the index
+            final_documents.append(doc)
+            ids.append(doc_id)
+    print(f"Created {len(final_documents)} document chunks")
+
+    if previous is None:
+        # Sessions share the in-process Chroma client, so each gets its own collection
+        print("Initializing new vector store...")
+        collection_name = f"chat-{uuid.uuid4().hex}"
+        # Cosine distances, so 1 - distance is the cosine similarity
+        vectors = Chroma(
+            client=chroma_client,
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            collection_metadata={"hnsw:space": "cosine"}
         )
+        collection = chroma_client.get_collection(collection_name, embedding_function=None)
+        existing = set()
+    else:
+        vectors, collection = previous.vectors, previous.collection
+        existing = set(previous.chunk_ids)
+
+    removed = existing.difference(ids)
+    if removed:
+        vectors.delete(ids=list(removed))
+    added = [(doc_id, doc) for doc_id, doc in zip(ids, final_documents) if doc_id not in existing]
+    if added:
+        vectors.add_documents([doc for _, doc in added], ids=[doc_id for doc_id, _ in added])
+    kept = [(doc_id, doc) for doc_id, doc in zip(ids, final_documents) if doc_id in existing]
+    if kept:
+        # Kept chunks may have moved in the new context; refresh their start offsets without re-embedding
+        collection.update(ids=[doc_id for doc_id, _ in kept], metadatas=[doc.metadata for _, doc in kept])
+    print(f"Embedded {len(added)} new chunks, removed {len(removed)}, kept {len(ids) - len(added)}")
+
+    # BM25 next to the vectors so exact terms like sns.barplot are found
+    retriever = HybridRetriever.from_documents(
+        vectors, final_documents, relevance_fn=lambda distance: 1.0 - distance
+    )
+
+    # Rough footprint: float32 vectors plus the HNSW graph, chunk text in Chroma and BM25
+    text_bytes = sum(len(doc.page_content.encode('utf-8')) for doc in final_documents)
+    nbytes = len(final_documents) * embedding_dimensions() * 4 * 2 + text_bytes * 3
+    return SessionIndex(vectors, retriever, ids, nbytes, collection)
+
+sessions = SessionRegistry(
+    build_session_index,
+    max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "1000")),
+    max_index_bytes=int(float(os.getenv("CHAT_INDEX_MEMORY_MB", "512")) * 1024 * 1024)
+)
 
-def load_context(context_string: str, user_str: str = None, ai_str: str = None) -> tuple:
+def load_context(context_string: str, user_str: str = None, ai_str: str = None,
+                 session_id: str = DEFAULT_SESSION_ID, messages: list = None,
+                 prepare_questions: bool = True) -> ChatSession:
+    """Load a session's context and conversation history, replacing what the session had
+
+    With QUESTION_BANK_PRELOAD set and ``prepare_questions``, the context's quiz
+    questions start generating now rather than on its first quiz request.
+    """
     try:
-        print(f"\nLoading context from provided string...")
-        print(f"Context length: {len(context_string)} characters")
+        print(f"\nLoading context for session {session_id}...")
+        print(f"Context length: {len(context_string or '')} characters")
         
         # Validate input
         if not context_string or not context_string.strip():
             raise ValueError("Context string cannot be empty")
         
-        # CLEAR ALL PREVIOUS RESOURCES
-        # Clear global variables if they exist
-        global vectors, retrieval_chain, memory
-        
-        # Clear Chroma DB if it exists (this will remove all documents and embeddings)
-        if 'vectors' in globals() and vectors is not None:
-            try:
-                print("Clearing existing vector store...")
-                # Get the Chroma collection and clear it
-                vectors.delete_collection()
-                vectors = None
-            except Exception as e:
-                print(f"Error clearing vector store: {str(e)}")
+        # A fresh memory with the conversation history, if provided
+        print("Loading conversation history into memory...")
+        memory, turns = parse_conversation_data(user_str, ai_str, session_id, messages)
         
-        # Clear retrieval chain
-        if 'retrieval_chain' in globals() and retrieval_chain is not None:
-            print("Clearing existing retrieval chain...")
-            retrieval_chain = None
-        
-        # Clear memory
-        if 'memory' in globals() and memory is not None:
-            print("Clearing existing memory...")
-            memory = None
-        
-        # Split text into chunks
-        print("Creating new text chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        final_documents = text_splitter.create_documents([context_string])
-        
-        print(f"Created {len(final_documents)} document chunks")
-        
-        # Initialize new Chroma DB
-        print("Initializing new vector store...")
-        vectors = Chroma.from_documents(final_documents, embeddings)
-        
-        # Create new RAG chain
-        print("Creating new retrieval chain...")
-        rag_prompt = ChatPromptTemplate.from_template(
-            """
-            You are a helpful assistant. Answer the question **ONLY** using the provided context. 
-            If the context does not contain relevant information, respond with:  
-            "I don't know based on the provided context."  
-              
-            Context:  
-            {context}  
-            
-            Question: {input}  
-            """
-        )
-        
-        document_chain = create_stuff_documents_chain(llm, rag_prompt)
-        retriever = vectors.as_retriever()
-        retrieval_chain = create_retrieval_chain(retriever, document_chain)
+        session = sessions.put(session_id, context_string, memory, turns)
+        with session.lock:
+            sessions.ensure_index(session)
+        if prepare_questions and QUESTION_BANK_PRELOAD:
+            question_bank.prepare(session.context_hash, context_string)
         
         print("Context loaded and processed successfully!")
-        
-        # Initialize a fresh memory
-        print("Initializing fresh memory...")
-        memory = ConversationSummaryBufferMemory(
-            llm=llm,
-            max_token_limit=2000,
-            return_messages=True
-        )
-        
-        # Then add conversation history if provided
-        if user_str and ai_str:
-            print("Loading conversation history into memory...")
-            # Parse and add conversation data to the fresh memory
-            user_messages = [msg.strip() for msg in user_str.split(',')]
-            ai_messages = [msg.strip() for msg in ai_str.split(',')]
-            
-            # Ensure both lists have the same length
-            if len(user_messages) != len(ai_messages):
-                print("Warning: Number of user messages does not match number of AI messages")
-                min_length = min(len(user_messages), len(ai_messages))
-                user_messages = user_messages[:min_length]
-                ai_messages = ai_messages[:min_length]
-            
-            # Save each conversation pair to memory
-            for user_msg, ai_msg in zip(user_messages, ai_messages):
-                if user_msg and ai_msg:  # Only save non-empty messages
-                    memory.save_context(
-                        {"input": user_msg},
-                        {"output": ai_msg}
-                    )
-        
-        return vectors, retrieval_chain, memory
+        return session
         
     except Exception as e:
         print(f"Error loading context: {str(e)}")
         raise
 
+def load_history(user_str: str = None, ai_str: str = None, session_id: str = DEFAULT_SESSION_ID,
+                 messages: list = None) -> ChatSession:
+    """Replace a loaded session's conversation history, leaving its context and index alone"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise SessionNotLoaded(session_id)
+    with session.lock:
+        session.memory, session.turns = parse_conversation_data(user_str, ai_str, session_id, messages)
+    return session
+
+def record_turn(session: ChatSession, user_message: str, ai_message: str) -> int:
+    """Add a turn to the session's memory and log. Call with ``session.lock`` held."""
+    session.memory.save_context({"input": user_message}, {"output": ai_message})
+    session.turns += 1
+    memory_store.save(session.session_id, session.memory, session.turns)
+    return memory_store.append_turn(session.session_id, user_message, ai_message)
+
+def append_turn(user_message: str, ai_message: str, session_id: str = DEFAULT_SESSION_ID) -> int:
+    """Add one turn to a loaded session's log and memory; returns its number in the log"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise SessionNotLoaded(session_id)
+    with session.lock:
+        return record_turn(session, user_message, ai_message)
+
+def get_history(session_id: str, offset: int = 0, limit: int = None) -> dict:
+    """A page of a session's turn log as a JSON message array"""
+    return {
+        "session_id": session_id,
+        "total_turns": memory_store.count_turns(session_id),
+        "offset": offset,
+        "messages": turns_to_messages(memory_store.turns(session_id, offset, limit))
+    }
+
 # Example context string - replace this with your actual context
 EXAMPLE_CONTEXT = """
 Seaborn is a Python data visualization library based on matplotlib. It provides a high-level interface for drawing attractive and informative statistical graphics.
@@ -199,9 +372,6 @@ Statistical plotting capabilities:
 Seaborn excels at statistical visualization including regression plots, distribution plots, and categorical plots.
 """
 
-# Load initial context and memory with string instead of file
-vectors, retrieval_chain, memory = load_context(EXAMPLE_CONTEXT)
-
 # Define the state with memory
 class AgentState(TypedDict):
     input: str
@@ -210,64 +380,63 @@ class AgentState(TypedDict):
     questions: str
     tool_used: str
     thoughts: str
-    memory: ConversationSummaryBufferMemory
+    session: ChatSession
+    route: str  # RAG tool route of the answer, see RAGTool.route
 
 # Define the RAG Tool
 class RAGTool(BaseTool):
     name: str = "RAG Tool"
     description: str = "Use this tool to retrieve information from the knowledge base or generate an answer using built-in knowledge."
-    memory: ConversationSummaryBufferMemory = None
+    session: Any = None  # the ChatSession whose index and memory are used
+    # Route of the last answer (see count_route); only 'rag' and 'speculative_wasted'
+    # answers come from the context alone, the others use the session's conversation
+    route: str = ""
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.memory = None
+    def _take_route(self, route: str):
+        self.route = route
+        count_route(route)
+
+    def _retrieve(self, input: str) -> tuple:
+        """Packed context for the question and the similarity of its best chunk"""
+        print("\nQuerying knowledge base...")
+        index = sessions.ensure_index(self.session)
+        # One query embedding and one search; the scored chunks become the prompt context
+        docs_with_scores, mode = index.retriever.search(input)
+        context, packing_stats = pack_documents(docs_with_scores, CONTEXT_TOKEN_BUDGET)
+        
+        # Keyword mode means an identifier of the question matched the context exactly
+        dense_scores = [doc.metadata['dense_score'] for doc, _ in docs_with_scores
+                        if doc.metadata.get('dense_score') is not None]
+        best_score = 1.0 if mode == 'keyword' else max(dense_scores, default=0.0)
+        print(f"Found {len(docs_with_scores)} documents ({mode} retrieval, best score {best_score:.2f}), "
+              f"packed into {packing_stats['tokens_after']} tokens")
+        return context, best_score
 
     def _run(self, input: str) -> str:
         try:
-            print("\nQuerying knowledge base...")
-            # Get relevant documents with scores
-            docs_with_scores = vectors.similarity_search_with_score(input, k=5)
+            context, best_score = self._retrieve(input)
             
-            # Filter documents based on similarity threshold
-            relevant_docs = [doc for doc, score in docs_with_scores if score > 0.7]
+            # Nothing relevant retrieved: the RAG prompt could only say it doesn't know
+            if not context or best_score < RAG_RELEVANCE_THRESHOLD:
+                print("No relevant context, answering from general knowledge...")
+                self._take_route('general')
+                return self._general_answer(input)
             
-            print(f"Found {len(relevant_docs)} relevant documents")
+            # Borderline retrieval: run the fallback next to the RAG prompt instead of after it
+            fallback = None
+            if best_score < RAG_SPECULATIVE_BELOW:
+                print("Borderline relevance, starting the general answer speculatively...")
+                fallback = speculation_pool.submit(self._general_answer, input)
             
-            # First try RAG response
             print("Generating RAG-based response...")
-            response = retrieval_chain.invoke({"input": input})
-            rag_answer = response['answer']
+            rag_answer = rag_chain.invoke({"input": input, "context": context})
             
             # If RAG doesn't know, fall back to LLM silently
             if "I don't know based on the provided context" in rag_answer:
-                # Get conversation history from memory if available
-                conversation_history = []
-                if self.memory:
-                    memory_variables = self.memory.load_memory_variables({})
-                    conversation_history = memory_variables.get("history", [])
-                
-                # Create a prompt for the LLM that includes conversation history
-                prompt = PromptTemplate(
-                    input_variables=["conversation_history", "query"],
-                    template=(
-                        "Previous conversation:\n{conversation_history}\n\n"
-                        "Current question: {query}\n\n"
-                        "Please provide a brief and concise answer that takes into account the previous conversation. "
-                        "Requirements:\n"
-                        "1. Keep the answer short and to the point\n"
-                        "2. Focus on the most important information\n"
-                        "3. Use bullet points if appropriate\n"
-                        "4. Maximum 3-4 sentences\n"
-                        "5. Reference previous conversation when relevant"
-                    )
-                )
-                final_prompt = prompt.format(
-                    conversation_history="\n".join([f"{msg.type}: {msg.content}" for msg in conversation_history]) if conversation_history else "No previous conversation",
-                    query=input
-                )
-                llm_response = llm.invoke(final_prompt)
-                return llm_response.content
+                self._take_route('speculative_used' if fallback else 'fallback')
+                return fallback.result() if fallback else self._general_answer(input)
             
+            self._take_route('speculative_wasted' if fallback else 'rag')
             return rag_answer
             
         except Exception as e:
@@ -275,8 +444,241 @@ class RAGTool(BaseTool):
             print(f"\nError: {error_msg}")
             return error_msg
 
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+    def _general_prompt(self, input: str) -> str:
+        # Get conversation history from memory if available
+        conversation_history = []
+        if self.session.memory:
+            memory_variables = self.session.memory.load_memory_variables({})
+            conversation_history = memory_variables.get("history", [])
+        
+        # Create a prompt for the LLM that includes conversation history
+        prompt = PromptTemplate(
+            input_variables=["conversation_history", "query"],
+            template=(
+                "Previous conversation:\n{conversation_history}\n\n"
+                "Current question: {query}\n\n"
+                "Please provide a brief and concise answer that takes into account the previous conversation. "
+                "Requirements:\n"
+                "1. Keep the answer short and to the point\n"
+                "2. Focus on the most important information\n"
+                "3. Use bullet points if appropriate\n"
+                "4. Maximum 3-4 sentences\n"
+                "5. Reference previous conversation when relevant"
+            )
+        )
+        return prompt.format(
+            conversation_history="\n".join([f"{msg.type}: {msg.content}" for msg in conversation_history]) if conversation_history else "No previous conversation",
+            query=input
+        )
+
+    def _general_answer(self, input: str) -> str:
+        """Answer from the LLM's own knowledge, taking the conversation into account"""
+        llm_response = rag_llm.invoke(self._general_prompt(input))
+        return llm_response.content
+
+    async def _ageneral_answer(self, input: str) -> str:
+        llm_response = await rag_llm.ainvoke(self._general_prompt(input))
+        return llm_response.content
+
+    async def _arun(self, input: str) -> str:
+        try:
+            # Embedding, search and a possible index rebuild are CPU work; keep them off the event loop
+            context, best_score = await asyncio.to_thread(self._retrieve, input)
+            
+            if not context or best_score < RAG_RELEVANCE_THRESHOLD:
+                print("No relevant context, answering from general knowledge...")
+                self._take_route('general')
+                return await self._ageneral_answer(input)
+            
+            fallback = None
+            if best_score < RAG_SPECULATIVE_BELOW:
+                print("Borderline relevance, starting the general answer speculatively...")
+                fallback = asyncio.create_task(self._ageneral_answer(input))
+            
+            print("Generating RAG-based response...")
+            try:
+                rag_answer = await rag_chain.ainvoke({"input": input, "context": context})
+            except BaseException:
+                if fallback:
+                    fallback.cancel()
+                raise
+            
+            if "I don't know based on the provided context" in rag_answer:
+                self._take_route('speculative_used' if fallback else 'fallback')
+                return await fallback if fallback else await self._ageneral_answer(input)
+            
+            # Unlike the threaded version, an unneeded speculative answer is cancelled
+            self._take_route('speculative_wasted' if fallback else 'rag')
+            if fallback:
+                fallback.cancel()
+            return rag_answer
+            
+        except Exception as e:
+            error_msg = f"Error in RAG processing: {str(e)}"
+            print(f"\nError: {error_msg}")
+            return error_msg
+
+def detect_question_type(user_request: str) -> str:
+    """Question type asked for in a request: mcq (default), yes_no or true_false"""
+    request = user_request.lower()
+    if "mcq" in request:
+        return "mcq"
+    if "y/n" in request or "yes/no" in request:
+        return "yes_no"
+    if "t/f" in request or "true/false" in request:
+        return "true_false"
+    return "mcq"
+
+def question_template(question_type: str) -> str:
+    if question_type == "mcq":
+        return (
+            "{{\n"
+            '  "questions": [\n'
+            '    {{"question": "Question 1?",\n'
+            '      "options": ["A) Option 1", "B) Option 2", "C) Option 3", "D) Option 4"],\n'
+            '      "answer": "B) Option 2"}},\n'
+            '    // 4 more similar MCQ questions\n'
+            "  ]\n"
+            "}}"
+        )
+    return (
+        "{{\n"
+        '  "questions": [\n'
+        '    {{"question": "Question 1?", "answer": "Answer 1"}},\n'
+        '    // 4 more similar questions\n'
+        "  ]\n"
+        "}}"
+    )
+
+def question_prompt(paragraph_text: str, user_request: str, question_type: str, count: int) -> str:
+    prompt = PromptTemplate(
+        input_variables=["paragraph_text", "user_request", "template", "count"],
+        template=(
+            "You are a question generator that creates structured questions based on educational text.\n\n"
+            "Based on this text:\n\n"
+            "{paragraph_text}\n\n"
+            "Generate questions as per this request:\n"
+            "{user_request}\n\n"
+            "IMPORTANT: Return ONLY a valid JSON object with this EXACT structure:\n"
+            "{template}\n\n"
+            "REQUIREMENTS:\n"
+            "1. Return ONLY the JSON object, no other text\n"
+            "2. Ensure all JSON keys and values are in double quotes\n"
+            "3. Generate EXACTLY {count} questions\n"
+            "4. Follow the example format exactly\n"
+            "5. Base all questions on the provided text only\n"
+            "6. For MCQ questions, provide 4 options (A, B, C, D) and mark the correct answer\n"
+        )
+    )
+    return prompt.format(
+        paragraph_text=paragraph_text.strip(),
+        user_request=user_request.strip(),
+        template=question_template(question_type),
+        count=count
+    )
+
+def repair_request(user_request: str, seen: list) -> str:
+    """The request for the questions still missing after a reply had invalid ones"""
+    if not seen:
+        return user_request
+    question_stats.record(repair_calls=1)
+    return user_request + "\nDo not repeat these questions:\n" + "\n".join(f"- {q['question']}" for q in seen)
+
+def accept_questions(parser: QuestionStreamParser, piece: str, question_type: str,
+                     seen: list, count: int, tally: dict) -> list:
+    """Validate the questions completed by a piece of a reply; adds them to ``seen`` and returns them"""
+    accepted = []
+    for question in parser.feed(piece):
+        tally['parsed'] += 1
+        valid = validate_question(question, question_type)
+        if valid is None or len(seen) >= count:
+            tally['dropped'] += valid is None
+            continue
+        tally['repaired'] += valid != {key: question.get(key) for key in valid}
+        seen.append(valid)
+        accepted.append(valid)
+    return accepted
+
+def record_question_reply(parser: QuestionStreamParser, tally: dict):
+    print(f"Parsed {tally['parsed']} questions ({tally['repaired']} repaired, {tally['dropped']} dropped, "
+          f"{parser.malformed} malformed)")
+    question_stats.record(
+        responses=1, failed_responses=int(tally['parsed'] == 0), questions=tally['parsed'] - tally['dropped'],
+        repaired=tally['repaired'], dropped=tally['dropped'], malformed=parser.malformed
+    )
+
+def iter_question_data(paragraph_text: str, user_request: str, question_type: str,
+                       llm=None, count: int = 5, stream: bool = False):
+    """Yield up to ``count`` validated questions of a type about a text as each one is parsed
+
+    With ``stream`` the reply is streamed and every question is yielded as soon
+    as its JSON object is complete; otherwise the reply is requested in the
+    provider's JSON mode. Questions that fail validation are asked for again
+    once, in a smaller request for just the missing ones.
+    """
+    llm = llm or question_llm
+    seen = []
+    for attempt in range(2):
+        missing = count - len(seen)
+        if missing <= 0:
+            return
+        final_prompt = question_prompt(paragraph_text, repair_request(user_request, seen), question_type, missing)
+
+        print(f"Sending prompt to LLM for {missing} questions...")
+        if stream:
+            # JSON mode cannot be streamed, so streamed replies rely on the parser and validator alone
+            pieces = (chunk.content for chunk in llm.stream(final_prompt))
+        else:
+            pieces = [llm.invoke(final_prompt, **QUESTION_JSON_KWARGS).content]
+
+        parser = QuestionStreamParser()
+        tally = {'parsed': 0, 'repaired': 0, 'dropped': 0}
+        for piece in pieces:
+            yield from accept_questions(parser, piece, question_type, seen, count, tally)
+        record_question_reply(parser, tally)
+    if not seen:
+        raise ValueError("Could not extract valid JSON from response")
+
+def generate_question_data(paragraph_text: str, user_request: str, question_type: str,
+                           llm=None, count: int = 5) -> list:
+    """Ask the LLM for ``count`` questions of a type about a text; returns the question dicts"""
+    return list(iter_question_data(paragraph_text, user_request, question_type, llm=llm, count=count))
+
+async def agenerate_question_data(paragraph_text: str, user_request: str, question_type: str,
+                                  llm=None, count: int = 5) -> list:
+    """Async ``generate_question_data``"""
+    llm = llm or question_llm
+    seen = []
+    for attempt in range(2):
+        missing = count - len(seen)
+        if missing <= 0:
+            break
+        final_prompt = question_prompt(paragraph_text, repair_request(user_request, seen), question_type, missing)
+        print(f"Sending prompt to LLM for {missing} questions...")
+        response = await llm.ainvoke(final_prompt, **QUESTION_JSON_KWARGS)
+        parser = QuestionStreamParser()
+        tally = {'parsed': 0, 'repaired': 0, 'dropped': 0}
+        accept_questions(parser, response.content, question_type, seen, count, tally)
+        record_question_reply(parser, tally)
+    if not seen:
+        raise ValueError("Could not extract valid JSON from response")
+    return seen
+
+def format_questions(questions: list, question_type: str) -> str:
+    # Format the output nicely
+    formatted_output = f"Here are the generated {question_type.upper()} questions:\n\n"
+    
+    if question_type == "mcq":
+        for i, q in enumerate(questions, 1):
+            formatted_output += f"{i}. {q['question']}\n"
+            for option in q["options"]:
+                formatted_output += f"   {option}\n"
+            formatted_output += f"   Answer: {q['answer']}\n\n"
+    else:
+        for i, q in enumerate(questions, 1):
+            formatted_output += f"{i}. {q['question']}\n"
+            formatted_output += f"   Answer: {q['answer']}\n\n"
+    return formatted_output
 
 # Question Generator Tool
 class QuestionGenerator(BaseTool):
@@ -288,123 +690,74 @@ class QuestionGenerator(BaseTool):
         "The tool can generate different types of questions (MCQ, Y/N, T/F, WH) based on the requirements."
     )
 
+    def _parse_input(self, input: str) -> tuple:
+        """Text, request and question type of an ``<original_text> ### <question_requirements>`` input"""
+        print("\nStarting question generation...")
+        if "###" in input:
+            paragraph_text, user_request = input.split("###", 1)
+            print(f"Split input into text and request")
+        else:
+            paragraph_text = input
+            user_request = "Generate 5 questions about the topic"
+            print("Using default question request")
+        
+        # Determine question type from user request
+        question_type = detect_question_type(user_request)
+        print(f"Generating {question_type} questions...")
+        return paragraph_text, user_request, question_type
+
     def _run(self, input: str) -> str:
         try:
-            print("\nStarting question generation...")
-            if "###" in input:
-                paragraph_text, user_request = input.split("###", 1)
-                print(f"Split input into text and request")
-            else:
-                paragraph_text = input
-                user_request = "Generate 5 questions about the topic"
-                print("Using default question request")
-            
-            # Determine question type from user request
-            question_type = "mcq"  # default
-            if "mcq" in user_request.lower():
-                question_type = "mcq"
-            elif "y/n" in user_request.lower() or "yes/no" in user_request.lower():
-                question_type = "yes_no"
-            elif "t/f" in user_request.lower() or "true/false" in user_request.lower():
-                question_type = "true_false"
-            
-            print(f"Generating {question_type} questions...")
-            
-            # Create appropriate template based on question type
-            if question_type == "mcq":
-                template = (
-                    "{{\n"
-                    '  "questions": [\n'
-                    '    {{"question": "Question 1?",\n'
-                    '      "options": ["A) Option 1", "B) Option 2", "C) Option 3", "D) Option 4"],\n'
-                    '      "answer": "B) Option 2"}},\n'
-                    '    // 4 more similar MCQ questions\n'
-                    "  ]\n"
-                    "}}"
-                )
-            else:
-                template = (
-                    "{{\n"
-                    '  "questions": [\n'
-                    '    {{"question": "Question 1?", "answer": "Answer 1"}},\n'
-                    '    // 4 more similar questions\n'
-                    "  ]\n"
-                    "}}"
-                )
-            
-            prompt = PromptTemplate(
-                input_variables=["paragraph_text", "user_request", "template"],
-                template=(
-                    "You are a question generator that creates structured questions based on educational text.\n\n"
-                    "Based on this text:\n\n"
-                    "{paragraph_text}\n\n"
-                    "Generate questions as per this request:\n"
-                    "{user_request}\n\n"
-                    "IMPORTANT: Return ONLY a valid JSON object with this EXACT structure:\n"
-                    "{template}\n\n"
-                    "REQUIREMENTS:\n"
-                    "1. Return ONLY the JSON object, no other text\n"
-                    "2. Ensure all JSON keys and values are in double quotes\n"
-                    "3. Generate EXACTLY 5 questions\n"
-                    "4. Follow the example format exactly\n"
-                    "5. Base all questions on the provided text only\n"
-                    "6. For MCQ questions, provide 4 options (A, B, C, D) and mark the correct answer\n"
-                )
+            paragraph_text, user_request, question_type = self._parse_input(input)
+            formatted_output = format_questions(
+                generate_question_data(paragraph_text, user_request, question_type), question_type
             )
+            print(formatted_output)
+            return formatted_output
+                
+        except Exception as e:
+            error_msg = f"Error in question generation: {str(e)}"
+            print(f"\nError: {error_msg}")
+            return error_msg
 
-            print("Formatting prompt...")
-            final_prompt = prompt.format(
-                paragraph_text=paragraph_text.strip(),
-                user_request=user_request.strip(),
-                template=template
+    async def _arun(self, input: str) -> str:
+        try:
+            paragraph_text, user_request, question_type = self._parse_input(input)
+            formatted_output = format_questions(
+                await agenerate_question_data(paragraph_text, user_request, question_type), question_type
             )
-            print("Sending prompt to LLM...")
-            response = llm.invoke(final_prompt)
-            print("Received response from LLM")
-            
-            # Validate JSON
-            try:
-                questions_data = json.loads(response.content)
-                # Format the output nicely
-                formatted_output = f"Here are the generated {question_type.upper()} questions:\n\n"
-                
-                if question_type == "mcq":
-                    for i, q in enumerate(questions_data["questions"], 1):
-                        formatted_output += f"{i}. {q['question']}\n"
-                        for option in q["options"]:
-                            formatted_output += f"   {option}\n"
-                        formatted_output += f"   Answer: {q['answer']}\n\n"
-                else:
-                    for i, q in enumerate(questions_data["questions"], 1):
-                        formatted_output += f"{i}. {q['question']}\n"
-                        formatted_output += f"   Answer: {q['answer']}\n\n"
-
-                print(formatted_output)
-                
-                return formatted_output
-                
-            except json.JSONDecodeError:
-                print("Invalid JSON received. Attempting to fix...")
-                import re
-                json_match = re.search(r'({[\s\S]*})', response.content)
-                if json_match:
-                    json_str = json_match.group(1)
-                    json.loads(json_str)  # Validate
-                    return json_str
-                raise ValueError("Could not extract valid JSON from response")
+            print(formatted_output)
+            return formatted_output
                 
         except Exception as e:
             error_msg = f"Error in question generation: {str(e)}"
             print(f"\nError: {error_msg}")
             return error_msg
 
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+QUESTION_TYPE_NAMES = {"mcq": "multiple-choice", "yes_no": "yes/no", "true_false": "true/false"}
 
-# Initialize tools
-rag_tool = RAGTool()
+def generate_bank_questions(section_text: str, question_type: str, count: int) -> list:
+    return generate_question_data(
+        section_text, f"Generate {count} {QUESTION_TYPE_NAMES[question_type]} questions about this section",
+        question_type, llm=bank_llm, count=count
+    )
+
+# Quizzes are served from questions generated in the background for each loaded context
+bank_llm = question_llm.with_call_site("question_bank")
+question_bank = QuestionBank(
+    generate_bank_questions,
+    max_sections=int(os.getenv("QUESTION_BANK_SECTIONS", "4")),
+    max_workers=int(os.getenv("QUESTION_BANK_WORKERS", "2"))
+)
+# Fill a context's bank when it is loaded instead of on its first quiz request
+QUESTION_BANK_PRELOAD = os.getenv("QUESTION_BANK_PRELOAD", "0") == "1"
+
+# Load the example context into the default session, used by requests without a session ID;
+# importing the agent makes no LLM calls
+load_context(EXAMPLE_CONTEXT, prepare_questions=False)
+
+# Initialize tools; the RAG tool is created per query for the query's session
 question_tool = QuestionGenerator()
-tools = [rag_tool, question_tool]
 
 def plan_action(state: AgentState) -> AgentState:
     """Plan the next action based on the input"""
@@ -428,68 +781,142 @@ def router(state: AgentState) -> Dict[str, str]:
     else:
         return {"next": "rag_query"}
 
+def rag_answered(state: AgentState, answer: str, route: str) -> AgentState:
+    state["thoughts"] += f"\n\nReceived answer from RAG system. Processing response..."
+    state["final_answer"] = answer
+    state["current_step"] = "completed"
+    state["tool_used"] = "rag"
+    state["route"] = route
+    return state
+
+def rag_failed(state: AgentState, e: Exception) -> AgentState:
+    state["thoughts"] += f"\n\nError occurred while querying RAG system: {str(e)}"
+    state["final_answer"] = f"Error getting answer: {str(e)}"
+    state["current_step"] = "error"
+    state["tool_used"] = "rag"
+    return state
+
 def rag_query(state: AgentState) -> AgentState:
     """Use the RAG tool to answer the query"""
     try:
         state["thoughts"] += "\n\nExecuting RAG query to find relevant information..."
-        answer = rag_tool.run(state["input"])
-        state["thoughts"] += f"\n\nReceived answer from RAG system. Processing response..."
-        state["final_answer"] = answer
-        state["current_step"] = "completed"
-        state["tool_used"] = "rag"
-        return state
+        tool = RAGTool(session=state["session"])
+        return rag_answered(state, tool.run(state["input"]), tool.route)
     except Exception as e:
-        state["thoughts"] += f"\n\nError occurred while querying RAG system: {str(e)}"
-        state["final_answer"] = f"Error getting answer: {str(e)}"
-        state["current_step"] = "error"
-        state["tool_used"] = "rag"
-        return state
+        return rag_failed(state, e)
+
+async def arag_query(state: AgentState) -> AgentState:
+    """Async ``rag_query``"""
+    try:
+        state["thoughts"] += "\n\nExecuting RAG query to find relevant information..."
+        tool = RAGTool(session=state["session"])
+        return rag_answered(state, await tool.arun(state["input"]), tool.route)
+    except Exception as e:
+        return rag_failed(state, e)
+
+def question_topic(query: str) -> str:
+    """Topic of a "generate ... questions about ..." request"""
+    return query.lower().replace("generate", "").replace("questions", "").replace("about", "").replace("the history of", "").strip()
+
+# Prompt for the LLM to get information about a topic the context doesn't cover
+TOPIC_INFO_PROMPT = PromptTemplate(
+    input_variables=["topic"],
+    template=(
+        "Provide a detailed overview of {topic}. Include key facts, concepts, and important information. "
+        "Focus on accuracy and comprehensiveness while being concise. "
+        "Include both historical and current information where relevant."
+    )
+)
+
+def question_base_text(session: ChatSession, topic: str) -> tuple:
+    """Text to write questions from: what the RAG tool finds about the topic, else an LLM overview.
+
+    Returns ``(text, from_rag)``. Call with ``session.lock`` held.
+    """
+    rag_query = f"provide detailed information about {topic}"
+    rag_response = RAGTool(session=session).run(rag_query)
+    if "I don't know based on the provided context" not in rag_response:
+        return rag_response, True
+    topic_info = question_llm.invoke(TOPIC_INFO_PROMPT.format(topic=topic))
+    return topic_info.content, False
+
+async def aquestion_base_text(session: ChatSession, topic: str) -> tuple:
+    """Async ``question_base_text``"""
+    rag_query = f"provide detailed information about {topic}"
+    rag_response = await RAGTool(session=session).arun(rag_query)
+    if "I don't know based on the provided context" not in rag_response:
+        return rag_response, True
+    topic_info = await question_llm.ainvoke(TOPIC_INFO_PROMPT.format(topic=topic))
+    return topic_info.content, False
+
+def serve_banked_questions(state: AgentState, topic: str) -> bool:
+    """Put a quiz from the context's question bank into the state; False when it holds too few"""
+    question_type = detect_question_type(state["input"].lower())
+    session = state["session"]
+    banked = question_bank.take(session.context_hash, question_type, 5, topic, session.context)
+    if not banked:
+        return False
+    state["thoughts"] += "\n\nServed questions from the question bank."
+    state["questions"] = format_questions(banked, question_type)
+    state["current_step"] = "questions_generated"
+    state["tool_used"] = "questions"
+    return True
+
+def note_base_text(state: AgentState, from_rag: bool):
+    # Check if RAG had relevant information
+    if from_rag:
+        state["thoughts"] += "\n\nUsing information from RAG system."
+    else:
+        state["thoughts"] += "\n\nNo relevant information found in RAG. Generated base information using LLM knowledge."
+    state["thoughts"] += "\n\nUsing Question Generator tool to create structured questions..."
+
+def questions_generated(state: AgentState, questions: str) -> AgentState:
+    state["thoughts"] += "\n\nQuestions generated successfully. Moving to formatting step..."
+    state["questions"] = questions
+    state["current_step"] = "questions_generated"
+    state["tool_used"] = "questions"
+    return state
+
+def question_generation_failed(state: AgentState, e: Exception) -> AgentState:
+    state["thoughts"] += f"\n\nError occurred while generating questions: {str(e)}"
+    state["final_answer"] = f"Error generating questions: {str(e)}"
+    state["current_step"] = "error"
+    state["tool_used"] = "questions"
+    return state
 
 def generate_questions(state: AgentState) -> AgentState:
     """Generate questions using the Question Generator tool"""
     try:
         state["thoughts"] += "\n\nPreparing to generate questions..."
         # Extract the topic from the query
-        query = state["input"].lower()
-        topic = query.replace("generate", "").replace("questions", "").replace("about", "").replace("the history of", "").strip()
+        topic = question_topic(state["input"])
+        if serve_banked_questions(state, topic):
+            return state
         
         # First try to get information from RAG
         state["thoughts"] += f"\n\nChecking RAG system for information about {topic}..."
-        rag_query = f"provide detailed information about {topic}"
-        rag_response = rag_tool.run(rag_query)
-        
-        # Check if RAG had relevant information
-        if "I don't know based on the provided context" in rag_response:
-            state["thoughts"] += f"\n\nNo relevant information found in RAG. Using LLM knowledge..."
-            # Create a prompt for the LLM to get information about the topic
-            info_prompt = PromptTemplate(
-                input_variables=["topic"],
-                template=(
-                    "Provide a detailed overview of {topic}. Include key facts, concepts, and important information. "
-                    "Focus on accuracy and comprehensiveness while being concise. "
-                    "Include both historical and current information where relevant."
-                )
-            )
-            topic_info = llm.invoke(info_prompt.format(topic=topic))
-            base_text = topic_info.content
-            state["thoughts"] += "\n\nGenerated base information using LLM knowledge."
-        else:
-            state["thoughts"] += "\n\nUsing information from RAG system."
-            base_text = rag_response
-        
-        state["thoughts"] += "\n\nUsing Question Generator tool to create structured questions..."
+        base_text, from_rag = question_base_text(state["session"], topic)
+        note_base_text(state, from_rag)
         questions = question_tool.run(f"{base_text} ### Generate 5 questions about {topic}")
-        state["thoughts"] += "\n\nQuestions generated successfully. Moving to formatting step..."
-        state["questions"] = questions
-        state["current_step"] = "questions_generated"
-        state["tool_used"] = "questions"
-        return state
+        return questions_generated(state, questions)
     except Exception as e:
-        state["thoughts"] += f"\n\nError occurred while generating questions: {str(e)}"
-        state["final_answer"] = f"Error generating questions: {str(e)}"
-        state["current_step"] = "error"
-        state["tool_used"] = "questions"
-        return state
+        return question_generation_failed(state, e)
+
+async def agenerate_questions(state: AgentState) -> AgentState:
+    """Async ``generate_questions``"""
+    try:
+        state["thoughts"] += "\n\nPreparing to generate questions..."
+        topic = question_topic(state["input"])
+        if serve_banked_questions(state, topic):
+            return state
+        
+        state["thoughts"] += f"\n\nChecking RAG system for information about {topic}..."
+        base_text, from_rag = await aquestion_base_text(state["session"], topic)
+        note_base_text(state, from_rag)
+        questions = await question_tool.arun(f"{base_text} ### Generate 5 questions about {topic}")
+        return questions_generated(state, questions)
+    except Exception as e:
+        return question_generation_failed(state, e)
 
 def format_final_answer(state: AgentState) -> AgentState:
     """Format the final answer with the generated questions"""
@@ -514,8 +941,9 @@ workflow = StateGraph(AgentState)
 # Add nodes
 workflow.add_node("plan", plan_action)  # Add planning node first
 workflow.add_node("router", router)
-workflow.add_node("rag_query", rag_query)
-workflow.add_node("generate_questions", generate_questions)
+# Tool nodes have async versions, used when the graph is run with ainvoke
+workflow.add_node("rag_query", RunnableLambda(rag_query, afunc=arag_query))
+workflow.add_node("generate_questions", RunnableLambda(generate_questions, afunc=agenerate_questions))
 workflow.add_node("format_answer", format_final_answer)
 
 # Add edges
@@ -545,50 +973,162 @@ workflow.set_entry_point("plan")
 # Compile the graph
 app = workflow.compile()
 
-def process_query(query: str):
-    """Process a user query and return the response"""
+def new_state(query: str, session: ChatSession) -> AgentState:
+    """Initial graph state of a query, with the session's memory"""
+    return {
+        "input": query,
+        "current_step": "start",
+        "final_answer": "",
+        "questions": "",
+        "tool_used": "",
+        "thoughts": "Starting to process the query...",
+        "session": session,
+        "route": ""
+    }
+
+def cached_answer(session: ChatSession, query: str, cacheable: bool) -> tuple:
+    """``(cached answer or None, query vector)``. Call with ``session.lock`` held."""
+    if not cacheable:
+        answer_cache.bypass()
+        return None, None
+    # The RAG tool's search reuses this embedding from the query embedding cache
+    query_vector = embeddings.embed_query(query)
+    return answer_cache.lookup(session.context_hash, query_vector), query_vector
+
+def cache_answer(session: ChatSession, query: str, query_vector, final_state: AgentState, started: float):
+    """Store a context-grounded RAG answer of a cacheable query in the semantic cache
+
+    General and fallback answers are built from the session's conversation, so
+    they must not be served to other sessions on the same context.
+    """
+    final_answer = final_state["final_answer"]
+    if (query_vector is not None and final_state["route"] in ("rag", "speculative_wasted")
+            and final_state["current_step"] == "completed" and not final_answer.startswith("Error")):
+        answer_cache.store(session.context_hash, embeddings.key(query), query_vector, final_answer,
+                           time.perf_counter() - started)
+
+def process_query(query: str, session_id: str = DEFAULT_SESSION_ID):
+    """Process a user query in a session and return the response"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise SessionNotLoaded(session_id)
     try:
-        print(f"\nProcessing query: '{query}'")
+        print(f"\nProcessing query for session {session_id}: '{query}'")
         print("Initializing agent state...")
+        initial_state = new_state(query, session)
         
-        # Initialize the state with existing memory
-        initial_state = {
-            "input": query,
-            "current_step": "start",
-            "final_answer": "",
-            "questions": "",
-            "tool_used": "",
-            "thoughts": "Starting to process the query...",
-            "memory": memory
-        }
-        
-        # Set memory in RAG tool
-        rag_tool.memory = memory
+        # Standalone questions may be answered from the semantic cache of this context
+        cacheable = not should_generate_questions(initial_state) and not depends_on_history(query)
         
-        print("Running workflow...")
-        # Run the workflow
-        final_state = app.invoke(initial_state)
-        
-        # Save to memory
-        final_state["memory"].save_context(
-            {"input": query},
-            {"output": final_state["final_answer"]}
-        )
+        # Other sessions' queries run concurrently
+        with session.lock:
+            # Evicted while this query waited for the lock
+            if not sessions.registered(session):
+                raise SessionNotLoaded(session_id)
+            started = time.perf_counter()
+            cached, query_vector = cached_answer(session, query, cacheable)
+            if cached is not None:
+                final_answer, similarity = cached
+                print(f"Answered from the semantic cache (similarity {similarity:.3f})")
+            else:
+                print("Running workflow...")
+                final_state = app.invoke(initial_state)
+                final_answer = final_state["final_answer"]
+                cache_answer(session, query, query_vector, final_state, started)
+            
+            # Save to memory
+            record_turn(session, query, final_answer)
         
         print("Workflow completed successfully!")
         
         # Return both thoughts and final answer
-        return f"{final_state['final_answer']}"
+        return f"{final_answer}"
+    except SessionNotLoaded:
+        raise
     except Exception as e:
         print(f"Error occurred during processing: {str(e)}")
         return f"Error processing query: {str(e)}"
 
-def initialize_agent_with_context(context_string: str, user_str: str = None, ai_str: str = None):
-    """Initialize or reinitialize the agent with new context and optional conversation history"""
-    global vectors, retrieval_chain, memory
+async def aprocess_query(query: str, session_id: str = DEFAULT_SESSION_ID):
+    """Async ``process_query``: LLM calls are awaited, so one event loop serves many chats at once"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise SessionNotLoaded(session_id)
+    try:
+        print(f"\nProcessing query for session {session_id}: '{query}'")
+        initial_state = new_state(query, session)
+        cacheable = not should_generate_questions(initial_state) and not depends_on_history(query)
+        
+        # Queries of the same session still run one at a time
+        async with session.async_lock():
+            if not sessions.registered(session):
+                raise SessionNotLoaded(session_id)
+            started = time.perf_counter()
+            # Embedding the query is CPU work; keep it off the event loop
+            cached, query_vector = await asyncio.to_thread(cached_answer, session, query, cacheable)
+            if cached is not None:
+                final_answer, similarity = cached
+                print(f"Answered from the semantic cache (similarity {similarity:.3f})")
+            else:
+                print("Running workflow...")
+                final_state = await app.ainvoke(initial_state)
+                final_answer = final_state["final_answer"]
+                cache_answer(session, query, query_vector, final_state, started)
+            
+            # Saving may summarize the memory with a blocking LLM call
+            await asyncio.to_thread(record_turn, session, query, final_answer)
+        
+        print("Workflow completed successfully!")
+        return f"{final_answer}"
+    except SessionNotLoaded:
+        raise
+    except Exception as e:
+        print(f"Error occurred during processing: {str(e)}")
+        return f"Error processing query: {str(e)}"
+
+def stream_questions(query: str, session_id: str = DEFAULT_SESSION_ID):
+    """Yield ``(source, question)`` for a "generate ... questions" query, one question at a time
+
+    Questions come from the question bank when it holds enough ("bank"), else
+    each is yielded as soon as it is parsed from the streamed LLM reply
+    ("generated"). The quiz is saved as the session's next turn, also when the
+    client disconnects part way. The session is only locked to pick the
+    questions' source and to save the turn, never while the client reads.
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        raise SessionNotLoaded(session_id)
+    question_type = detect_question_type(query.lower())
+    topic = question_topic(query)
+    with session.lock:
+        # Evicted while this request waited for the lock
+        if not sessions.registered(session):
+            raise SessionNotLoaded(session_id)
+        questions = question_bank.take(session.context_hash, question_type, 5, topic, session.context)
+        base_text = None if questions else question_base_text(session, topic)[0]
+
+    sent = []
+    try:
+        if questions:
+            for question in questions:
+                sent.append(question)
+                yield "bank", question
+        else:
+            for question in iter_question_data(base_text, f"Generate 5 questions about {topic}",
+                                               question_type, stream=True):
+                sent.append(question)
+                yield "generated", question
+    finally:
+        with session.lock:
+            if sent and sessions.registered(session):
+                record_turn(session, query, format_questions(sent, question_type))
+
+def initialize_agent_with_context(context_string: str, user_str: str = None, ai_str: str = None,
+                                  session_id: str = DEFAULT_SESSION_ID):
+    """Initialize or reinitialize a session with new context and optional conversation history"""
     try:
         print("Initializing agent with new context...")
-        vectors, retrieval_chain, memory = load_context(context_string, user_str, ai_str)
+        load_context(context_string, user_str, ai_str, session_id)
         print("Agent initialized successfully!")
         return True
     except Exception as e:
@@ -632,7 +1172,7 @@ if __name__ == "__main__":
                 # Print current memory state
                 print("\nCurrent Memory State:")
                 print("-" * 50)
-                print(memory.chat_memory.messages)
+                print(sessions.get(DEFAULT_SESSION_ID).memory.chat_memory.messages)
                 print("-" * 50)
             else:
                 print("No response received due to error")
@@ -667,7 +1207,7 @@ if __name__ == "__main__":
                 # Print current memory state
                 print("\nCurrent Memory State:")
                 print("-" * 50)
-                print(memory.chat_memory.messages)
+                print(sessions.get(DEFAULT_SESSION_ID).memory.chat_memory.messages)
                 print("-" * 50)
             else:
                 print("No response received due to error")
@@ -692,7 +1232,7 @@ if __name__ == "__main__":
             # Print final memory state
             print("\nFinal Memory State:")
             print("-" * 50)
-            print(memory.chat_memory.messages)
+            print(sessions.get(DEFAULT_SESSION_ID).memory.chat_memory.messages)
             print("-" * 50)
         else:
             print("No response received due to error")
@@ -0,0 +1,117 @@
+"""
+Semantic cache of chat answers per lecture context.
+
+Students of one course session ask the same questions in different words.
+Answers are stored with the embedding of their question under the hash of the
+context they were answered from; a new question on the same context whose
+embedding is within ``threshold`` cosine similarity of a stored one gets the
+stored answer without retrieval or an LLM call.
+
+Questions that refer to the conversation ("explain that again", "what did you
+say about...") are not looked up or stored, since their answer depends on the
+history rather than on the question alone. Neither are answers the agent
+built from the conversation (its general-knowledge route); only answers
+grounded in the context are stored.
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Questions that lean on earlier turns: explicit references to the conversation,
+# follow-ups ("and for bar plots?", "tell me more") and pronouns with nothing to
+# refer to in the question itself ("how does it work?", "why is that?")
+HISTORY_PATTERN = re.compile(
+    r"\b(you (say|said|mention|mentioned|wrote|told)|we (discussed|talked)|our (conversation|discussion|chat)|"
+    r"previous(ly)?|earlier|above|again|elaborate|tell me more|more (about|on|detail)|"
+    r"what else|the (last|previous) (answer|one|question))\b"
+    r"|^\s*(and|but|so|also|what about|how about)\b"
+    r"|^\s*\w+\s+(is|are|was|were|does|do|did|can|should)\s+(it|they|he|she)\b"
+    r"|\b(it|that|this|these|those|them|they)\s*[?.!]*\s*$",
+    re.IGNORECASE
+)
+
+
+def depends_on_history(question: str) -> bool:
+    """True if the question seems to refer to the conversation so far."""
+    return bool(HISTORY_PATTERN.search(question))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+class SemanticAnswerCache:
+    """Question embeddings and answers per context hash, with TTL and LRU eviction."""
+
+    def __init__(self, threshold=0.95, ttl=24 * 3600, max_entries=256, max_contexts=256):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries  # per context
+        self.max_contexts = max_contexts
+        # context hash -> OrderedDict of question -> (unit vector, answer, latency, created_at)
+        self.contexts = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'latency_saved': 0.0}
+
+    def bypass(self):
+        with self.lock:
+            self.stats['bypassed'] += 1
+
+    def lookup(self, context_hash, vector):
+        """Return ``(answer, similarity)`` of the closest fresh question, or None."""
+        query = _unit(vector)
+        now = time.time()
+        with self.lock:
+            entries = self.contexts.get(context_hash)
+            best = None
+            if entries:
+                for question in [q for q, entry in entries.items() if now - entry[3] >= self.ttl]:
+                    del entries[question]
+                if entries:
+                    questions = list(entries)
+                    similarities = np.stack([entries[q][0] for q in questions]) @ query
+                    position = int(np.argmax(similarities))
+                    if similarities[position] >= self.threshold:
+                        best = questions[position], float(similarities[position])
+            if best is None:
+                self.stats['misses'] += 1
+                return None
+            question, similarity = best
+            self.contexts.move_to_end(context_hash)
+            entries.move_to_end(question)
+            _, answer, latency, _ = entries[question]
+            self.stats['hits'] += 1
+            self.stats['latency_saved'] += latency
+            return answer, similarity
+
+    def store(self, context_hash, question, vector, answer, latency):
+        """Remember an answer and how long it took to produce."""
+        with self.lock:
+            entries = self.contexts.get(context_hash)
+            if entries is None:
+                entries = self.contexts[context_hash] = OrderedDict()
+            self.contexts.move_to_end(context_hash)
+            entries[question] = (_unit(vector), answer, latency, time.time())
+            entries.move_to_end(question)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            while len(self.contexts) > self.max_contexts:
+                self.contexts.popitem(last=False)
+            self.stats['stores'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            queries = lookups + self.stats['bypassed']
+            return dict(
+                self.stats,
+                hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+                bypass_rate=self.stats['bypassed'] / queries if queries else 0.0,
+                contexts=len(self.contexts),
+                entries=sum(len(entries) for entries in self.contexts.values()),
+                threshold=self.threshold
+            )
@@ -0,0 +1,61 @@
+"""
+Async HTTP front end of the chat service.
+
+/query is served by an async handler that awaits the agent graph, so a chat
+waiting on Groq holds no thread and one worker serves many chats at once.
+Every other route is the Flask app of flask-api.py, mounted unchanged.
+
+    python async_api.py
+    python serve.py chat_async
+"""
+import importlib
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse
+
+from agent import aprocess_query, SessionNotLoaded, DEFAULT_SESSION_ID
+from shared.llm_metrics import set_current_request
+
+flask_api = importlib.import_module("flask-api")
+
+app = FastAPI(title="Edutopia chat")
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+@app.post('/query')
+async def handle_query(request: Request):
+    """Handle incoming queries"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'query' not in data:
+        return JSONResponse({
+            "error": "Missing required field",
+            "message": "Please provide 'query' in the request body"
+        }, status_code=400)
+
+    set_current_request('handle_query', request.headers.get('X-Request-ID'))
+    try:
+        response = await aprocess_query(data['query'], str(data.get('session_id') or DEFAULT_SESSION_ID))
+        return JSONResponse({"response": response})
+    except SessionNotLoaded:
+        return JSONResponse({
+            "error": "Session not loaded",
+            "message": "Load the session's context with POST /context before querying it"
+        }, status_code=404)
+    except Exception as e:
+        return JSONResponse({
+            "error": "Internal server error",
+            "message": str(e)
+        }, status_code=500)
+
+
+# Everything else (context loading, history, metrics, question generation) stays on Flask
+app.mount('/', WSGIMiddleware(flask_api.app))
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000)
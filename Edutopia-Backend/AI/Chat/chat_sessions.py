@@ -0,0 +1,262 @@
+"""
+Per-session state of the chat agent.
+
+Each chat session (keyed by the Edutopia session ID) has its own lecture
+context, vector index, retriever and conversation memory, so students
+chatting at the same time no longer replace each other's context.
+
+Indexes are the heavy part. They are kept for the most recently used sessions
+within ``max_index_bytes`` and rebuilt from the session's context on its next
+query after eviction. Loading a new context into a session with a loaded index
+updates it in place (the index builder diffs chunks, so only new text is
+embedded); loading the same context again leaves it alone. The context and
+memory stay until the session itself is evicted (``max_sessions``); after that
+the client has to load the context again.
+"""
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SessionLock:
+    """A ``threading.Lock`` that coroutines can also wait for without a thread.
+
+    Releasing it, from a thread or a coroutine, wakes the coroutines waiting in
+    ``acquire_async`` on their own event loops.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()  # (event loop, future) of waiting coroutines
+        self._waiters_lock = threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self):
+        self._lock.release()
+        with self._waiters_lock:
+            waiters = list(self._waiters)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Registered before trying, so a release in between still wakes this coroutine
+            waiter = (loop, loop.create_future())
+            with self._waiters_lock:
+                self._waiters.add(waiter)
+            try:
+                if self._lock.acquire(blocking=False):
+                    return
+                await waiter[1]
+            finally:
+                with self._waiters_lock:
+                    self._waiters.discard(waiter)
+
+
+class SessionNotLoaded(KeyError):
+    """Raised for a session ID whose context has not been loaded (or was evicted)."""
+
+
+class SessionIndex:
+    """Vector store and hybrid retriever built for one session's context."""
+
+    def __init__(self, vectors, retriever, chunk_ids, nbytes, collection=None):
+        self.vectors = vectors
+        self.retriever = retriever
+        self.chunk_ids = chunk_ids  # content hashes, which are also the Chroma IDs
+        self.nbytes = nbytes
+        self.collection = collection  # the chromadb collection behind ``vectors``
+
+    def close(self):
+        try:
+            self.vectors.delete_collection()
+        except Exception as e:
+            print(f"Error clearing vector store: {str(e)}")
+
+
+class ChatSession:
+    """Context, memory and (when loaded) index of one chat session."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.context = None
+        self.context_hash = None
+        self.memory = None
+        self.turns = 0  # conversation turns the memory has seen
+        self.index = None
+        self.last_used = time.time()
+        # Queries of one session run one at a time; the memory is not thread-safe
+        self.lock = SessionLock()
+
+    @asynccontextmanager
+    async def async_lock(self):
+        """Hold ``lock`` from a coroutine, waiting on the event loop while another query has it."""
+        await self.lock.acquire_async()
+        try:
+            yield
+        finally:
+            self.lock.release()
+
+
+class SessionRegistry:
+    """LRU registry of chat sessions with a memory bound on their indexes."""
+
+    def __init__(self, build_index, max_sessions=1000, max_index_bytes=512 * 1024 * 1024):
+        # (context string, previous SessionIndex or None) -> SessionIndex
+        self.build_index = build_index
+        self.max_sessions = max_sessions
+        self.max_index_bytes = max_index_bytes
+        self.sessions = OrderedDict()
+        self.index_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            'index_hits': 0, 'index_builds': 0, 'index_updates': 0, 'unchanged_loads': 0,
+            'index_evictions': 0, 'session_evictions': 0
+        }
+
+    def put(self, session_id, context, memory, turns=0):
+        """Create or update a session; a loaded index is updated in place for a new context."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = ChatSession(session_id)
+            self.sessions.move_to_end(session_id)
+            evicted = []
+            while len(self.sessions) > self.max_sessions:
+                evicted.append(self.sessions.popitem(last=False)[1])
+                self.stats['session_evictions'] += 1
+
+        with session.lock:
+            if session.context == context:
+                with self.lock:
+                    self.stats['unchanged_loads'] += 1
+            else:
+                if session.index is not None:
+                    self._update(session, context)
+                session.context_hash = hashlib.sha256(context.encode('utf-8')).hexdigest()
+            session.context = context
+            session.memory = memory
+            session.turns = turns
+            session.last_used = time.time()
+
+        for victim in evicted:
+            with victim.lock:
+                self._release(victim)
+        return session
+
+    def get(self, session_id):
+        """The session, marked as recently used, or None if it is not loaded."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                session.last_used = time.time()
+            return session
+
+    def _update(self, session, context):
+        """Bring the session's index to a new context. Call with ``session.lock`` held."""
+        previous = session.index
+        started = time.perf_counter()
+        try:
+            index = self.build_index(context, previous)
+        except Exception:
+            # The collection may be half updated; rebuild it from scratch on next use
+            self._release(session)
+            raise
+        session.index = index
+        with self.lock:
+            self.index_bytes += index.nbytes - previous.nbytes
+            self.stats['index_updates'] += 1
+        print(f"Updated index for session {session.session_id} in {time.perf_counter() - started:.2f}s")
+        self._evict_indexes(session)
+
+    def registered(self, session):
+        """Whether the session is still in the registry (it is not once evicted)."""
+        with self.lock:
+            return self.sessions.get(session.session_id) is session
+
+    def ensure_index(self, session):
+        """Return the session's index, rebuilding it if it was evicted. Call with ``session.lock`` held.
+
+        Raises SessionNotLoaded for a session evicted since it was looked up;
+        an index built for it would never be released. A session evicted
+        during the build is released by ``put`` once the lock is free.
+        """
+        if session.index is not None:
+            with self.lock:
+                self.stats['index_hits'] += 1
+            return session.index
+        if not self.registered(session):
+            raise SessionNotLoaded(session.session_id)
+
+        started = time.perf_counter()
+        index = self.build_index(session.context, None)
+        session.index = index
+        print(f"Built index for session {session.session_id} in {time.perf_counter() - started:.2f}s")
+
+        with self.lock:
+            self.index_bytes += index.nbytes
+            self.stats['index_builds'] += 1
+        self._evict_indexes(session)
+        return index
+
+    def _evict_indexes(self, keep):
+        """Drop the least recently used indexes other than ``keep``'s until within the memory bound."""
+        with self.lock:
+            candidates = [
+                other for other in self.sessions.values()
+                if other is not keep and other.index is not None
+            ]
+        # Sessions that are answering a query are skipped
+        for other in candidates:
+            if self.index_bytes <= self.max_index_bytes:
+                break
+            if other.lock.acquire(blocking=False):
+                try:
+                    if self._release(other):
+                        with self.lock:
+                            self.stats['index_evictions'] += 1
+                finally:
+                    other.lock.release()
+
+    def _release(self, session):
+        """Drop the session's index. Call with ``session.lock`` held."""
+        index, session.index = session.index, None
+        if index is None:
+            return False
+        with self.lock:
+            self.index_bytes -= index.nbytes
+        index.close()
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'sessions': len(self.sessions),
+                'loaded_indexes': sum(1 for session in self.sessions.values() if session.index is not None),
+                'index_bytes': self.index_bytes,
+                'max_index_bytes': self.max_index_bytes,
+                'max_sessions': self.max_sessions,
+                **self.stats
+            }
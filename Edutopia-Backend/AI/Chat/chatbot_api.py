@@ -3,16 +3,13 @@ from flask_cors import CORS
 import os
 import json
 import traceback
-from chatbot import load_context, process_query
+from agent import load_context, load_history, process_query, SessionNotLoaded, DEFAULT_SESSION_ID
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Global variables to store context
+# The last loaded context is also saved here
 context_file = "text.txt"
-vectors = None
-retrieval_chain = None
-memory = None
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -22,8 +19,6 @@ def health_check():
 @app.route('/api/load_context', methods=['POST'])
 def api_load_context():
     """Load context from text content provided in the request"""
-    global vectors, retrieval_chain, memory
-    
     try:
         data = request.json
         if not data or 'context' not in data:
@@ -37,13 +32,14 @@ def api_load_context():
         with open(context_file, "w", encoding="utf-8") as f:
             f.write(context_content)
         
-        # Load context using the function from chatbot.py
-        vectors, retrieval_chain, memory = load_context(context_file, user_history, ai_history)
+        # Unchanged chunks of a reloaded context are not embedded again
+        session = load_context(context_content, user_history, ai_history,
+                               str(data.get('session_id') or DEFAULT_SESSION_ID))
         
         return jsonify({
             "status": "success", 
             "message": "Context loaded successfully",
-            "chunks": len(vectors.get()) if vectors else 0
+            "chunks": len(session.index.chunk_ids) if session.index else 0
         })
         
     except Exception as e:
@@ -61,8 +57,8 @@ def api_chat():
         
         user_message = data.get('message', '')
         
-        # Process the query using the function from chatbot.py
-        response = process_query(user_message)
+        # Process the query using the function from agent.py
+        response = process_query(user_message, str(data.get('session_id') or DEFAULT_SESSION_ID))
         
         # Extract just the final answer part
         if "Final Answer:" in response:
@@ -102,8 +98,8 @@ def api_generate_questions():
         else:
             query = f"generate questions about {text}"
         
-        # Process the query using the function from chatbot.py
-        response = process_query(query)
+        # Process the query using the function from agent.py
+        response = process_query(query, str(data.get('session_id') or DEFAULT_SESSION_ID))
         
         # Extract just the final answer part
         if "Final Answer:" in response:
@@ -133,28 +129,34 @@ def api_save_conversation():
         user_messages = data.get('user_messages', [])
         ai_messages = data.get('ai_messages', [])
         
-        # Convert lists to comma-separated strings
-        user_str = ",".join(user_messages)
-        ai_str = ",".join(ai_messages)
+        # Pair the lists as structured messages, so commas inside messages survive
+        messages = []
+        for user_message, ai_message in zip(user_messages, ai_messages):
+            messages.append({"role": "user", "content": user_message})
+            messages.append({"role": "assistant", "content": ai_message})
         
-        # Reload context with the conversation history
-        global vectors, retrieval_chain, memory
-        vectors, retrieval_chain, memory = load_context(context_file, user_str, ai_str)
+        # Only the memory changes; the context and its index stay as they are
+        load_history(session_id=str(data.get('session_id') or DEFAULT_SESSION_ID), messages=messages)
         
         return jsonify({
             "status": "success",
             "message": "Conversation saved successfully"
         })
         
+    except SessionNotLoaded:
+        return jsonify({"status": "error", "message": "Session not loaded"}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         error_trace = traceback.format_exc()
         print(f"Error saving conversation: {str(e)}\n{error_trace}")
         return jsonify({"status": "error", "message": str(e), "trace": error_trace}), 500
 
 if __name__ == '__main__':
-    # Initialize with empty context
+    # Initialize with the saved context
     try:
-        vectors, retrieval_chain, memory = load_context(context_file)
+        with open(context_file, encoding="utf-8") as f:
+            load_context(f.read())
         print("Initial context loaded successfully")
     except Exception as e:
         print(f"Error loading initial context: {str(e)}")
@@ -1,5 +1,13 @@
-from flask import Flask, request, jsonify
-from agent import process_query, load_context
+from flask import Flask, request, jsonify, Response, stream_with_context
+import time
+import traceback
+from agent import (
+    process_query, stream_questions, load_context, load_history, append_turn, get_history, sessions, embeddings,
+    answer_cache, question_bank, question_stats, routing_stats, routing_lock,
+    SessionNotLoaded, DEFAULT_SESSION_ID
+)
+from shared.llm_metrics import metrics as llm_metrics
+from shared.sse import sse_event, SSE_HEADERS
 from flask_cors import CORS
 
 app = Flask(__name__)
@@ -21,13 +29,21 @@ def handle_load_context():
         
 
         loaded_context = data['context']
-        user_str = data['user_str']
-        ai_str = data['ai_str'] 
-        response = load_context(loaded_context,user_str, ai_str)
+        user_str = data.get('user_str')
+        ai_str = data.get('ai_str')
+        session_id = str(data.get('session_id') or DEFAULT_SESSION_ID)
+        # 'messages' (a JSON message array) replaces the comma-joined strings
+        session = load_context(loaded_context, user_str, ai_str, session_id, data.get('messages'))
         return jsonify({
-            "message": "Context loaded successfully"
+            "message": "Context loaded successfully",
+            "session_id": session.session_id
         }), 200
         
+    except ValueError as e:
+        return jsonify({
+            "error": "Invalid request",
+            "message": str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             "error": "Internal server error",
@@ -48,14 +64,86 @@ def handle_query():
             }), 400
             
         query = data['query']
+        session_id = str(data.get('session_id') or DEFAULT_SESSION_ID)
         
-        # Process the query using the agent with loaded context
-        response = process_query(query)
+        # Process the query using the session's loaded context
+        response = process_query(query, session_id)
         
         return jsonify({
             "response": response
         }), 200
         
+    except SessionNotLoaded:
+        return jsonify({
+            "error": "Session not loaded",
+            "message": "Load the session's context with POST /context before querying it"
+        }), 404
+    except Exception as e:
+        return jsonify({
+            "error": "Internal server error",
+            "message": str(e)
+        }), 500
+
+@app.route('/history/<session_id>', methods=['GET'])
+def handle_get_history(session_id):
+    """A page of the session's conversation as a JSON message array"""
+    offset = request.args.get('offset', default=0, type=int)
+    limit = request.args.get('limit', default=None, type=int)
+    return jsonify(get_history(session_id, max(offset, 0), limit)), 200
+
+@app.route('/history', methods=['POST'])
+def handle_import_history():
+    """Replace a loaded session's conversation with a JSON message array"""
+    try:
+        data = request.get_json()
+        if not data or 'messages' not in data:
+            return jsonify({
+                "error": "Missing required field",
+                "message": "Please provide 'messages' in the request body"
+            }), 400
+        session_id = str(data.get('session_id') or DEFAULT_SESSION_ID)
+        session = load_history(session_id=session_id, messages=data['messages'])
+        return jsonify({
+            "session_id": session_id,
+            "turns": session.turns
+        }), 200
+    except SessionNotLoaded:
+        return jsonify({
+            "error": "Session not loaded",
+            "message": "Load the session's context with POST /context first"
+        }), 404
+    except ValueError as e:
+        return jsonify({
+            "error": "Invalid request",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "error": "Internal server error",
+            "message": str(e)
+        }), 500
+
+@app.route('/history/append', methods=['POST'])
+def handle_append_history():
+    """Add one turn to a loaded session's conversation"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('user'), str) or not isinstance(data.get('assistant'), str):
+            return jsonify({
+                "error": "Missing required field",
+                "message": "Please provide 'user' and 'assistant' messages in the request body"
+            }), 400
+        session_id = str(data.get('session_id') or DEFAULT_SESSION_ID)
+        turn = append_turn(data['user'], data['assistant'], session_id)
+        return jsonify({
+            "session_id": session_id,
+            "turn": turn
+        }), 200
+    except SessionNotLoaded:
+        return jsonify({
+            "error": "Session not loaded",
+            "message": "Load the session's context with POST /context first"
+        }), 404
     except Exception as e:
         return jsonify({
             "error": "Internal server error",
@@ -70,6 +158,44 @@ def health_check():
         "message": "API is running"
     }), 200
 
+@app.route('/metrics/sessions', methods=['GET'])
+def session_usage():
+    """Loaded sessions, index memory, evictions, cache hit rates and RAG routing"""
+    with routing_lock:
+        routing = dict(routing_stats)
+    return jsonify(dict(
+        sessions.snapshot(),
+        query_embedding_cache=embeddings.snapshot(),
+        answer_cache=answer_cache.snapshot(),
+        question_bank=question_bank.snapshot(),
+        question_parsing=question_stats.snapshot(),
+        routing=routing
+    )), 200
+
+@app.route('/question_bank/<session_id>', methods=['GET'])
+def question_bank_status(session_id):
+    """Questions ready per section and type for the session's context"""
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({
+            "error": "Session not loaded",
+            "message": "Load the session's context with POST /context first"
+        }), 404
+    return jsonify(question_bank.snapshot(session.context_hash)), 200
+
+@app.route('/metrics/llm', methods=['GET'])
+def llm_usage():
+    """LLM tokens and latency per call site, endpoint and request"""
+    return jsonify(llm_metrics.snapshot()), 200
+
+def question_query(text, question_type):
+    """Format the query for question generation"""
+    if question_type == 'yes_no':
+        return f"generate y/n questions about {text}"
+    if question_type == 'true_false':
+        return f"generate t/f questions about {text}"
+    return f"generate questions about {text}"
+
 @app.route('/api/generate_questions', methods=['POST'])
 def api_generate_questions():
     """Generate questions based on provided text"""
@@ -78,21 +204,10 @@ def api_generate_questions():
         if not data or 'text' not in data:
             return jsonify({"status": "error", "message": "Missing text in request body"}), 400
         
-        text = data.get('text', '')
-        question_type = data.get('type', 'all')  # Default to all types
-        
-        # Format the query for question generation
-        if question_type == 'mcq':
-            query = f"generate questions about {text}"
-        elif question_type == 'yes_no':
-            query = f"generate y/n questions about {text}"
-        elif question_type == 'true_false':
-            query = f"generate t/f questions about {text}"
-        else:
-            query = f"generate questions about {text}"
+        query = question_query(data.get('text', ''), data.get('type', 'all'))  # Default to all types
         
         # Process the query using the function from chatbot.py
-        response = process_query(query)
+        response = process_query(query, str(data.get('session_id') or DEFAULT_SESSION_ID))
         
         # Extract just the final answer part
         if "Final Answer:" in response:
@@ -106,10 +221,46 @@ def api_generate_questions():
             "questions": questions
         })
         
+    except SessionNotLoaded:
+        return jsonify({"status": "error", "message": "Session not loaded"}), 404
     except Exception as e:
         error_trace = traceback.format_exc()
         print(f"Error generating questions: {str(e)}\n{error_trace}")
         return jsonify({"status": "error", "message": str(e), "trace": error_trace}), 500
 
+@app.route('/api/generate_questions/stream', methods=['POST'])
+def api_generate_questions_stream():
+    """Stream generated questions as server-sent events, one 'question' event per question"""
+    data = request.json
+    if not data or 'text' not in data:
+        return jsonify({"status": "error", "message": "Missing text in request body"}), 400
+    session_id = str(data.get('session_id') or DEFAULT_SESSION_ID)
+    if sessions.get(session_id) is None:
+        return jsonify({"status": "error", "message": "Session not loaded"}), 404
+    query = question_query(data.get('text', ''), data.get('type', 'all'))
+
+    def generate():
+        start = time.perf_counter()
+        count = 0
+        source = None
+        try:
+            for source, question in stream_questions(query, session_id):
+                count += 1
+                if count == 1:
+                    print(f"First question after {time.perf_counter() - start:.2f}s ({source})")
+                yield sse_event('question', {'index': count, 'source': source, 'question': question})
+            yield sse_event('done', {
+                'count': count,
+                'source': source,
+                'seconds': round(time.perf_counter() - start, 3)
+            })
+        except SessionNotLoaded:
+            yield sse_event('error', {'error': 'Session not loaded'})
+        except Exception as e:
+            print(f"Error streaming questions: {str(e)}\n{traceback.format_exc()}")
+            yield sse_event('error', {'error': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Durable conversation memory for chat sessions.
+
+A session's ConversationSummaryBufferMemory is saved as its running summary and
+recent message buffer after every turn. Restoring a session is then one local
+read, instead of replaying the whole history through ``save_context``, which
+calls the LLM to summarize once the buffer passes its token limit.
+
+Next to it every session has an append-only log of its turns (user message and
+answer), so clients no longer need to keep and resend the whole history.
+"""
+import json
+import time
+import sqlite3
+import threading
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+
+class MemoryStore:
+    """Summary, message buffer and turn log per session in a SQLite file."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            # WAL makes the write after every turn cheaper
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS session_memory ("
+                " session_id TEXT PRIMARY KEY,"
+                " summary TEXT NOT NULL,"
+                " messages TEXT NOT NULL,"
+                " turns INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS session_turns ("
+                " session_id TEXT NOT NULL,"
+                " turn INTEGER NOT NULL,"
+                " user_message TEXT NOT NULL,"
+                " ai_message TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (session_id, turn))"
+            )
+
+    def load(self, session_id):
+        """Return ``(summary, messages, turns)`` saved for a session, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT summary, messages, turns FROM session_memory WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        summary, messages, turns = row
+        return summary, messages_from_dict(json.loads(messages)), turns
+
+    def save(self, session_id, memory, turns):
+        """Save a ConversationSummaryBufferMemory and the number of turns it has seen."""
+        messages = json.dumps(messages_to_dict(memory.chat_memory.messages))
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO session_memory (session_id, summary, messages, turns, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (session_id, memory.moving_summary_buffer, messages, turns, time.time())
+            )
+
+    def append_turn(self, session_id, user_message, ai_message):
+        """Add a turn to the session's log and return its number (from 1)."""
+        with self.lock, self.connection:
+            (last,) = self.connection.execute(
+                "SELECT COALESCE(MAX(turn), 0) FROM session_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT INTO session_turns (session_id, turn, user_message, ai_message, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (session_id, last + 1, user_message, ai_message, time.time())
+            )
+        return last + 1
+
+    def replace_turns(self, session_id, turns):
+        """Make the log hold exactly ``turns`` (pairs); return how many leading turns were already logged."""
+        with self.lock, self.connection:
+            logged = self.connection.execute(
+                "SELECT user_message, ai_message FROM session_turns WHERE session_id = ? ORDER BY turn",
+                (session_id,)
+            ).fetchall()
+            kept = 0
+            while kept < min(len(logged), len(turns)) and tuple(logged[kept]) == tuple(turns[kept]):
+                kept += 1
+            self.connection.execute(
+                "DELETE FROM session_turns WHERE session_id = ? AND turn > ?", (session_id, kept)
+            )
+            now = time.time()
+            self.connection.executemany(
+                "INSERT INTO session_turns (session_id, turn, user_message, ai_message, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(session_id, number, user_message, ai_message, now)
+                 for number, (user_message, ai_message) in enumerate(turns[kept:], kept + 1)]
+            )
+        return kept
+
+    def turns(self, session_id, offset=0, limit=None):
+        """Logged ``(user message, answer)`` pairs of a session, oldest first."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT user_message, ai_message FROM session_turns WHERE session_id = ?"
+                " ORDER BY turn LIMIT ? OFFSET ?",
+                (session_id, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def count_turns(self, session_id):
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM session_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return count
@@ -0,0 +1,167 @@
+"""
+Pre-generated quiz questions per lecture context.
+
+On the first quiz request for a context (or when it is loaded, with
+QUESTION_BANK_PRELOAD=1), it is cut into a few sections and a background pool
+generates a batch of questions for every section and question type. Later quiz
+requests take questions from the bank instantly; buckets that run low are
+refilled in the background. Banks are kept per context hash, so every session
+on the same lecture shares one.
+"""
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from shared.hybrid_retrieval import BM25Index, tokenize
+
+QUESTION_TYPES = ('mcq', 'yes_no', 'true_false')
+
+# Words of a quiz request that say what kind of quiz, not what it is about
+REQUEST_WORDS = {'mcq', 'mcqs', 'yes', 'no', 'true', 'false', 'quiz', 'some', 'few', 'me', 'on', 'of', 'the', 'a'}
+
+
+def topic_terms(topic):
+    """Search terms of a requested topic, without question-type markers and counts."""
+    return [
+        term for term in tokenize(topic or '')
+        if len(term) > 1 and not term.isdigit() and term not in REQUEST_WORDS
+    ]
+
+
+class ContextBank:
+    """Sections of one context and their questions by ``(section, type)``."""
+
+    def __init__(self, sections):
+        self.sections = sections
+        self.keyword_index = BM25Index(sections)
+        self.buckets = {
+            (section, question_type): deque()
+            for section in range(len(sections)) for question_type in QUESTION_TYPES
+        }
+
+
+class QuestionBank:
+    """Background-filled question buckets for the most recently loaded contexts."""
+
+    def __init__(self, generate, max_sections=4, batch_size=5, low_water=2, max_contexts=64, max_workers=2):
+        # (section text, question type, count) -> list of question dicts
+        self.generate = generate
+        self.max_sections = max_sections
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.max_contexts = max_contexts
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='question-bank')
+        self.banks = OrderedDict()  # context hash -> ContextBank
+        self.filling = set()  # (context hash, section, type) being generated
+        self.lock = threading.Lock()
+        self.stats = {'served': 0, 'short': 0, 'off_topic': 0, 'generated': 0, 'fills': 0, 'errors': 0}
+
+    def split_sections(self, context):
+        """Cut a context into at most ``max_sections`` contiguous sections."""
+        size = max(2000, -(-len(context) // self.max_sections))
+        splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=0)
+        return [doc.page_content for doc in splitter.create_documents([context])][:self.max_sections]
+
+    def prepare(self, context_hash, context):
+        """Start filling the bank of a context, unless it already has one."""
+        if self.max_sections <= 0:
+            return
+        with self.lock:
+            if context_hash in self.banks:
+                self.banks.move_to_end(context_hash)
+                return
+        bank = ContextBank(self.split_sections(context))
+        with self.lock:
+            if context_hash in self.banks:
+                return
+            self.banks[context_hash] = bank
+            while len(self.banks) > self.max_contexts:
+                self.banks.popitem(last=False)
+        for section, question_type in bank.buckets:
+            self._refill(context_hash, section, question_type)
+
+    def _refill(self, context_hash, section, question_type):
+        key = (context_hash, section, question_type)
+        with self.lock:
+            if key in self.filling:
+                return
+            self.filling.add(key)
+        self.executor.submit(self._fill, key)
+
+    def _fill(self, key):
+        context_hash, section, question_type = key
+        try:
+            with self.lock:
+                bank = self.banks.get(context_hash)
+            if bank is None:
+                return
+            questions = self.generate(bank.sections[section], question_type, self.batch_size)
+            with self.lock:
+                for question in questions:
+                    bank.buckets[(section, question_type)].append(dict(question, section=section))
+                self.stats['fills'] += 1
+                self.stats['generated'] += len(questions)
+        except Exception as e:
+            print(f"Error filling question bank ({question_type}, section {section}): {str(e)}")
+            with self.lock:
+                self.stats['errors'] += 1
+        finally:
+            with self.lock:
+                self.filling.discard(key)
+
+    def take(self, context_hash, question_type, count, topic=None, context=None):
+        """Take ``count`` questions of a type from the sections that match ``topic``.
+
+        Without a topic every section is used. Returns an empty list when the
+        topic matches no section (the quiz is then generated about the topic
+        itself) or the matching sections do not hold enough yet; drained
+        buckets are refilled in the background either way. Given ``context``,
+        a context without a bank gets one started.
+        """
+        if context is not None:
+            self.prepare(context_hash, context)
+        with self.lock:
+            bank = self.banks.get(context_hash)
+            if bank is None:
+                return []
+            self.banks.move_to_end(context_hash)
+
+            def available(sections):
+                return sum(len(bank.buckets[(section, question_type)]) for section in sections)
+
+            sections = list(range(len(bank.sections)))
+            terms = topic_terms(topic)
+            if terms:
+                sections = [section for section, _ in bank.keyword_index.search(' '.join(terms), k=len(sections))]
+
+            questions = []
+            if not sections:
+                self.stats['off_topic'] += 1
+            elif available(sections) >= count:
+                # Round-robin over the sections so a quiz covers all of them
+                while len(questions) < count:
+                    for section in sections:
+                        bucket = bank.buckets[(section, question_type)]
+                        if bucket and len(questions) < count:
+                            questions.append(bucket.popleft())
+                self.stats['served'] += len(questions)
+            else:
+                self.stats['short'] += 1
+            low = [key for key, bucket in bank.buckets.items() if len(bucket) < self.low_water]
+
+        for section, bucket_type in low:
+            self._refill(context_hash, section, bucket_type)
+        return questions
+
+    def snapshot(self, context_hash=None):
+        with self.lock:
+            snapshot = dict(self.stats, contexts=len(self.banks), filling=len(self.filling))
+            bank = self.banks.get(context_hash) if context_hash else None
+            if bank is not None:
+                snapshot['buckets'] = [
+                    {'section': section, 'type': question_type, 'questions': len(bucket)}
+                    for (section, question_type), bucket in bank.buckets.items()
+                ]
+            return snapshot
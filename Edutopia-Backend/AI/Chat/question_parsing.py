@@ -0,0 +1,187 @@
+"""
+Incremental parsing and validation of generated quiz questions.
+
+The question generator asks the LLM for ``{"questions": [...]}``. Instead of
+``json.loads`` on the whole reply (which throws every question away when one
+brace is missing), the reply is scanned as it arrives and each question object
+is parsed as soon as its closing brace does. So a streamed reply yields its
+first question long before the last one is written, and a truncated or
+malformed reply still gives the questions that were complete.
+
+Every question is then checked against the schema of its type and small,
+predictable slips are repaired in place (an MCQ answer given as a bare letter,
+options as an object, booleans for yes/no answers). Questions that cannot be
+repaired are dropped; the caller only asks the LLM for the missing ones.
+"""
+import re
+import json
+import threading
+
+# Shape of one question per type; the answer of an MCQ is one of its options
+QUESTION_SCHEMAS = {
+    'mcq': {'question': str, 'options': list, 'answer': str},
+    'yes_no': {'question': str, 'answer': str},
+    'true_false': {'question': str, 'answer': str},
+}
+
+MCQ_LETTERS = 'ABCD'
+
+OPTION_PREFIX = re.compile(r'^\s*\(?([A-Da-d])[\).:\-]\s*')
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class QuestionStreamParser:
+    """Yields each object of a JSON array as soon as it is complete.
+
+    Feed the reply in pieces of any size; ``feed`` returns the objects that
+    were completed by that piece. Text outside the array (a preamble, code
+    fences, ``//`` comments copied from the prompt's example) is skipped.
+    """
+
+    def __init__(self):
+        self.stack = []  # open '{' and '[' outside strings
+        self.in_string = False
+        self.escaped = False
+        self.in_comment = False
+        self.slash = False  # previous character was a '/' outside strings
+        self.capture = None  # characters of the object being read
+        self.capture_depth = 0
+        self.malformed = 0  # complete objects that were not valid JSON
+
+    def feed(self, text):
+        objects = []
+        for char in text:
+            if self.in_comment:
+                if char == '\n':
+                    self.in_comment = False
+                continue
+            if self.in_string:
+                if self.capture is not None:
+                    self.capture.append(char)
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '/':
+                if self.slash:
+                    self.slash = False
+                    self.in_comment = True
+                else:
+                    self.slash = True
+                continue
+            if self.slash:
+                # A lone '/' outside a string is not JSON; drop it
+                self.slash = False
+
+            if char == '{' and self.capture is None and self.stack and self.stack[-1] == '[':
+                self.capture = []
+                self.capture_depth = len(self.stack) + 1
+            if self.capture is not None:
+                self.capture.append(char)
+
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.stack.append(char)
+            elif char in '}]' and self.stack:
+                self.stack.pop()
+                if char == '}' and self.capture is not None and len(self.stack) < self.capture_depth:
+                    parsed = self._load(''.join(self.capture))
+                    self.capture = None
+                    if parsed is None:
+                        self.malformed += 1
+                    else:
+                        objects.append(parsed)
+        return objects
+
+    @staticmethod
+    def _load(text):
+        for candidate in (text, TRAILING_COMMA.sub(r'\1', text)):
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        return None
+
+
+def _letter_option(letter, text):
+    return f"{letter}) {OPTION_PREFIX.sub('', text, count=1).strip()}"
+
+
+def _yes_no(value, yes, no):
+    if isinstance(value, bool):
+        return yes if value else no
+    return value
+
+
+def validate_question(question, question_type):
+    """Return the question in its type's schema, repairing small slips, or None."""
+    if not isinstance(question, dict):
+        return None
+    repaired = {}
+    text = question.get('question')
+    answer = question.get('answer')
+    if question_type == 'yes_no':
+        answer = _yes_no(answer, 'Yes', 'No')
+    elif question_type == 'true_false':
+        answer = _yes_no(answer, 'True', 'False')
+    if not isinstance(text, str) or not text.strip() or not isinstance(answer, str) or not answer.strip():
+        return None
+    repaired['question'] = text.strip()
+
+    if question_type == 'mcq':
+        options = question.get('options')
+        if isinstance(options, dict):
+            options = [f"{key}) {value}" for key, value in options.items()]
+        if not isinstance(options, list) or len(options) != len(MCQ_LETTERS):
+            return None
+        if not all(isinstance(option, str) and option.strip() for option in options):
+            return None
+        options = [_letter_option(letter, option) for letter, option in zip(MCQ_LETTERS, options)]
+
+        # The answer may be the option, its letter or its text without the letter
+        answer = answer.strip()
+        match = OPTION_PREFIX.match(answer)
+        letter = match.group(1).upper() if match else None
+        if letter is None and answer.upper() in tuple(MCQ_LETTERS):
+            letter = answer.upper()
+        if letter is None:
+            bare = answer.lower()
+            letter = next((option[0] for option in options if option[3:].strip().lower() == bare), None)
+        if letter is None:
+            return None
+        repaired['options'] = options
+        repaired['answer'] = options[MCQ_LETTERS.index(letter)]
+    else:
+        repaired['answer'] = answer.strip()
+
+    if any(not isinstance(repaired[key], kind) for key, kind in QUESTION_SCHEMAS[question_type].items()):
+        return None
+    return repaired
+
+
+class QuestionParseStats:
+    """How many LLM replies and questions parsed, needed repair or were dropped."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {
+            'responses': 0, 'failed_responses': 0, 'questions': 0, 'repaired': 0,
+            'dropped': 0, 'malformed': 0, 'repair_calls': 0
+        }
+
+    def record(self, **counts):
+        with self.lock:
+            for key, count in counts.items():
+                self.stats[key] += count
+
+    def snapshot(self):
+        with self.lock:
+            responses = self.stats['responses']
+            return dict(
+                self.stats,
+                failed_parse_rate=self.stats['failed_responses'] / responses if responses else 0.0
+            )
@@ -20,7 +20,6 @@ import os
 from pathlib import Path
 import docx
 from pptx import Presentation
-import win32com.client
 import tempfile
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
@@ -165,6 +164,9 @@ def process_docx(docx_path, output_dir=None):
 def convert_pptx_to_images(pptx_path):
     """Convert PowerPoint slides to images using PowerPoint COM automation."""
     try:
+        # Windows only, so imported when a presentation is converted rather than at startup
+        import win32com.client
+
         # Create temporary directory for images
         temp_dir = tempfile.mkdtemp()
         
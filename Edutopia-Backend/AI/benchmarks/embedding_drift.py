@@ -0,0 +1,78 @@
+"""
+Check the quantized ONNX embeddings against the fp32 sentence-transformer.
+
+Embeds the same chunks with both backends and reports the cosine similarity
+between each pair of vectors (drift), whether retrieval rankings agree, and
+chunk embedding throughput of each backend.
+
+    python benchmarks/embedding_drift.py --text Chat/text.txt --min-cosine 0.98
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_huggingface import HuggingFaceEmbeddings
+from shared.onnx_embeddings import OnnxEmbeddings
+
+QUERIES = [
+    "What is a bar plot used for?",
+    "How do I compare distributions between groups?",
+    "How are missing values handled?",
+]
+
+
+def unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def throughput(embeddings, texts):
+    started = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    return len(texts) / (time.perf_counter() - started), vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--text', default=str(Path(__file__).resolve().parent.parent / 'Chat' / 'text.txt'))
+    parser.add_argument('--min-cosine', type=float, default=0.98, help="fail if any chunk drifts below this")
+    parser.add_argument('--k', type=int, default=4)
+    args = parser.parse_args()
+
+    text = Path(args.text).read_text(encoding='utf-8')
+    chunks = [doc.page_content for doc in
+              RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).create_documents([text])]
+    print(f"{len(chunks)} chunks from {args.text}")
+
+    reference = HuggingFaceEmbeddings()
+    quantized = OnnxEmbeddings()
+    reference.embed_query("warm up")
+    quantized.embed_query("warm up")
+
+    fp32_rate, fp32_vectors = throughput(reference, chunks)
+    int8_rate, int8_vectors = throughput(quantized, chunks)
+    print(f"Throughput: fp32 {fp32_rate:.1f} chunks/s, int8 onnx {int8_rate:.1f} chunks/s "
+          f"({int8_rate / fp32_rate:.1f}x)")
+
+    fp32_unit, int8_unit = unit(fp32_vectors), unit(int8_vectors)
+    drift = (fp32_unit * int8_unit).sum(axis=1)
+    print(f"Cosine fp32 vs int8: min {drift.min():.4f} mean {drift.mean():.4f}")
+
+    k = min(args.k, len(chunks))
+    for query in QUERIES:
+        fp32_top = np.argsort(-(fp32_unit @ unit([reference.embed_query(query)])[0]))[:k]
+        int8_top = np.argsort(-(int8_unit @ unit([quantized.embed_query(query)])[0]))[:k]
+        print(f"{query!r}: top-{k} overlap {len(set(fp32_top) & set(int8_top))}/{k}")
+
+    if drift.min() < args.min_cosine:
+        print(f"FAIL: drift below {args.min_cosine}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Check the LLM scheduler against the fake Groq server.
+
+Floods the batch lane with analysis-sized calls, then sends a few interactive
+chat calls, and reports per-lane latency and how many 429s were hit.
+Interactive calls should wait for at most one admission slot, not the batch
+backlog.
+
+    python benchmarks/llm_scheduler.py --batch 30 --interactive 5 --rpm 20
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared import fake_llm_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch', type=int, default=30)
+    parser.add_argument('--interactive', type=int, default=5)
+    parser.add_argument('--rpm', type=int, default=20, help="limit enforced by the fake server")
+    parser.add_argument('--scheduler-rpm', type=int, default=None, help="limit budgeted by the scheduler (defaults to --rpm)")
+    parser.add_argument('--latency-ms', type=int, default=300)
+    parser.add_argument('--port', type=int, default=5005)
+    args = parser.parse_args()
+
+    os.environ['GROQ_API_BASE'] = fake_llm_server.start_in_thread(args.port, args.rpm, args.latency_ms)
+    os.environ.setdefault('GROQ_API_KEY', 'fake')
+    os.environ['GROQ_REQUESTS_PER_MINUTE'] = str(args.scheduler_rpm or args.rpm)
+    os.environ['GROQ_TOKENS_PER_MINUTE'] = '1000000'
+
+    from shared.llm import create_llm, get_scheduler, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+
+    model_name = "fake-model"
+    interactive_llm = create_llm(model_name, priority=PRIORITY_INTERACTIVE)
+    batch_llm = interactive_llm.with_priority(PRIORITY_BATCH)
+
+    latencies = {'batch': [], 'interactive': []}
+    lock = threading.Lock()
+
+    def call(llm, lane, prompt):
+        started = time.perf_counter()
+        llm.invoke(prompt)
+        with lock:
+            latencies[lane].append(time.perf_counter() - started)
+
+    threads = [
+        threading.Thread(target=call, args=(batch_llm, 'batch', "Analyze this transcript chunk " * 200))
+        for _ in range(args.batch)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Let the batch backlog build up before the students start chatting
+    time.sleep(2)
+    interactive = [
+        threading.Thread(target=call, args=(interactive_llm, 'interactive', "What is seaborn?"))
+        for _ in range(args.interactive)
+    ]
+    for thread in interactive:
+        thread.start()
+    for thread in threads + interactive:
+        thread.join()
+
+    stats = get_scheduler(model_name).stats
+    print(f"Admitted calls: {stats['admitted']}, 429 responses: {stats['rate_limited']}")
+    for lane, values in latencies.items():
+        if values:
+            print(f"{lane:>11}: n={len(values)} mean={sum(values) / len(values):.2f}s max={max(values):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Time the transcript analysis pipeline with the LLM replayed from a cassette.
+
+Turns a text file into caption-like segments and runs the same steps as
+/process_video: chunking, chunk embedding, vector index build, retrieval and
+packing, prompt assembly and the LLM call. The LLM is served from the cassette,
+so the remaining time is our own overhead and the numbers repeat offline.
+
+    # once, with a Groq key, to record the analysis response
+    python benchmarks/pipeline.py --record
+    # afterwards, anywhere
+    python benchmarks/pipeline.py --repeat 5 --latency-ms 0
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+AI_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(AI_DIR))
+sys.path.append(str(AI_DIR / 'transcript_analysis'))
+
+
+def text_to_segments(text, words_per_segment=12, seconds_per_segment=4.0):
+    """Cut plain text into transcript-like segments with start and duration."""
+    words = text.split()
+    return [
+        {
+            'text': ' '.join(words[i:i + words_per_segment]),
+            'start': (i // words_per_segment) * seconds_per_segment,
+            'duration': seconds_per_segment
+        } for i in range(0, len(words), words_per_segment)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--text', default=str(AI_DIR / 'Chat' / 'text.txt'))
+    parser.add_argument('--cassette', default=str(AI_DIR / 'cassettes' / 'pipeline.jsonl'))
+    parser.add_argument('--record', action='store_true', help="call Groq and record the responses")
+    parser.add_argument('--latency-ms', type=float, default=0, help="simulated LLM latency when replaying")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ['LLM_CASSETTE_MODE'] = 'record' if args.record else 'replay'
+    os.environ['LLM_CASSETTE_PATH'] = args.cassette
+    os.environ['LLM_CASSETTE_LATENCY_MS'] = str(args.latency_ms)
+    os.environ.setdefault('GROQ_API_KEY', 'replay')
+
+    import api
+    from transcript_index import TranscriptIndex, chunk_segments
+
+    segments = text_to_segments(Path(args.text).read_text(encoding='utf-8'))
+    api.embeddings.embed_query("warm up")
+    print(f"{len(segments)} segments from {args.text}")
+
+    totals = {}
+    for _ in range(args.repeat):
+        timings = {}
+
+        started = time.perf_counter()
+        chunks = chunk_segments(segments)
+        timings['chunking'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vectors = api.embeddings.embed_documents([chunk['text'] for chunk in chunks])
+        timings['embedding'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = TranscriptIndex(chunks, vectors)
+        timings['vector_build'] = time.perf_counter() - started
+
+        _, context, _, retrieval = api.retrieve_analysis_context(index)
+        timings.update(retrieval)
+
+        started = time.perf_counter()
+        api.ANALYSIS_PROMPT.format_messages(
+            input=api.ANALYSIS_QUESTION, context='\n\n'.join(doc.page_content for doc in context)
+        )
+        timings['prompt_assembly'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        api.analysis_chain.invoke({"input": api.ANALYSIS_QUESTION, "context": context})
+        timings['llm'] = time.perf_counter() - started
+
+        for stage, seconds in timings.items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+
+    overhead = sum(seconds for stage, seconds in totals.items() if stage != 'llm') / args.repeat
+    for stage, seconds in totals.items():
+        print(f"{stage:>16}: {seconds / args.repeat * 1000:9.2f} ms")
+    print(f"{'overhead':>16}: {overhead * 1000:9.2f} ms (everything but the LLM)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare dense-only retrieval with BM25 and the hybrid retriever.
+
+Chunks a text file the way the chat agent does and reports index build time
+(Chroma with embeddings vs the BM25 inverted index) and per-query latency for
+dense, BM25-only and hybrid retrieval. Identifier queries such as
+``sns.barplot`` take the keyword fast path and skip the query embedding.
+
+    python benchmarks/retrieval.py --text Chat/text.txt --repeat 20
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import Chroma
+from shared.embeddings import get_embeddings
+from shared.hybrid_retrieval import BM25Index, HybridRetriever
+
+DEFAULT_QUERIES = [
+    "What is a bar plot used for?",
+    "How do I compare distributions between groups?",
+    "sns.barplot",
+    "plt.show()",
+]
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--text', default=str(Path(__file__).resolve().parent.parent / 'Chat' / 'text.txt'))
+    parser.add_argument('--query', action='append', help="query to time (repeatable)")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    text = Path(args.text).read_text(encoding='utf-8')
+    documents = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).create_documents([text])
+    embeddings = get_embeddings()
+    embeddings.embed_query("warm up")
+    print(f"{len(documents)} chunks from {args.text}")
+
+    started = time.perf_counter()
+    vectors = Chroma.from_documents(documents, embeddings)
+    print(f"Dense build (embed + Chroma): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    BM25Index([doc.page_content for doc in documents])
+    print(f"BM25 build:                   {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    retriever = HybridRetriever.from_documents(vectors, documents)
+    for query in args.query or DEFAULT_QUERIES:
+        dense, dense_docs = timed(lambda: vectors.similarity_search(query, k=4), args.repeat)
+        keyword, _ = timed(lambda: retriever.bm25.search(query, k=4), args.repeat)
+        hybrid, hybrid_docs = timed(lambda: retriever.invoke(query), args.repeat)
+        overlap = len({d.page_content for d in dense_docs} & {d.page_content for d in hybrid_docs})
+        print(
+            f"{query!r}: dense={dense * 1000:.2f} ms bm25={keyword * 1000:.2f} ms "
+            f"hybrid={hybrid * 1000:.2f} ms (top-4 shared with dense: {overlap})"
+        )
+
+    vectors.delete_collection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+from queue import Queue, Empty
+from flask import Flask, request, jsonify
+from dotenv import load_dotenv
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.embeddings import load_local_embeddings, local_embedding_signature
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Initialize resources
+os.environ["HF_HOME"] = os.path.expanduser("~/.cache/huggingface")
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+# Batching settings
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "10"))
+
+# Flask app initialization
+app = Flask(__name__)
+
+
+class _PendingRequest:
+    """Texts from one HTTP request waiting to be embedded."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.embeddings = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Merges concurrent embedding requests into a single model call.
+
+    The first waiting request opens a batch; other requests arriving within
+    ``max_wait_ms`` (up to ``max_batch_size`` texts) are embedded with it.
+    """
+
+    def __init__(self, embeddings, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = {'requests': 0, 'texts': 0, 'batches': 0}
+        self._start()
+        # Threads don't survive fork; workers forked by serve.py start their own
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.queue = Queue()
+        self.stats_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def embed(self, texts):
+        """Embed texts, blocking until their batch has been processed."""
+        pending = _PendingRequest(texts)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error:
+            raise pending.error
+        return pending.embeddings
+
+    def _collect_batch(self):
+        batch = [self.queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self.queue.get(timeout=remaining)
+            except Empty:
+                break
+            batch.append(pending)
+            size += len(pending.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for pending in batch for text in pending.texts]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                offset = 0
+                for pending in batch:
+                    pending.embeddings = vectors[offset:offset + len(pending.texts)]
+                    offset += len(pending.texts)
+            except Exception as e:
+                logger.error(f"Error embedding batch: {str(e)}")
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+            with self.stats_lock:
+                self.stats['requests'] += len(batch)
+                self.stats['texts'] += len(texts)
+                self.stats['batches'] += 1
+
+
+# Load the model once for every service on this host
+try:
+    batcher = MicroBatcher(load_local_embeddings())
+    logger.info("Embedding model loaded successfully")
+except Exception as e:
+    logger.error(f"Failed to initialize embedding model: {str(e)}")
+    raise
+
+
+@app.route('/embed', methods=['POST'])
+def embed():
+    """
+    API endpoint to embed texts.
+    Expects a JSON payload with a 'texts' list.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('texts'), list):
+            return jsonify({'error': 'Invalid request, "texts" list is required'}), 400
+
+        texts = [str(text) for text in data['texts']]
+        if not texts:
+            return jsonify({'embeddings': []}), 200
+
+        return jsonify({'embeddings': batcher.embed(texts)}), 200
+
+    except Exception as e:
+        logger.error(f"Error embedding texts: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint with batching statistics."""
+    with batcher.stats_lock:
+        stats = dict(batcher.stats)
+    stats['avg_batch_size'] = stats['texts'] / stats['batches'] if stats['batches'] else 0
+    return jsonify({'status': 'healthy', 'embedding': local_embedding_signature(), 'stats': stats}), 200
+
+
+if __name__ == '__main__':
+    # Only reachable from this host; the other services connect over localhost
+    app.run(host='127.0.0.1', port=5004, threaded=True)
@@ -0,0 +1,209 @@
+"""
+Production entry point for the AI services.
+
+Imports a service once in this parent process, so its models (sentence
+transformer, YOLO, LangChain stack) are loaded a single time, then forks
+worker processes that share those pages copy-on-write and accept connections
+on one listening socket. Startup time and per-worker memory are logged.
+
+    python serve.py transcript_analysis --workers 4
+    python serve.py embedding --workers 2 --threads-per-worker 4
+    python serve.py chat_async
+
+Services that keep request state in process memory (the chat conversation,
+video detection jobs) always run a single worker. Without os.fork (Windows)
+every service runs a single process. ASGI services (chat_async) are served by
+uvicorn in that single process.
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import inspect
+import argparse
+import importlib
+from pathlib import Path
+
+AI_DIR = Path(__file__).resolve().parent
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+logger = logging.getLogger('serve')
+
+# name -> (directory, module, port, workers allowed, environment for multiple workers)
+SERVICES = {
+    'chat': ('Chat', 'flask-api', 5000, False, {}),
+    'chat_async': ('Chat', 'async_api', 5000, False, {}),
+    'transcript_analysis': ('transcript_analysis', 'api', 5001, True, {
+        'BATCH_JOB_DIR': str(AI_DIR / 'transcript_analysis' / 'batch_jobs_state')
+    }),
+    'video_detection': ('video_detection', 'api', 5002, False, {}),
+    'ocr': ('OCR', 'main', 5003, True, {}),
+    'embedding': ('embedding_service', 'api', 5004, True, {}),
+    'summarization': ('transcript_analysis', 'summarization_rag', 5006, True, {}),
+}
+
+
+def memory_usage(pid='self'):
+    """RSS, PSS and shared memory of a process in MB, from /proc; peak RSS elsewhere."""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty'):
+                    usage[name] = int(value.split()[0]) / 1024
+    except OSError:
+        try:
+            import resource
+        except ImportError:  # Windows
+            return {}
+        # ru_maxrss is in KB on Linux and bytes on macOS; report the peak either way
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'max_rss': peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)}
+    return {
+        'rss': usage.get('Rss', 0),
+        'pss': usage.get('Pss', 0),
+        'shared': usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0)
+    }
+
+
+def format_memory(usage):
+    return ', '.join(f"{name.upper()} {value:.0f} MB" for name, value in usage.items()) or "memory unknown"
+
+
+def load_service(name, workers):
+    """Import the service module from its directory and return its Flask (or ASGI) app."""
+    directory, module, _, _, env = SERVICES[name]
+    if workers > 1:
+        for key, value in env.items():
+            os.environ.setdefault(key, value)
+    service_dir = AI_DIR / directory
+    os.chdir(service_dir)
+    sys.path.insert(0, str(service_dir))
+    sys.path.insert(1, str(AI_DIR))
+    return importlib.import_module(module).app
+
+
+def listen(host, port, backlog=128):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, args, workers, number):
+    """Serve requests in a forked worker until terminated."""
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Forked workers split the machine's cores and the Groq rate limits
+    if args.threads_per_worker and 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(args.threads_per_worker)
+    if 'shared.llm' in sys.modules:
+        sys.modules['shared.llm'].set_rate_limit_share(1.0 / workers)
+
+    server = make_server(args.host, args.port, app, threaded=True, fd=sock.fileno())
+    logger.info(f"Worker {number} ready ({format_memory(memory_usage())})")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('service', choices=sorted(SERVICES))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVE_WORKERS', '2')))
+    parser.add_argument('--host', default=os.getenv('SERVE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="torch CPU threads per worker (default: torch's own choice)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    _, _, default_port, multi_worker, _ = SERVICES[args.service]
+    args.port = args.port or default_port
+
+    workers = max(1, args.workers)
+    if workers > 1 and not multi_worker:
+        logger.warning(f"{args.service} keeps request state in memory; running a single worker")
+        workers = 1
+    if workers > 1 and not hasattr(os, 'fork'):
+        logger.warning("os.fork is not available on this platform; running a single worker")
+        workers = 1
+
+    app = load_service(args.service, workers)
+    logger.info(
+        f"Loaded {args.service} in {time.perf_counter() - started:.1f}s "
+        f"({format_memory(memory_usage())})"
+    )
+
+    if workers == 1:
+        logger.info(f"Serving {args.service} on {args.host}:{args.port}")
+        if inspect.iscoroutinefunction(type(app).__call__):
+            import uvicorn
+            uvicorn.run(app, host=args.host, port=args.port)
+            return
+        from werkzeug.serving import make_server
+        make_server(args.host, args.port, app, threaded=True).serve_forever()
+        return
+
+    sock = listen(args.host, args.port)
+    # Move everything loaded so far out of the collector's reach, so collections
+    # in the workers don't touch (and un-share) the parent's pages
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+
+    def spawn(number):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, args, workers, number)
+            finally:
+                os._exit(0)
+        children[pid] = number
+
+    for number in range(workers):
+        spawn(number)
+    logger.info(
+        f"Serving {args.service} on {args.host}:{args.port} with {workers} workers, "
+        f"ready in {time.perf_counter() - started:.1f}s"
+    )
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        number = children.pop(pid, None)
+        if number is not None and not stopping:
+            logger.warning(f"Worker {number} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            spawn(number)
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Shared helpers used by the Edutopia AI services (chat, transcript analysis, ...).
+"""
@@ -0,0 +1,179 @@
+"""
+Record/replay cassettes for LLM calls.
+
+In record mode every prompt sent to the wrapped chat model and its response are
+appended to a JSONL cassette. In replay mode responses are served from the
+cassette after a simulated latency, so the pipelines and the chat agent run
+without a Groq key or network. Selected by create_llm from the environment:
+
+    LLM_CASSETTE_MODE=record LLM_CASSETTE_PATH=cassettes/analysis.jsonl python api.py
+    LLM_CASSETTE_MODE=replay LLM_CASSETTE_LATENCY_MS=800 python api.py
+"""
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+logger = logging.getLogger(__name__)
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+DEFAULT_CASSETTE_PATH = Path(__file__).resolve().parent.parent / "cassettes" / "llm.jsonl"
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode for a prompt that was never recorded."""
+
+
+def cassette_key(model_name: str, messages: List[BaseMessage], stop: Optional[List[str]] = None) -> str:
+    """Stable hash of the model, the messages and the stop sequences."""
+    payload = json.dumps({
+        'model': model_name,
+        'messages': [[message.type, message.content] for message in messages],
+        'stop': stop or []
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Recorded responses by prompt key, backed by an append-only JSONL file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self.lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, key, model_name, messages, text, usage):
+        entry = {
+            'key': key,
+            'model': model_name,
+            'prompt': messages[-1].content[:200] if messages else '',
+            'text': text,
+            'usage': usage or {}
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path) -> Cassette:
+    """Return the shared Cassette for a file, so all models append to one place."""
+    path = str(Path(path).resolve())
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model that records the wrapped model's responses or replays them."""
+
+    cassette: Any
+    mode: str = MODE_REPLAY
+    model_name: str
+    llm: Optional[BaseChatModel] = None
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.mode}"
+
+    def with_priority(self, priority: int) -> "CassetteChatModel":
+        # Replayed calls are not rate limited, so there are no lanes to pick
+        return self
+
+    def _lookup(self, messages, stop):
+        entry = self.cassette.get(cassette_key(self.model_name, messages, stop))
+        if entry is None:
+            raise CassetteMissError(
+                f"No recorded response for this prompt in {self.cassette.path}; "
+                f"run once with LLM_CASSETTE_MODE={MODE_RECORD}"
+            )
+        return entry
+
+    def _replay(self, messages, stop):
+        entry = self._lookup(messages, stop)
+        time.sleep(self.latency_ms / 1000.0)
+        return entry
+
+    def _replayed_result(self, entry) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=entry['text']))],
+            llm_output={'token_usage': entry['usage'], 'model_name': self.model_name}
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.mode == MODE_REPLAY:
+            return self._replayed_result(self._replay(messages, stop))
+
+        result = self.llm._generate(messages, stop=stop, **kwargs)
+        usage = (result.llm_output or {}).get('token_usage') or {}
+        self.cassette.record(
+            cassette_key(self.model_name, messages, stop), self.model_name, messages,
+            result.generations[0].message.content, dict(usage)
+        )
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.mode == MODE_REPLAY:
+            # The simulated latency is awaited, so concurrent replayed calls overlap like real ones
+            entry = self._lookup(messages, stop)
+            await asyncio.sleep(self.latency_ms / 1000.0)
+            return self._replayed_result(entry)
+
+        result = await self.llm._agenerate(messages, stop=stop, **kwargs)
+        usage = (result.llm_output or {}).get('token_usage') or {}
+        self.cassette.record(
+            cassette_key(self.model_name, messages, stop), self.model_name, messages,
+            result.generations[0].message.content, dict(usage)
+        )
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.mode == MODE_REPLAY:
+            entry = self._replay(messages, stop)
+            words = entry['text'].split(' ')
+            for i, word in enumerate(words):
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else ' ' + word))
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        parts = []
+        usage = {}
+        for chunk in self.llm._stream(messages, stop=stop, **kwargs):
+            parts.append(chunk.text)
+            usage = getattr(chunk.message, 'usage_metadata', None) or usage
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self.cassette.record(
+            cassette_key(self.model_name, messages, stop), self.model_name, messages, ''.join(parts), dict(usage)
+        )
@@ -0,0 +1,126 @@
+"""
+Token-budgeted packing of retrieved chunks into a RAG prompt context.
+
+Retrieved chunks usually overlap (the splitters repeat 200 characters between
+neighbours) and the same text can come back twice. The packer merges
+overlapping or adjacent chunks, drops duplicates and fills a token budget in
+order of relevance, returning the context in reading order.
+"""
+import math
+from langchain_core.documents import Document
+
+# Rough characters per token for English text with the Llama tokenizer
+CHARS_PER_TOKEN = 4
+
+# Shortest suffix/prefix match treated as real overlap between chunk texts
+MIN_TEXT_OVERLAP = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of tokens in a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _text_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of ``first`` that is a prefix of ``second``."""
+    for size in range(min(len(first), len(second)), MIN_TEXT_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+class _Group:
+    """One contiguous piece of context built from one or more chunks."""
+
+    def __init__(self, doc, score):
+        self.text = doc.page_content
+        self.metadata = dict(doc.metadata)
+        self.score = score
+        self.span = None
+        if 'start_index' in doc.metadata:
+            start = doc.metadata['start_index']
+            self.span = (start, start + len(doc.page_content))
+
+    def merged_text(self, doc):
+        """Return the text of this group merged with ``doc``, or None if they don't touch."""
+        text = doc.page_content
+        if text in self.text:
+            return self.text
+        if self.text in text:
+            return text
+
+        if self.span is not None and 'start_index' in doc.metadata:
+            start = doc.metadata['start_index']
+            end = start + len(text)
+            if start > self.span[1] or end < self.span[0]:
+                return None
+            if start >= self.span[0]:
+                return self.text + text[self.span[1] - start:]
+            return text + self.text[end - self.span[0]:]
+
+        overlap = _text_overlap(self.text, text)
+        if overlap:
+            return self.text + text[overlap:]
+        overlap = _text_overlap(text, self.text)
+        if overlap:
+            return text + self.text[overlap:]
+        return None
+
+    def merge(self, doc, score, text):
+        if self.span is not None and 'start_index' in doc.metadata:
+            start = doc.metadata['start_index']
+            self.span = (min(self.span[0], start), max(self.span[1], start + len(doc.page_content)))
+            self.metadata['start_index'] = self.span[0]
+        if 'start' in doc.metadata and 'start' in self.metadata:
+            self.metadata['start'] = min(self.metadata['start'], doc.metadata['start'])
+        if 'end' in doc.metadata and 'end' in self.metadata:
+            self.metadata['end'] = max(self.metadata['end'], doc.metadata['end'])
+        self.text = text
+        self.score = max(self.score, score)
+
+    def position(self):
+        if self.span is not None:
+            return self.span[0]
+        return self.metadata.get('start', 0)
+
+
+def pack_documents(docs_with_scores, token_budget: int):
+    """Pack ``(document, relevance_score)`` pairs into at most ``token_budget`` tokens.
+
+    Higher scores are more relevant. Returns ``(documents, stats)`` where the
+    documents are in reading order and stats holds the token counts before
+    and after packing.
+    """
+    ranked = sorted(docs_with_scores, key=lambda pair: pair[1], reverse=True)
+    groups = []
+    used = 0
+
+    for doc, score in ranked:
+        for group in groups:
+            text = group.merged_text(doc)
+            if text is None:
+                continue
+            extra = estimate_tokens(text) - estimate_tokens(group.text)
+            if used + extra <= token_budget:
+                group.merge(doc, score, text)
+                used += extra
+            break
+        else:
+            tokens = estimate_tokens(doc.page_content)
+            if used + tokens <= token_budget:
+                groups.append(_Group(doc, score))
+                used += tokens
+
+    groups.sort(key=lambda group: group.position())
+    documents = [
+        Document(page_content=group.text, metadata=dict(group.metadata, relevance_score=float(group.score)))
+        for group in groups
+    ]
+    stats = {
+        'candidates': len(docs_with_scores),
+        'documents': len(documents),
+        'tokens_before': sum(estimate_tokens(doc.page_content) for doc, _ in docs_with_scores),
+        'tokens_after': used,
+        'token_budget': token_budget
+    }
+    return documents, stats
@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import requests
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Set this to e.g. http://127.0.0.1:5004 to use the shared embedding service
+EMBEDDING_SERVICE_URL_ENV = "EMBEDDING_SERVICE_URL"
+
+# "huggingface" (fp32 PyTorch) or "onnx" (INT8 ONNX Runtime)
+EMBEDDING_BACKEND_ENV = "EMBEDDING_BACKEND"
+
+
+class RemoteEmbeddings(Embeddings):
+    """LangChain embeddings client for the shared embedding service."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, texts):
+        response = self.session.post(
+            f"{self.base_url}/embed",
+            json={'texts': texts},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()['embeddings']
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._post(list(texts))
+
+    def embed_query(self, text):
+        return self._post([text])[0]
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings with an LRU cache of query vectors.
+
+    Queries are keyed by their text with case, whitespace and trailing
+    punctuation normalized, so repeated questions are embedded once.
+    Document embedding is passed through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = 1024):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(text):
+        return ' '.join(text.lower().split()).rstrip('?!.')
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = self.key(text)
+        with self.lock:
+            vector = self.cache.get(key)
+            if vector is not None:
+                self.cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return vector
+            self.stats['misses'] += 1
+        vector = self.embeddings.embed_query(text)
+        with self.lock:
+            self.cache[key] = vector
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return vector
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, size=len(self.cache), max_size=self.max_size)
+
+
+def load_local_embeddings() -> Embeddings:
+    """Load the sentence-transformer in this process with the EMBEDDING_BACKEND backend."""
+    backend = os.getenv(EMBEDDING_BACKEND_ENV, "huggingface").lower()
+    if backend == "onnx":
+        from shared.onnx_embeddings import OnnxEmbeddings
+        logger.info("Using the quantized ONNX embedding backend")
+        return OnnxEmbeddings()
+    if backend != "huggingface":
+        raise ValueError(f"Unknown {EMBEDDING_BACKEND_ENV}: {backend}")
+
+    # Imported lazily so processes using the service never load torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings()
+
+
+def local_embedding_signature() -> str:
+    """Backend and model of the embeddings ``load_local_embeddings`` returns."""
+    from shared.onnx_embeddings import DEFAULT_MODEL_NAME
+    backend = os.getenv(EMBEDDING_BACKEND_ENV, "huggingface").lower()
+    if backend == "onnx":
+        return f"onnx-int8:{DEFAULT_MODEL_NAME}"
+    return f"{backend}:{DEFAULT_MODEL_NAME}"
+
+
+def embedding_signature() -> str:
+    """Identify the embeddings ``get_embeddings`` returns, e.g. ``onnx-int8:<model>``.
+
+    Vectors are only comparable between embeddings with the same signature, so
+    persisted indexes record it and are rebuilt when it changes. The shared
+    embedding service reports its own signature on /health.
+    """
+    service_url = os.getenv(EMBEDDING_SERVICE_URL_ENV)
+    if not service_url:
+        return local_embedding_signature()
+    try:
+        response = requests.get(f"{service_url.rstrip('/')}/health", timeout=5)
+        response.raise_for_status()
+        return response.json()['embedding']
+    except Exception as e:
+        logger.warning(f"Could not read the embedding service signature: {str(e)}")
+        return f"remote:{service_url.rstrip('/')}"
+
+
+def get_embeddings() -> Embeddings:
+    """Return the embeddings used by the AI services.
+
+    Uses the shared embedding service when EMBEDDING_SERVICE_URL is set,
+    otherwise loads the sentence-transformer in this process.
+    """
+    service_url = os.getenv(EMBEDDING_SERVICE_URL_ENV)
+    if service_url:
+        logger.info(f"Using shared embedding service at {service_url}")
+        return RemoteEmbeddings(service_url)
+    return load_local_embeddings()
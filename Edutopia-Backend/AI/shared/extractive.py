@@ -0,0 +1,96 @@
+"""
+Extractive pre-summarization of prompt context.
+
+Sentences are scored with TextRank (or similarity to the centroid) over their
+embeddings, using vectorized NumPy, and only the top fraction is kept in its
+original order before the text goes to the abstractive LLM pass.
+"""
+import re
+import numpy as np
+from langchain_core.documents import Document
+from shared.context_packing import estimate_tokens
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# Auto-generated captions often have no punctuation; longer "sentences" are
+# cut into windows of this many words
+MAX_SENTENCE_WORDS = 40
+
+
+def split_sentences(text: str):
+    """Split text into sentences, falling back to word windows for unpunctuated text."""
+    sentences = []
+    for sentence in SENTENCE_END.split(text):
+        words = sentence.split()
+        for i in range(0, len(words), MAX_SENTENCE_WORDS):
+            sentences.append(' '.join(words[i:i + MAX_SENTENCE_WORDS]))
+    return sentences
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def textrank_scores(vectors, damping=0.85, iterations=50, tolerance=1e-6):
+    """PageRank over the cosine-similarity graph of the sentence vectors."""
+    unit = _unit_rows(vectors)
+    similarity = np.clip(unit @ unit.T, 0.0, None)
+    np.fill_diagonal(similarity, 0.0)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, row_sums, out=np.full_like(similarity, 1.0 / len(unit)), where=row_sums > 0)
+
+    scores = np.full(len(unit), 1.0 / len(unit), dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - damping) / len(unit) + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+
+def centroid_scores(vectors):
+    """Cosine similarity of each sentence to the mean of all sentences."""
+    unit = _unit_rows(vectors)
+    centroid = unit.mean(axis=0)
+    return unit @ (centroid / max(np.linalg.norm(centroid), 1e-12))
+
+
+def compress_documents(documents, embeddings, ratio: float, method: str = "textrank"):
+    """Keep the highest scoring ``ratio`` of the sentences across ``documents``.
+
+    All sentences are embedded in one call. Returns ``(documents, stats)`` with
+    the documents in their original order and the compression statistics.
+    """
+    sentences = []  # (document index, sentence)
+    for doc_index, doc in enumerate(documents):
+        sentences.extend((doc_index, sentence) for sentence in split_sentences(doc.page_content))
+
+    chars_before = sum(len(doc.page_content) for doc in documents)
+    keep = max(1, int(round(len(sentences) * ratio)))
+    if len(sentences) <= keep:
+        kept_documents = documents
+    else:
+        vectors = embeddings.embed_documents([sentence for _, sentence in sentences])
+        scores = textrank_scores(vectors) if method == "textrank" else centroid_scores(vectors)
+        selected = np.sort(np.argsort(-scores)[:keep])
+
+        kept = {}
+        for i in selected:
+            doc_index, sentence = sentences[i]
+            kept.setdefault(doc_index, []).append(sentence)
+        kept_documents = [
+            Document(page_content=' '.join(kept[doc_index]), metadata=documents[doc_index].metadata)
+            for doc_index in sorted(kept)
+        ]
+
+    chars_after = sum(len(doc.page_content) for doc in kept_documents)
+    stats = {
+        'method': method,
+        'sentences_before': len(sentences),
+        'sentences_after': min(keep, len(sentences)),
+        'tokens_before': sum(estimate_tokens(doc.page_content) for doc in documents),
+        'tokens_after': sum(estimate_tokens(doc.page_content) for doc in kept_documents),
+        'compression_ratio': chars_after / chars_before if chars_before else 1.0
+    }
+    return kept_documents, stats
@@ -0,0 +1,120 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Answers /openai/v1/chat/completions (plain and streamed) with a canned reply
+after a simulated latency and enforces a requests/min limit with 429s, so the
+LLM scheduler can be exercised without a Groq key:
+
+    python fake_llm_server.py --port 5005 --rpm 10 --latency-ms 300
+    GROQ_API_BASE=http://127.0.0.1:5005 GROQ_API_KEY=fake python api.py
+"""
+import time
+import json
+import uuid
+import argparse
+import threading
+from collections import deque
+from flask import Flask, request, jsonify, Response
+
+app = Flask(__name__)
+
+settings = {'rpm': 30, 'latency_ms': 200, 'reply': "This is a reply from the fake LLM server."}
+request_times = deque()
+lock = threading.Lock()
+served = []  # (arrival time, first 80 characters of the last message), for inspection
+
+
+def _rate_limited():
+    """Record a request; return the seconds until a slot frees up if over the limit."""
+    now = time.monotonic()
+    with lock:
+        while request_times and now - request_times[0] >= 60:
+            request_times.popleft()
+        if len(request_times) >= settings['rpm']:
+            return 60 - (now - request_times[0])
+        request_times.append(now)
+        return 0
+
+
+@app.route('/openai/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    data = request.get_json(silent=True) or {}
+    messages = data.get('messages', [])
+    prompt = ' '.join(str(message.get('content', '')) for message in messages)
+
+    retry_after = _rate_limited()
+    if retry_after:
+        response = jsonify({'error': {
+            'message': 'Rate limit reached for requests per minute',
+            'type': 'requests',
+            'code': 'rate_limit_exceeded'
+        }})
+        response.status_code = 429
+        response.headers['retry-after'] = str(max(1, int(retry_after)))
+        return response
+
+    with lock:
+        served.append((time.time(), prompt[-80:]))
+
+    reply = settings['reply']
+    usage = {
+        'prompt_tokens': len(prompt) // 4,
+        'completion_tokens': len(reply) // 4,
+        'total_tokens': len(prompt) // 4 + len(reply) // 4
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = data.get('model', 'fake-model')
+    time.sleep(settings['latency_ms'] / 1000.0)
+
+    if data.get('stream'):
+        def generate():
+            words = reply.split(' ')
+            for i, word in enumerate(words):
+                chunk = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}, 'finish_reason': None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'x_groq': {'usage': usage}
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        return Response(generate(), mimetype='text/event-stream')
+
+    return jsonify({
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+        'usage': usage
+    })
+
+
+def start_in_thread(port=5005, rpm=30, latency_ms=200):
+    """Run the fake server in a daemon thread and return its base URL."""
+    settings['rpm'] = rpm
+    settings['latency_ms'] = latency_ms
+    thread = threading.Thread(
+        target=lambda: app.run(host='127.0.0.1', port=port, threaded=True, use_reloader=False),
+        daemon=True
+    )
+    thread.start()
+    time.sleep(0.5)
+    return f"http://127.0.0.1:{port}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--rpm', type=int, default=30)
+    parser.add_argument('--latency-ms', type=int, default=200)
+    args = parser.parse_args()
+    settings['rpm'] = args.rpm
+    settings['latency_ms'] = args.latency_ms
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
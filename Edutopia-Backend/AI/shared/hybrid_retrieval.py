@@ -0,0 +1,156 @@
+"""
+Keyword (BM25) retrieval alongside the vector stores, fused with reciprocal rank.
+
+Dense retrieval misses exact identifiers such as ``sns.barplot``. A small
+in-process inverted index catches them, and queries that are clearly about an
+identifier are answered from it alone without embedding the query.
+"""
+import re
+import math
+from collections import Counter, defaultdict
+from typing import Any, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Words, plus dotted identifiers like sns.barplot kept as one token
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+)*")
+
+# Queries mentioning code-like identifiers: dotted names, snake_case, calls, camelCase or `backticks`
+IDENTIFIER_PATTERN = re.compile(
+    r"`[^`]+`|\b[A-Za-z_]\w*\.[A-Za-z_]\w*|\b\w+_\w+\b|\b\w+\(\)|\b[a-z]+[A-Z]\w*"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; dotted identifiers are indexed whole and by their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if '.' in token:
+            tokens.extend(token.split('.'))
+    return tokens
+
+
+def is_identifier_query(query: str) -> bool:
+    """True if the query names a code identifier that keyword search can match exactly."""
+    return bool(IDENTIFIER_PATTERN.search(query))
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts."""
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self.lengths = []
+        for doc_index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((doc_index, frequency))
+
+        self.size = len(texts)
+        self.avg_length = (sum(self.lengths) / self.size) if self.size else 0.0
+        self.idf = {
+            term: math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = 5):
+        """Return up to ``k`` ``(doc index, score)`` pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_index, frequency in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_index] / (self.avg_length or 1))
+                scores[doc_index] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """Fuse ranked lists of keys into ``(key, score)`` pairs, best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever over a vector store and a BM25 index of the same documents.
+
+    Identifier queries with keyword hits skip the vector store (and the query
+    embedding); everything else fuses both rankings with RRF.
+
+    ``search`` embeds the query once and also returns scores. It needs
+    ``relevance_fn``, which maps the vector store's distances to similarities.
+    """
+
+    vectorstore: Any
+    documents: List[Document]
+    bm25: Any
+    k: int = 4
+    candidates: int = 10
+    relevance_fn: Any = None
+
+    @classmethod
+    def from_documents(cls, vectorstore, documents: List[Document], **kwargs) -> "HybridRetriever":
+        bm25 = BM25Index([doc.page_content for doc in documents])
+        return cls(vectorstore=vectorstore, documents=documents, bm25=bm25, **kwargs)
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        keyword_hits = self.bm25.search(query, k=self.candidates)
+        if keyword_hits and is_identifier_query(query):
+            return [self.documents[doc_index] for doc_index, _ in keyword_hits[:self.k]]
+
+        dense_docs = self.vectorstore.similarity_search(query, k=self.candidates)
+        by_text = {doc.page_content: doc for doc in dense_docs}
+        for doc_index, _ in keyword_hits:
+            by_text.setdefault(self.documents[doc_index].page_content, self.documents[doc_index])
+
+        fused = reciprocal_rank_fusion([
+            [doc.page_content for doc in dense_docs],
+            [self.documents[doc_index].page_content for doc_index, _ in keyword_hits]
+        ])
+        return [by_text[text] for text, _ in fused[:self.k]]
+
+    def search(self, query: str):
+        """Return ``(docs_with_scores, mode)`` for the top ``k``, embedding the query at most once.
+
+        Scores are the fused RRF scores (BM25 scores in ``keyword`` mode). Each
+        document's ``dense_score`` metadata holds its vector similarity, or None
+        if only BM25 found it. Metadata comes from ``documents``, not from the
+        vector store, whose copy can be stale for chunks kept across updates.
+        """
+        keyword_hits = self.bm25.search(query, k=self.candidates)
+        if keyword_hits and is_identifier_query(query):
+            return [
+                (Document(page_content=self.documents[doc_index].page_content,
+                          metadata=dict(self.documents[doc_index].metadata, dense_score=None)), score)
+                for doc_index, score in keyword_hits[:self.k]
+            ], 'keyword'
+
+        query_vector = self.vectorstore.embeddings.embed_query(query)
+        dense_hits = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            query_vector, k=self.candidates
+        )
+        current = {doc.page_content: doc.metadata for doc in self.documents}
+        by_text = {}
+        for doc, distance in dense_hits:
+            metadata = current.get(doc.page_content, doc.metadata)
+            by_text[doc.page_content] = Document(
+                page_content=doc.page_content, metadata=dict(metadata, dense_score=self.relevance_fn(distance))
+            )
+        for doc_index, _ in keyword_hits:
+            doc = self.documents[doc_index]
+            by_text.setdefault(doc.page_content, Document(page_content=doc.page_content,
+                                                          metadata=dict(doc.metadata, dense_score=None)))
+
+        fused = reciprocal_rank_fusion([
+            [doc.page_content for doc, _ in dense_hits],
+            [self.documents[doc_index].page_content for doc_index, _ in keyword_hits]
+        ])
+        return [(by_text[text], score) for text, score in fused[:self.k]], 'hybrid'
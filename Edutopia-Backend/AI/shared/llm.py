@@ -0,0 +1,472 @@
+"""
+Shared Groq chat model with rate-limit-aware scheduling.
+
+Every LLM call in a process goes through one scheduler per model that budgets
+requests/min and tokens/min with token buckets. Waiting calls are served by
+priority lane (interactive chat before batch analysis before background work)
+and 429 responses are retried with exponential backoff and jitter.
+
+Groq limits are per API key, so when several processes share a key set
+GROQ_REQUESTS_PER_MINUTE / GROQ_TOKENS_PER_MINUTE to each process's share.
+Calls are also metered per call site and request (see shared/llm_metrics.py).
+"""
+import os
+import time
+import heapq
+import asyncio
+import random
+import logging
+import threading
+import itertools
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+
+# Completion size assumed when reserving tokens before a call
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Rough characters per token used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class TokenBucket:
+    """Continuously refilling budget of ``per_minute`` units."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """Return (or with a negative amount, take) units after the real cost is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def scale(self, factor: float):
+        """Shrink or grow the budget, e.g. to split it between processes."""
+        self._refill()
+        self.capacity *= factor
+        self.rate *= factor
+        self.level *= factor
+
+
+class LLMScheduler:
+    """Admits LLM calls in priority order within request and token budgets."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.async_waiters = set()  # (event loop, future) of coroutines in aacquire
+        self.stats = {'admitted': 0, 'rate_limited': 0, 'wait_seconds': [0.0, 0.0, 0.0]}
+
+    def acquire(self, priority: int, tokens: int):
+        """Block until this call may be sent; returns the seconds spent waiting."""
+        started = time.monotonic()
+        ticket = (priority, next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    wait = max(0.0, self.paused_until - time.monotonic())
+                    if self.waiting[0] == ticket and wait == 0.0:
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if wait == 0.0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            break
+                    self.condition.wait(timeout=wait or None)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self._notify()
+
+            return self._admitted(priority, started)
+
+    async def aacquire(self, priority: int, tokens: int):
+        """Like ``acquire``, but waits on the event loop instead of blocking a thread."""
+        started = time.monotonic()
+        ticket = (priority, next(self.counter))
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+        try:
+            while True:
+                with self.condition:
+                    wait = max(0.0, self.paused_until - time.monotonic())
+                    if self.waiting[0] == ticket and wait == 0.0:
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if wait == 0.0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            break
+                    # Registered under the condition, so no notification in between is missed
+                    waiter = (loop, loop.create_future())
+                    self.async_waiters.add(waiter)
+                try:
+                    await asyncio.wait_for(waiter[1], timeout=wait or None)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self.condition:
+                        self.async_waiters.discard(waiter)
+        finally:
+            with self.condition:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self._notify()
+
+        with self.condition:
+            return self._admitted(priority, started)
+
+    def _notify(self):
+        """Wake the threads and coroutines waiting for their turn. Call with ``self.condition`` held."""
+        self.condition.notify_all()
+        for loop, future in self.async_waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _admitted(self, priority: int, started: float) -> float:
+        waited = time.monotonic() - started
+        self.stats['admitted'] += 1
+        lane = min(priority, len(self.stats['wait_seconds']) - 1)
+        self.stats['wait_seconds'][lane] += waited
+        return waited
+
+    def settle(self, reserved: int, used: int):
+        """Correct the token budget once the real usage of a call is known."""
+        with self.condition:
+            self.tokens.refund(reserved - used)
+            self._notify()
+
+    def pause(self, seconds: float):
+        """Hold every lane for ``seconds``, e.g. after a 429."""
+        with self.condition:
+            self.stats['rate_limited'] += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._notify()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+# Fraction of the GROQ_* limits this process may use
+_rate_limit_share = 1.0
+
+
+def get_scheduler(model_name: str) -> LLMScheduler:
+    """Return the process-wide scheduler for a model."""
+    with _schedulers_lock:
+        if model_name not in _schedulers:
+            _schedulers[model_name] = LLMScheduler(
+                requests_per_minute=float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")) * _rate_limit_share,
+                tokens_per_minute=float(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000")) * _rate_limit_share
+            )
+        return _schedulers[model_name]
+
+
+def set_rate_limit_share(share: float):
+    """Limit this process to ``share`` of the configured rate limits.
+
+    Used by serve.py in each forked worker so the workers together stay within
+    the key's limits; existing schedulers are rescaled.
+    """
+    global _rate_limit_share
+    with _schedulers_lock:
+        factor = share / _rate_limit_share
+        _rate_limit_share = share
+        for scheduler in _schedulers.values():
+            with scheduler.condition:
+                scheduler.requests.scale(factor)
+                scheduler.tokens.scale(factor)
+
+
+def estimate_message_tokens(messages: List[BaseMessage]) -> int:
+    """Approximate the prompt tokens of a list of messages."""
+    return sum(len(str(message.content)) for message in messages) // CHARS_PER_TOKEN + 4 * len(messages)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Return the suggested delay of a rate-limit error, 0 if none was given, or None if it isn't one."""
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    if status != 429:
+        return None
+    try:
+        return float(response.headers.get('retry-after', 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model wrapper that routes every call through an LLMScheduler."""
+
+    llm: BaseChatModel
+    scheduler: Any
+    priority: int = PRIORITY_INTERACTIVE
+    max_retries: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.llm._llm_type}"
+
+    def with_priority(self, priority: int) -> "ScheduledChatModel":
+        """Return the same model in another priority lane."""
+        return self.model_copy(update={'priority': priority})
+
+    def _reserve(self, messages, kwargs) -> int:
+        completion = kwargs.get('max_tokens') or getattr(self.llm, 'max_tokens', None) or DEFAULT_COMPLETION_TOKENS
+        return estimate_message_tokens(messages) + completion
+
+    def _backoff(self, attempt: int, error: Exception) -> bool:
+        """Pause the scheduler after a 429; returns False when the error should propagate."""
+        retry_after = _retry_after(error)
+        if retry_after is None or attempt >= self.max_retries:
+            return False
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = max(retry_after, delay * random.uniform(0.5, 1.5))
+        logger.warning(f"LLM rate limited, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        self.scheduler.pause(delay)
+        return True
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        reserved = self._reserve(messages, kwargs)
+        for attempt in itertools.count():
+            self.scheduler.acquire(self.priority, reserved)
+            try:
+                result = self.llm._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self.scheduler.settle(reserved, 0)
+                if self._backoff(attempt, e):
+                    continue
+                raise
+            usage = (result.llm_output or {}).get('token_usage') or {}
+            self.scheduler.settle(reserved, usage.get('total_tokens', reserved))
+            return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        reserved = self._reserve(messages, kwargs)
+        for attempt in itertools.count():
+            await self.scheduler.aacquire(self.priority, reserved)
+            try:
+                result = await self.llm._agenerate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self.scheduler.settle(reserved, 0)
+                if self._backoff(attempt, e):
+                    continue
+                raise
+            usage = (result.llm_output or {}).get('token_usage') or {}
+            self.scheduler.settle(reserved, usage.get('total_tokens', reserved))
+            return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        reserved = self._reserve(messages, kwargs)
+        for attempt in itertools.count():
+            self.scheduler.acquire(self.priority, reserved)
+            used = None  # total tokens, once the stream reports its usage
+            started = False
+            streamed = 0  # completion characters received
+            retry = False
+            stream = self.llm._stream(messages, stop=stop, **kwargs)
+            try:
+                for chunk in stream:
+                    started = True
+                    streamed += len(chunk.text)
+                    usage = getattr(chunk.message, 'usage_metadata', None)
+                    if usage:
+                        used = usage.get('total_tokens', used)
+                    if run_manager:
+                        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                if used is None:
+                    used = reserved
+            except Exception as e:
+                retry = not started and self._backoff(attempt, e)
+                if not retry:
+                    raise
+            finally:
+                # Also runs when the consumer closes the stream early, e.g. an SSE client disconnects
+                stream.close()
+                if used is None:
+                    used = estimate_message_tokens(messages) + streamed // CHARS_PER_TOKEN if started else 0
+                self.scheduler.settle(reserved, used)
+            if not retry:
+                return
+
+
+class MeteredChatModel(BaseChatModel):
+    """Chat model wrapper that records tokens and latency of every call."""
+
+    llm: BaseChatModel
+    model_name: str = ""
+    call_site: str = "default"
+
+    @property
+    def _llm_type(self) -> str:
+        return f"metered-{self.llm._llm_type}"
+
+    def with_priority(self, priority: int) -> "MeteredChatModel":
+        """Return the same model in another priority lane."""
+        return self.model_copy(update={'llm': self.llm.with_priority(priority)})
+
+    def with_call_site(self, call_site: str) -> "MeteredChatModel":
+        """Return the same model with its calls accounted under ``call_site``."""
+        return self.model_copy(update={'call_site': call_site})
+
+    def _start(self, messages):
+        from shared.llm_metrics import metrics, current_request
+
+        endpoint, request_id = current_request()
+        prompt_tokens = estimate_message_tokens(messages)
+        metrics.check_budget(self.call_site, endpoint, prompt_tokens)
+        return {
+            'call_site': self.call_site,
+            'endpoint': endpoint,
+            'request_id': request_id,
+            'model': self.model_name,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': 0
+        }
+
+    def _finish(self, call, started, first_token, text, usage, error=None):
+        from shared.llm_metrics import metrics
+
+        latency = time.perf_counter() - started
+        if usage:
+            call['prompt_tokens'] = usage.get('input_tokens', call['prompt_tokens'])
+            call['completion_tokens'] = usage.get('output_tokens', 0)
+        else:
+            call['completion_tokens'] = len(text) // CHARS_PER_TOKEN
+        call['latency'] = latency
+        call['time_to_first_token'] = (first_token - started) if first_token else latency
+        if error is not None:
+            call['error'] = str(error)[:200]
+        metrics.record(call)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        call = self._start(messages)
+        started = time.perf_counter()
+        try:
+            result = self.llm._generate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            self._finish(call, started, None, '', None, error=e)
+            raise
+        message = result.generations[0].message
+        self._finish(call, started, None, str(message.content), getattr(message, 'usage_metadata', None))
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        call = self._start(messages)
+        started = time.perf_counter()
+        try:
+            result = await self.llm._agenerate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            self._finish(call, started, None, '', None, error=e)
+            raise
+        message = result.generations[0].message
+        self._finish(call, started, None, str(message.content), getattr(message, 'usage_metadata', None))
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        call = self._start(messages)
+        started = time.perf_counter()
+        first_token = None
+        parts = []
+        usage = None
+        try:
+            for chunk in self.llm._stream(messages, stop=stop, **kwargs):
+                if first_token is None and chunk.text:
+                    first_token = time.perf_counter()
+                parts.append(chunk.text)
+                usage = getattr(chunk.message, 'usage_metadata', None) or usage
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        except Exception as e:
+            self._finish(call, started, first_token, ''.join(parts), usage, error=e)
+            raise
+        self._finish(call, started, first_token, ''.join(parts), usage)
+
+
+def create_llm(model_name: str, temperature: float = 0, priority: int = PRIORITY_INTERACTIVE,
+               api_key: Optional[str] = None, call_site: str = "default") -> MeteredChatModel:
+    """Create the Groq chat model used by the AI services.
+
+    Set GROQ_API_BASE to point the client at another server (e.g. the fake
+    server in shared/fake_llm_server.py). LLM_CASSETTE_MODE=record saves every
+    response to LLM_CASSETTE_PATH; LLM_CASSETTE_MODE=replay serves them from
+    there without calling Groq (see shared/cassette.py). Calls are accounted
+    under ``call_site`` (see shared/llm_metrics.py).
+    """
+    from shared.cassette import (
+        CassetteChatModel, get_cassette, DEFAULT_CASSETTE_PATH, MODE_RECORD, MODE_REPLAY
+    )
+
+    cassette_mode = os.getenv("LLM_CASSETTE_MODE", "").lower()
+    if cassette_mode not in ("", MODE_RECORD, MODE_REPLAY):
+        raise ValueError(f"Unknown LLM_CASSETTE_MODE: {cassette_mode}")
+    cassette = get_cassette(os.getenv("LLM_CASSETTE_PATH", str(DEFAULT_CASSETTE_PATH))) if cassette_mode else None
+
+    if cassette_mode == MODE_REPLAY:
+        logger.info(f"Replaying {model_name} responses from {cassette.path}")
+        replay = CassetteChatModel(
+            cassette=cassette, mode=MODE_REPLAY, model_name=model_name,
+            latency_ms=float(os.getenv("LLM_CASSETTE_LATENCY_MS", "0"))
+        )
+        return MeteredChatModel(llm=replay, model_name=model_name, call_site=call_site)
+
+    from langchain_groq import ChatGroq
+
+    llm = ChatGroq(
+        groq_api_key=api_key or os.environ['GROQ_API_KEY'],
+        model_name=model_name,
+        temperature=temperature,
+        # Retries are handled by the scheduler so every lane backs off together
+        max_retries=0
+    )
+    if cassette_mode == MODE_RECORD:
+        logger.info(f"Recording {model_name} responses to {cassette.path}")
+        llm = CassetteChatModel(cassette=cassette, mode=MODE_RECORD, model_name=model_name, llm=llm)
+    scheduled = ScheduledChatModel(llm=llm, scheduler=get_scheduler(model_name), priority=priority)
+    return MeteredChatModel(llm=scheduled, model_name=model_name, call_site=call_site)
@@ -0,0 +1,152 @@
+"""
+Token and latency accounting for LLM calls.
+
+Every call made through create_llm is recorded with its call site (set per
+model with ``with_call_site``), the endpoint and request it ran under,
+prompt and completion tokens, latency and time to first token. Totals are kept
+per call site, endpoint and recent request, and each call can be appended to a
+JSONL file (LLM_METRICS_PATH).
+
+Prompt budgets are set per endpoint or call site, e.g.
+``LLM_PROMPT_BUDGETS="process_video=4000,rag_tool=3000"``; oversized prompts are
+logged, or rejected with PromptBudgetExceeded when LLM_BUDGET_ACTION=reject.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+try:
+    from flask import g, has_request_context, request
+except ImportError:  # not running under Flask
+    has_request_context = lambda: False
+
+BUDGET_ACTION_LOG = "log"
+BUDGET_ACTION_REJECT = "reject"
+
+
+class PromptBudgetExceeded(ValueError):
+    """Raised when a prompt is larger than its endpoint's budget and budgets reject."""
+
+
+def parse_budgets(spec: str):
+    """Parse ``"name=tokens,name=tokens"`` into a dict."""
+    budgets = {}
+    for item in (spec or "").split(','):
+        if '=' in item:
+            name, tokens = item.split('=', 1)
+            budgets[name.strip()] = int(tokens)
+    return budgets
+
+
+# (endpoint, request id) of the request served by an async front end, see set_current_request
+_async_request = ContextVar('llm_async_request', default=(None, None))
+
+
+def set_current_request(endpoint, request_id=None):
+    """Account the LLM calls of the current async task (and threads it starts) to a request."""
+    _async_request.set((endpoint, request_id or uuid.uuid4().hex[:12]))
+
+
+def current_request():
+    """Return ``(endpoint, request id)`` of the request being served, or ``(None, None)``."""
+    if not has_request_context():
+        return _async_request.get()
+    if 'llm_request_id' not in g:
+        g.llm_request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+    return request.endpoint, g.llm_request_id
+
+
+def _empty_totals():
+    return {
+        'calls': 0, 'errors': 0, 'rejected': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+        'latency': 0.0, 'time_to_first_token': 0.0
+    }
+
+
+class LLMMetrics:
+    """Per call site, endpoint and request totals of LLM usage."""
+
+    def __init__(self, path=None, budgets=None, budget_action=BUDGET_ACTION_LOG, max_requests=256):
+        self.path = path
+        self.budgets = budgets or {}
+        self.budget_action = budget_action
+        self.max_requests = max_requests
+        self.call_sites = {}
+        self.endpoints = {}
+        self.requests = OrderedDict()
+        self.lock = threading.Lock()
+
+    def check_budget(self, call_site, endpoint, prompt_tokens):
+        """Log or reject a prompt over the budget of its endpoint (or call site)."""
+        budget = self.budgets.get(endpoint) or self.budgets.get(call_site)
+        if budget is None or prompt_tokens <= budget:
+            return
+        message = f"Prompt of ~{prompt_tokens} tokens for {endpoint or call_site} exceeds its budget of {budget}"
+        if self.budget_action == BUDGET_ACTION_REJECT:
+            self.record({
+                'call_site': call_site, 'endpoint': endpoint, 'request_id': current_request()[1],
+                'prompt_tokens': prompt_tokens, 'rejected': True
+            })
+            raise PromptBudgetExceeded(message)
+        logger.warning(message)
+
+    def record(self, call):
+        """Add one call (a dict as built by MeteredChatModel) to the totals and the JSONL file."""
+        call = dict(call, timestamp=time.time())
+        with self.lock:
+            totals = [
+                self.call_sites.setdefault(call.get('call_site') or 'default', _empty_totals()),
+                self.endpoints.setdefault(call.get('endpoint') or 'none', _empty_totals())
+            ]
+            if call.get('request_id'):
+                if call['request_id'] not in self.requests:
+                    self.requests[call['request_id']] = dict(_empty_totals(), endpoint=call.get('endpoint'))
+                    while len(self.requests) > self.max_requests:
+                        self.requests.popitem(last=False)
+                totals.append(self.requests[call['request_id']])
+
+            for entry in totals:
+                if call.get('rejected'):
+                    entry['rejected'] += 1
+                    continue
+                entry['calls'] += 1
+                entry['errors'] += 1 if call.get('error') else 0
+                entry['prompt_tokens'] += call.get('prompt_tokens', 0)
+                entry['completion_tokens'] += call.get('completion_tokens', 0)
+                entry['latency'] += call.get('latency', 0.0)
+                entry['time_to_first_token'] += call.get('time_to_first_token', 0.0)
+
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(call) + '\n')
+                except OSError as e:
+                    logger.error(f"Error writing LLM metrics to {self.path}: {str(e)}")
+
+    def snapshot(self, recent_requests=20):
+        """Copy of the totals for a metrics endpoint."""
+        with self.lock:
+            return {
+                'call_sites': {name: dict(totals) for name, totals in self.call_sites.items()},
+                'endpoints': {name: dict(totals) for name, totals in self.endpoints.items()},
+                'recent_requests': {
+                    request_id: dict(totals)
+                    for request_id, totals in list(self.requests.items())[-recent_requests:]
+                },
+                'budgets': dict(self.budgets),
+                'budget_action': self.budget_action
+            }
+
+
+metrics = LLMMetrics(
+    path=os.getenv("LLM_METRICS_PATH") or None,
+    budgets=parse_budgets(os.getenv("LLM_PROMPT_BUDGETS", "")),
+    budget_action=os.getenv("LLM_BUDGET_ACTION", BUDGET_ACTION_LOG).lower()
+)
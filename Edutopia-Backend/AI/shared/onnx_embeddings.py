@@ -0,0 +1,109 @@
+"""
+Sentence-transformer embeddings on ONNX Runtime with dynamic INT8 quantization.
+
+The first run exports the Hugging Face model to ONNX, quantizes its weights to
+INT8 and caches both under ONNX_MODEL_DIR; later runs only load the quantized
+graph. Pooling and normalization match the fp32 sentence-transformer, so the
+vectors can be compared against it (see benchmarks/embedding_drift.py).
+"""
+import os
+import logging
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Same default model as HuggingFaceEmbeddings()
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+DEFAULT_MODEL_DIR = Path(__file__).resolve().parent.parent / "onnx_models"
+
+
+def export_model(model_name: str, directory: Path):
+    """Export ``model_name`` to ONNX and write its INT8 quantized copy to ``directory``."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    directory.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = directory / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            str(fp32_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"}
+            },
+            opset_version=14
+        )
+
+    quantize_dynamic(str(fp32_path), str(directory / "model.int8.onnx"), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(str(directory))
+    logger.info(f"Exported {model_name} to {directory}")
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain embeddings backed by a quantized ONNX sentence-transformer."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, model_dir=None, quantized: bool = True,
+                 batch_size: int = 32, max_length: int = 384):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        directory = Path(model_dir or os.getenv("ONNX_MODEL_DIR", DEFAULT_MODEL_DIR)) / model_name.replace('/', '--')
+        filename = "model.int8.onnx" if quantized else "model.onnx"
+        if not (directory / filename).exists():
+            logger.info(f"No ONNX export of {model_name} found, exporting to {directory}")
+            export_model(model_name, directory)
+
+        options = onnxruntime.SessionOptions()
+        threads = os.getenv("ONNX_NUM_THREADS")
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.session = onnxruntime.InferenceSession(
+            str(directory / filename), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(str(directory))
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _embed_batch(self, texts):
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        attention_mask = encoded["attention_mask"].astype(np.int64)
+        (hidden,) = self.session.run(None, {
+            "input_ids": encoded["input_ids"].astype(np.int64),
+            "attention_mask": attention_mask
+        })
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        # Batch texts of similar length together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
@@ -0,0 +1,80 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'transcript_analysis'))
+from analysis_cache import AnalysisCache
+
+
+def age(cache, key, seconds):
+    """Make an entry look ``seconds`` old."""
+    value, _ = cache.entries[key]
+    cache.entries[key] = (value, time.time() - seconds)
+
+
+def wait_for_refresh(cache, key):
+    deadline = time.time() + 2
+    while cache.flights.is_running(key) and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_miss_then_hit():
+    cache = AnalysisCache(ttl=60, stale_ttl=60)
+    assert cache.get_or_compute('video', lambda: 'first') == ('first', 'miss')
+    assert cache.get_or_compute('video', lambda: 'second') == ('first', 'hit')
+
+
+def test_stale_entry_is_served_while_refreshed():
+    cache = AnalysisCache(ttl=60, stale_ttl=60)
+    cache.put('video', 'old')
+    age(cache, 'video', 90)
+
+    assert cache.get_or_compute('video', lambda: 'new') == ('old', 'stale')
+    wait_for_refresh(cache, 'video')
+    assert cache.get('video') == ('new', 'hit')
+
+
+def test_get_refreshes_stale_entry_only_when_asked():
+    cache = AnalysisCache(ttl=60, stale_ttl=60)
+    cache.put('video', 'old')
+    age(cache, 'video', 90)
+
+    assert cache.get('video') == ('old', 'stale')
+    assert not cache.flights.is_running('video')
+    assert cache.get('video', refresh=lambda: 'new') == ('old', 'stale')
+    wait_for_refresh(cache, 'video')
+    assert cache.get('video') == ('new', 'hit')
+
+
+def test_expired_entry_is_recomputed():
+    cache = AnalysisCache(ttl=60, stale_ttl=60)
+    cache.put('video', 'old')
+    age(cache, 'video', 200)
+
+    assert cache.get('video') == (None, 'miss')
+    assert cache.get_or_compute('video', lambda: 'new') == ('new', 'miss')
+
+
+def test_errors_and_none_are_not_cached():
+    cache = AnalysisCache()
+
+    def fail():
+        raise RuntimeError('transcript unavailable')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('video', fail)
+    assert cache.get_or_compute('video', lambda: None) == (None, 'miss')
+    assert cache.get('video') == (None, 'miss')
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnalysisCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get_or_compute('a', lambda: None)
+    cache.put('c', 3)
+
+    assert cache.get('b') == (None, 'miss')
+    assert cache.get('a') == (1, 'hit')
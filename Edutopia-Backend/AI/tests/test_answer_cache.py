@@ -0,0 +1,68 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'Chat'))
+from answer_cache import SemanticAnswerCache, depends_on_history
+
+
+def test_similar_question_on_same_context_hits():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store('lecture', 'what is a bar plot', [1.0, 0.0], 'A chart of bars.', latency=2.0)
+
+    assert cache.lookup('lecture', [0.99, 0.05]) == ('A chart of bars.', pytest.approx(0.9987, abs=1e-3))
+    assert cache.lookup('lecture', [0.5, 0.5]) is None
+    assert cache.lookup('other lecture', [1.0, 0.0]) is None
+
+    snapshot = cache.snapshot()
+    assert (snapshot['hits'], snapshot['misses'], snapshot['latency_saved']) == (1, 2, 2.0)
+
+
+def test_expired_answers_are_dropped():
+    cache = SemanticAnswerCache(ttl=60)
+    cache.store('lecture', 'q', [1.0, 0.0], 'old answer', latency=1.0)
+    vector, answer, latency, _ = cache.contexts['lecture']['q']
+    cache.contexts['lecture']['q'] = (vector, answer, latency, time.time() - 120)
+
+    assert cache.lookup('lecture', [1.0, 0.0]) is None
+    assert cache.snapshot()['entries'] == 0
+
+
+def test_oldest_question_is_evicted_per_context():
+    cache = SemanticAnswerCache(max_entries=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.store('lecture', f"q{i}", vector, f"a{i}", latency=1.0)
+
+    assert cache.lookup('lecture', [1.0, 0.0, 0.0]) is None
+    assert cache.lookup('lecture', [0.0, 0.0, 1.0])[0] == 'a2'
+
+
+def test_bypass_rate_counts_history_questions():
+    cache = SemanticAnswerCache()
+    cache.bypass()
+    cache.lookup('lecture', [1.0])
+
+    assert cache.snapshot()['bypass_rate'] == 0.5
+
+
+@pytest.mark.parametrize('question', [
+    'what did you say about bar plots?',
+    'can you explain that again',
+    'and for histograms?',
+    'how does it work?',
+    'tell me more',
+])
+def test_questions_about_the_conversation_depend_on_history(question):
+    assert depends_on_history(question)
+
+
+@pytest.mark.parametrize('question', [
+    'what is a bar plot?',
+    'how does seaborn draw a histogram?',
+    'explain the difference between mean and median',
+    'is it possible to plot two axes in matplotlib?',
+])
+def test_standalone_questions_do_not_depend_on_history(question):
+    assert not depends_on_history(question)
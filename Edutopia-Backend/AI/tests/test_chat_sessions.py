@@ -0,0 +1,80 @@
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'Chat'))
+from chat_sessions import ChatSession, SessionRegistry, SessionNotLoaded
+
+
+class FakeIndex:
+    nbytes = 100
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_evicted_session_builds_no_orphan_index():
+    built = []
+
+    def build_index(context, previous):
+        built.append(FakeIndex())
+        return built[-1]
+
+    registry = SessionRegistry(build_index, max_sessions=1)
+    registry.put('a', 'context a', memory=None)
+    # A query looks the session up, then another load evicts it before the query takes its lock
+    session = registry.get('a')
+    registry.put('b', 'context b', memory=None)
+
+    with session.lock:
+        with pytest.raises(SessionNotLoaded):
+            registry.ensure_index(session)
+
+    assert built == []
+    assert session.index is None
+    assert registry.snapshot()['index_bytes'] == 0
+
+
+def test_coroutine_waiting_for_session_wakes_on_release():
+    session = ChatSession('a')
+    session.lock.acquire()
+
+    def release_later():
+        time.sleep(0.1)
+        session.lock.release()
+
+    async def query():
+        async with session.async_lock():
+            return time.perf_counter()
+
+    releaser = threading.Thread(target=release_later)
+    started = time.perf_counter()
+    releaser.start()
+    acquired = asyncio.run(query())
+    releaser.join()
+
+    assert 0.1 <= acquired - started < 0.15
+    assert not session.lock.locked()
+
+
+def test_cancelled_waiter_does_not_take_the_lock():
+    session = ChatSession('a')
+
+    async def main():
+        session.lock.acquire()
+        waiter = asyncio.ensure_future(session.lock.acquire_async())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        session.lock.release()
+
+    asyncio.run(main())
+    assert not session.lock.locked()
+    assert not session.lock._waiters
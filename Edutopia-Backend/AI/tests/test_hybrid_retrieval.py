@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shared.context_packing import pack_documents
+from shared.hybrid_retrieval import HybridRetriever
+
+
+class StaleVectorStore:
+    """Vector store whose copy of a kept chunk still has its old start offset."""
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.embeddings = self
+
+    def embed_query(self, query):
+        return [1.0]
+
+    def similarity_search_by_vector_with_relevance_scores(self, vector, k):
+        return self.hits[:k]
+
+
+def test_reloaded_context_packs_with_current_offsets():
+    kept = 'a' * 1000
+    new = 'b' * 1000
+    # After the reload the kept chunk moved from 0 to 1500 and the new chunk is at 500
+    documents = [
+        Document(page_content=new, metadata={'start_index': 500}),
+        Document(page_content=kept, metadata={'start_index': 1500}),
+    ]
+    vectorstore = StaleVectorStore([
+        (Document(page_content=kept, metadata={'start_index': 0}), 0.1),
+        (Document(page_content=new, metadata={'start_index': 500}), 0.2),
+    ])
+    retriever = HybridRetriever.from_documents(
+        vectorstore, documents, relevance_fn=lambda distance: 1.0 - distance
+    )
+
+    docs_with_scores, mode = retriever.search('letters')
+    packed, _ = pack_documents(docs_with_scores, token_budget=3000)
+
+    assert mode == 'hybrid'
+    assert [doc.page_content for doc in packed] == [new + kept]
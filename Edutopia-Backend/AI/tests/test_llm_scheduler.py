@@ -0,0 +1,124 @@
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shared.llm import (
+    LLMScheduler, ScheduledChatModel, TokenBucket, CHARS_PER_TOKEN, DEFAULT_COMPLETION_TOKENS,
+    PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, estimate_message_tokens
+)
+
+
+class WordStream(BaseChatModel):
+    """Streams a fixed reply word by word."""
+
+    reply: str = "one two three four five"
+
+    @property
+    def _llm_type(self) -> str:
+        return "word-stream"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for word in self.reply.split():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + ' '))
+
+
+def test_token_bucket_refund_is_capped_at_capacity():
+    bucket = TokenBucket(600)
+    bucket.consume(100)
+    assert 499 < bucket.level <= 501
+    bucket.refund(1000)
+    assert bucket.level == 600
+    assert bucket.wait_time(700) == 0.0
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+    assert 9.0 < bucket.wait_time(10) <= 10.0
+
+
+def test_closing_stream_early_settles_reservation():
+    scheduler = LLMScheduler(requests_per_minute=60, tokens_per_minute=6000)
+    model = ScheduledChatModel(llm=WordStream(), scheduler=scheduler)
+    messages = [HumanMessage(content='x' * 400)]
+    prompt = estimate_message_tokens(messages)
+
+    stream = model._stream(messages)
+    first = next(stream)
+    assert scheduler.tokens.level < 6000 - prompt - DEFAULT_COMPLETION_TOKENS + 1
+    stream.close()
+
+    # Only the prompt and the text received stay charged
+    charged = 6000 - scheduler.tokens.level
+    assert abs(charged - (prompt + len(first.text) // CHARS_PER_TOKEN)) < 1
+
+
+def test_waiting_calls_are_admitted_by_priority():
+    scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=6000)
+    scheduler.acquire(PRIORITY_INTERACTIVE, 6000)  # empty the token budget
+    order = []
+
+    def call(priority, name):
+        scheduler.acquire(priority, 50)
+        order.append(name)
+
+    background = threading.Thread(target=call, args=(PRIORITY_BACKGROUND, 'background'))
+    background.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=call, args=(PRIORITY_INTERACTIVE, 'interactive'))
+    interactive.start()
+    time.sleep(0.05)
+    scheduler.settle(6000, 0)  # refund the budget; both calls now fit
+
+    background.join(2)
+    interactive.join(2)
+    assert order == ['interactive', 'background']
+
+
+def test_async_acquire_waits_for_earlier_priority():
+    scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=6000)
+    scheduler.acquire(PRIORITY_INTERACTIVE, 6000)
+    order = []
+
+    async def call(priority, name, delay):
+        await asyncio.sleep(delay)
+        await scheduler.aacquire(priority, 50)
+        order.append(name)
+
+    async def main():
+        async def refund():
+            await asyncio.sleep(0.05)
+            scheduler.settle(6000, 0)
+        await asyncio.gather(
+            call(PRIORITY_BACKGROUND, 'background', 0), call(PRIORITY_INTERACTIVE, 'interactive', 0.02), refund()
+        )
+
+    asyncio.run(main())
+    assert order == ['interactive', 'background']
+
+
+def test_async_waiter_is_admitted_as_soon_as_budget_returns():
+    scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=6000)
+    scheduler.acquire(PRIORITY_INTERACTIVE, 6000)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.1, scheduler.settle, 6000, 0)
+        started = time.perf_counter()
+        await scheduler.aacquire(PRIORITY_INTERACTIVE, 50)
+        return time.perf_counter() - started
+
+    assert 0.1 <= asyncio.run(main()) < 0.13
+    assert not scheduler.async_waiters
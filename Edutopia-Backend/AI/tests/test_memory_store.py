@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'Chat'))
+from memory_store import MemoryStore
+
+
+def summary_memory(summary, messages):
+    """The attributes of a ConversationSummaryBufferMemory the store reads."""
+    return SimpleNamespace(moving_summary_buffer=summary, chat_memory=SimpleNamespace(messages=messages))
+
+
+def test_saved_memory_survives_reopening(tmp_path):
+    path = tmp_path / 'memory.sqlite3'
+    messages = [HumanMessage(content='What is a bar plot?'), AIMessage(content='A chart of bars.')]
+    MemoryStore(path).save('session', summary_memory('Talked about plots.', messages), turns=3)
+
+    summary, loaded, turns = MemoryStore(path).load('session')
+    assert summary == 'Talked about plots.'
+    assert [(type(m), m.content) for m in loaded] == [(type(m), m.content) for m in messages]
+    assert turns == 3
+
+
+def test_save_replaces_previous_memory(tmp_path):
+    store = MemoryStore(tmp_path / 'memory.sqlite3')
+    store.save('session', summary_memory('', []), turns=1)
+    store.save('session', summary_memory('Later.', []), turns=2)
+
+    assert store.load('session') == ('Later.', [], 2)
+    assert store.load('other') is None
+
+
+def test_turn_log_appends_and_pages(tmp_path):
+    store = MemoryStore(tmp_path / 'memory.sqlite3')
+    numbers = [store.append_turn('session', f"q{i}", f"a{i}") for i in range(5)]
+
+    assert numbers == [1, 2, 3, 4, 5]
+    assert store.count_turns('session') == 5
+    assert store.turns('session', offset=1, limit=2) == [('q1', 'a1'), ('q2', 'a2')]
+    assert store.turns('session', offset=4) == [('q4', 'a4')]
+    assert store.turns('other') == []
+
+
+def test_replace_turns_keeps_the_common_prefix(tmp_path):
+    store = MemoryStore(tmp_path / 'memory.sqlite3')
+    for i in range(3):
+        store.append_turn('session', f"q{i}", f"a{i}")
+
+    kept = store.replace_turns('session', [('q0', 'a0'), ('q1', 'edited'), ('q2', 'a2')])
+
+    assert kept == 1
+    assert store.turns('session') == [('q0', 'a0'), ('q1', 'edited'), ('q2', 'a2')]
+    assert store.append_turn('session', 'q3', 'a3') == 4
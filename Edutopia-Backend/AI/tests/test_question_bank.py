@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('langchain.text_splitter')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'Chat'))
+from question_bank import QuestionBank, QUESTION_TYPES
+
+CONTEXT = "Photosynthesis turns light into sugar in chloroplasts.\n\nMitosis splits one cell nucleus into two."
+
+
+class ParagraphBank(QuestionBank):
+    """One section per paragraph, so topics can match a single section."""
+
+    def split_sections(self, context):
+        return context.split('\n\n')
+
+
+def make_bank():
+    calls = []
+
+    def generate(section_text, question_type, count):
+        calls.append((section_text, question_type))
+        return [{'question': f"{section_text[:10]} {i}?", 'answer': 'True'} for i in range(count)]
+
+    return ParagraphBank(generate, max_workers=1), calls
+
+
+def wait(bank):
+    # One worker runs the fills in order, so this returns once the earlier ones are done
+    bank.executor.submit(lambda: None).result()
+
+
+def test_bank_is_filled_on_first_quiz_request():
+    bank, calls = make_bank()
+
+    assert bank.take('hash', 'true_false', 5) == []
+    assert calls == []
+
+    assert bank.take('hash', 'true_false', 5, context=CONTEXT) == []
+    wait(bank)
+    assert len(calls) == 2 * len(QUESTION_TYPES)
+
+    questions = bank.take('hash', 'true_false', 5, context=CONTEXT)
+    assert len(questions) == 5
+    # Round-robin over both sections
+    assert {question['section'] for question in questions} == {0, 1}
+
+
+def test_topic_takes_only_matching_section():
+    bank, _ = make_bank()
+    bank.prepare('hash', CONTEXT)
+    wait(bank)
+
+    questions = bank.take('hash', 'mcq', 5, 'mitosis')
+    assert [question['section'] for question in questions] == [1] * 5
+
+
+def test_off_topic_request_gets_no_lecture_questions():
+    bank, _ = make_bank()
+    bank.prepare('hash', CONTEXT)
+    wait(bank)
+
+    assert bank.take('hash', 'mcq', 5, 'the french revolution') == []
+    assert bank.snapshot()['off_topic'] == 1
@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'Chat'))
+from question_parsing import QuestionStreamParser, validate_question
+
+
+def parse(reply, piece=7):
+    parser = QuestionStreamParser()
+    objects = []
+    for start in range(0, len(reply), piece):
+        objects.extend(parser.feed(reply[start:start + piece]))
+    return objects, parser
+
+
+def test_questions_are_yielded_as_each_object_closes():
+    parser = QuestionStreamParser()
+    assert parser.feed('{"questions": [{"question": "A?", "answer": "Yes"}, {"quest') == [
+        {'question': 'A?', 'answer': 'Yes'}
+    ]
+    assert parser.feed('ion": "B?", "answer": "No"}]}') == [{'question': 'B?', 'answer': 'No'}]
+
+
+def test_comments_and_preamble_are_skipped():
+    reply = (
+        'Here are your questions:\n```json\n{"questions": [\n'
+        '  // first question\n'
+        '  {"question": "Is 2 even? // yes", "answer": "Yes"},\n'
+        '  {"question": "Is 3 even?", "answer": "No",}\n'
+        ']}\n```'
+    )
+    objects, parser = parse(reply)
+    assert objects == [
+        {'question': 'Is 2 even? // yes', 'answer': 'Yes'},
+        {'question': 'Is 3 even?', 'answer': 'No'},
+    ]
+    assert parser.malformed == 0
+
+
+def test_truncated_reply_keeps_complete_questions():
+    objects, _ = parse('{"questions": [{"question": "A?", "answer": "True"}, {"question": "B?", "ans')
+    assert objects == [{'question': 'A?', 'answer': 'True'}]
+
+
+def test_malformed_object_is_counted_and_dropped():
+    objects, parser = parse('{"questions": [{"question": "A?" "answer": "Yes"}, {"question": "B?", "answer": "No"}]}')
+    assert objects == [{'question': 'B?', 'answer': 'No'}]
+    assert parser.malformed == 1
+
+
+def test_mcq_letter_answer_is_repaired():
+    question = validate_question({
+        'question': 'Which is a plot function?',
+        'options': ['A) barplot', 'B) read_csv', 'C) merge', 'D) groupby'],
+        'answer': 'a',
+    }, 'mcq')
+    assert question['answer'] == 'A) barplot'
+
+
+def test_mcq_options_object_and_bare_answer_are_repaired():
+    question = validate_question({
+        'question': 'Which is a plot function?',
+        'options': {'A': 'read_csv', 'B': 'barplot', 'C': 'merge', 'D': 'groupby'},
+        'answer': 'Barplot',
+    }, 'mcq')
+    assert question['options'][1] == 'B) barplot'
+    assert question['answer'] == 'B) barplot'
+
+
+def test_invalid_mcq_answers_are_dropped():
+    base = {'question': 'Q?', 'options': ['A) w', 'B) x', 'C) y', 'D) z']}
+    assert validate_question(dict(base, answer='AB'), 'mcq') is None
+    assert validate_question(dict(base, answer='E'), 'mcq') is None
+    assert validate_question(dict(base, options=['A) w', 'B) x'], answer='A'), 'mcq') is None
+
+
+def test_boolean_answers_become_words():
+    assert validate_question({'question': 'Q?', 'answer': True}, 'yes_no')['answer'] == 'Yes'
+    assert validate_question({'question': 'Q?', 'answer': False}, 'true_false')['answer'] == 'False'
+    assert validate_question({'question': ' ', 'answer': 'Yes'}, 'yes_no') is None
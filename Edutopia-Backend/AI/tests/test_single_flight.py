@@ -0,0 +1,73 @@
+import sys
+import time
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'transcript_analysis'))
+from single_flight import SingleFlight
+from analysis_cache import AnalysisCache
+
+
+def run_concurrently(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_computation():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return 'transcript'
+
+    threads, results = run_concurrently(4, lambda: flights.do('video', compute))
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert sorted(results) == [('transcript', False)] + [('transcript', True)] * 3
+    assert flights.stats == {'leaders': 1, 'shared': 3}
+    assert not flights.is_running('video')
+
+
+def test_error_reaches_every_waiter_and_is_not_kept():
+    flights = SingleFlight()
+    flight, leader = flights.claim('video')
+    waiter, waiter_leads = flights.claim('video')
+    assert leader and not waiter_leads and waiter is flight
+
+    flights.finish('video', flight, error=ValueError('no captions'))
+    with pytest.raises(ValueError):
+        waiter.result()
+    # The next call computes again
+    assert flights.do('video', lambda: 'retry') == ('retry', False)
+
+
+def test_analysis_cache_misses_compute_once():
+    cache = AnalysisCache()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return 'analysis'
+
+    threads, results = run_concurrently(4, lambda: cache.get_or_compute('video', compute))
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert results == [('analysis', 'miss')] * 4
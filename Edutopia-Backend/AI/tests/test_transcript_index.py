@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'transcript_analysis'))
+from transcript_index import chunk_segments
+
+
+def segment(letter, start, length=600):
+    return {'text': letter * length, 'start': start, 'duration': 1}
+
+
+def test_chunks_drop_overlap_that_would_exceed_budget():
+    chunks = chunk_segments([segment('a', 0), segment('b', 1), segment('c', 2)], max_chars=1000)
+
+    assert [chunk['text'][0] for chunk in chunks] == ['a', 'b', 'c']
+    assert all(len(chunk['text']) <= 1000 for chunk in chunks)
+
+
+def test_chunks_keep_overlap_within_budget():
+    segments = [segment(letter, i, 300) for i, letter in enumerate('abcd')]
+    chunks = chunk_segments(segments, max_chars=1000)
+
+    assert [chunk['text'].split() for chunk in chunks] == [
+        ['a' * 300, 'b' * 300, 'c' * 300],
+        ['c' * 300, 'd' * 300],
+    ]
@@ -0,0 +1,117 @@
+"""
+In-memory cache for transcript analysis results.
+
+Entries are fresh for ``ttl`` seconds. After that they are served stale for up
+to ``stale_ttl`` more seconds while a background refresh recomputes them.
+Concurrent misses for the same key share a single computation.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """TTL + stale-while-revalidate cache with single-flight computation."""
+
+    def __init__(self, ttl=24 * 3600, stale_ttl=7 * 24 * 3600, max_entries=256):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (value, created_at)
+        self.flights = SingleFlight()
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Return ``(value, status)`` where status is 'hit', 'stale' or 'miss'.
+
+        ``compute`` is called with no arguments. Results that are None or raise
+        are not cached; errors propagate to every caller waiting on them.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                age = time.time() - created_at
+                if age < self.ttl:
+                    self.entries.move_to_end(key)
+                    return value, 'hit'
+                if age < self.ttl + self.stale_ttl:
+                    self.entries.move_to_end(key)
+                    self._refresh(key, compute)
+                    return value, 'stale'
+
+            flight, leader = self.flights.claim(key)
+
+        if leader:
+            self._run_flight(key, compute, flight)
+        return flight.result(), 'miss'
+
+    def _refresh(self, key, compute):
+        """Recompute a stale entry in the background. Call with ``self.lock`` held."""
+        if not self.flights.is_running(key):
+            flight, _ = self.flights.claim(key)
+            threading.Thread(
+                target=self._run_flight,
+                args=(key, compute, flight),
+                daemon=True
+            ).start()
+
+    def _run_flight(self, key, compute, flight):
+        try:
+            value = compute()
+        except Exception as e:
+            logger.error(f"Error computing cache entry {key}: {str(e)}")
+            self.finish(key, flight, error=e)
+            return
+        self.finish(key, flight, value=value)
+
+    def claim(self, key):
+        """Join the computation of ``key`` or become its leader, for callers that
+        compute incrementally (e.g. streaming). Returns ``(flight, leader)``; the
+        leader must call ``finish``, the others wait with ``flight.result()``.
+        """
+        with self.lock:
+            return self.flights.claim(key)
+
+    def finish(self, key, flight, value=None, error=None):
+        """Cache the leader's value (unless None) and hand it to the waiters."""
+        if value is not None:
+            self.put(key, value)
+        self.flights.finish(key, flight, value=value, error=error)
+
+    def get(self, key, refresh=None):
+        """Return ``(value, status)`` for a fresh or stale entry, else ``(None, 'miss')``.
+
+        Unlike get_or_compute this never computes a missing entry; a stale one
+        is recomputed in the background with ``refresh``, if given.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, 'miss'
+            value, created_at = entry
+            age = time.time() - created_at
+            if age < self.ttl:
+                return value, 'hit'
+            if age < self.ttl + self.stale_ttl:
+                if refresh is not None:
+                    self._refresh(key, refresh)
+                return value, 'stale'
+            return None, 'miss'
+
+    def put(self, key, value):
+        """Store a value computed outside get_or_compute."""
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop a cached entry."""
+        with self.lock:
+            self.entries.pop(key, None)
@@ -1,19 +1,30 @@
 import os
 import sys
+import time
 from pathlib import Path
 import json
 import logging
-from flask import Flask, request, jsonify
-from langchain_groq import ChatGroq
+import threading
+from flask import Flask, request, jsonify, Response, stream_with_context
 from youtube_transcript_api import YouTubeTranscriptApi
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
+
+# Make the shared AI helpers importable when running this service directly
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.embeddings import get_embeddings, embedding_signature
+from shared.llm import create_llm, PRIORITY_BATCH
+from shared.llm_metrics import metrics as llm_metrics, PromptBudgetExceeded
+from shared.sse import sse_event, SSE_HEADERS
+from shared.context_packing import pack_documents
+from shared.extractive import compress_documents
+from analysis_cache import AnalysisCache
+from batch_jobs import BatchRunner, without_results
+from single_flight import SingleFlight
+from transcript_index import TranscriptIndex, TranscriptIndexStore, join_segments, format_timestamp
 
 # Load environment variables
 load_dotenv()
@@ -25,25 +36,113 @@ logger = logging.getLogger(__name__)
 # Initialize resources
 os.environ["HF_HOME"] = os.path.expanduser("~/.cache/huggingface")
 
-# Load the Groq API key
-try:
-    groq_api_key = os.environ['GROQ_API_KEY']
-except KeyError:
+# Load the Groq API key; replaying an LLM cassette needs none
+groq_api_key = os.getenv('GROQ_API_KEY')
+if not groq_api_key and os.getenv("LLM_CASSETTE_MODE", "").lower() != "replay":
     logger.error("GROQ_API_KEY environment variable not set")
     sys.exit(1)
 
 # Flask app initialization
 app = Flask(__name__)
 
+MODEL_NAME = "llama-3.3-70b-versatile"
+
+# Bump whenever ANALYSIS_PROMPT changes so cached analyses are recomputed
+ANALYSIS_PROMPT_VERSION = "1"
+
+# Create prompt template for comprehensive analysis
+ANALYSIS_PROMPT = ChatPromptTemplate.from_template(
+    """
+    Based on the video transcript provided in the context, please provide a comprehensive analysis including:
+    1. Main Topics:
+       - List and explain the key subjects covered
+       - Identify the primary themes and concepts
+    
+    2. Key Points and Takeaways:
+       - Summarize the most important information
+       - Highlight crucial insights and findings
+    
+    3. Technical Details:
+       - List any specific techniques, methods, or tools mentioned
+       - Explain any step-by-step processes described
+    
+    4. Practical Applications:
+       - Identify real-world applications discussed
+       - Note any examples or case studies mentioned
+    
+    Please structure your response clearly and provide specific examples from the transcript where relevant.
+
+    <context>
+    {context}
+    </context>
+
+    Question: {input}
+    """
+)
+
+ANALYSIS_QUESTION = "Please provide a detailed analysis of the video content."
+RELEVANCE_QUERY = "What are the main points and key concepts discussed in this video?"
+
+# Chunks retrieved once for both the analysis prompt and the relevant sections,
+# then packed into the token budget for the prompt
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Fraction of context sentences kept by the extractive stage (0 disables it)
+EXTRACTIVE_RATIO = float(os.getenv("EXTRACTIVE_RATIO", "0"))
+EXTRACTIVE_METHOD = os.getenv("EXTRACTIVE_METHOD", "textrank")
+
+# Cache of analyses keyed by (video ID, prompt version, model name)
+analysis_cache = AnalysisCache(
+    ttl=int(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600))),
+    stale_ttl=int(os.getenv("ANALYSIS_CACHE_STALE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "256"))
+)
+
+# Timestamped transcript indexes, persisted per video
+transcript_indexes = TranscriptIndexStore(
+    os.getenv("TRANSCRIPT_INDEX_DIR", str(Path(__file__).resolve().parent / "indexes")),
+    max_loaded=int(os.getenv("TRANSCRIPT_INDEX_MAX_LOADED", "32")),
+    embedding=embedding_signature()
+)
+
+# Coalesces identical concurrent /video_index/search requests
+search_flights = SingleFlight()
+# Larger k values of /video_index/search are clamped to this
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "50"))
+
+# Batch analysis: videos of all jobs share BATCH_MAX_WORKERS workers, and at most
+# BATCH_INDEX_CONCURRENCY of them fetch and embed transcripts at once; the LLM
+# calls are paced by the rate-limit scheduler
+BATCH_MAX_VIDEOS = int(os.getenv("BATCH_MAX_VIDEOS", "200"))
+batch_runner = BatchRunner(
+    max_workers=int(os.getenv("BATCH_MAX_WORKERS", "8")),
+    max_jobs=int(os.getenv("BATCH_MAX_JOBS", "100")),
+    # Set by serve.py when several worker processes share the port
+    state_dir=os.getenv("BATCH_JOB_DIR") or None
+)
+index_build_slots = threading.BoundedSemaphore(int(os.getenv("BATCH_INDEX_CONCURRENCY", "4")))
+
 # Initialize resources with error handling
 try:
-    embeddings = HuggingFaceEmbeddings()
+    embeddings = get_embeddings()
     # Updated to use the recommended model
-    llm = ChatGroq(groq_api_key=groq_api_key, model_name="llama-3.3-70b-versatile", temperature=0)
+    llm = create_llm(MODEL_NAME, temperature=0, priority=PRIORITY_BATCH, api_key=groq_api_key, call_site="analysis")
 except Exception as e:
     logger.error(f"Failed to initialize resources: {str(e)}")
     sys.exit(1)
 
+# Chain that stuffs the packed context into the analysis prompt
+analysis_chain = create_stuff_documents_chain(llm, ANALYSIS_PROMPT)
+
+class AnalysisError(Exception):
+    """Raised when a video cannot be analyzed; carries the HTTP status to return."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
 def get_youtube_video_id(url):
     """Extract video ID from YouTube URL."""
     try:
@@ -58,13 +157,12 @@ def get_youtube_video_id(url):
         return None
     return None
 
-def get_video_transcript(video_id):
-    """Get transcript for a YouTube video."""
+def get_video_segments(video_id):
+    """Get the timed transcript segments (text, start, duration) of a YouTube video."""
     try:
         # First try with default language
         try:
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-            return ' '.join([entry['text'] for entry in transcript_list])
+            return YouTubeTranscriptApi.get_transcript(video_id)
         except Exception as e:
             logger.info(f"Trying to get transcript with language list: {str(e)}")
             
@@ -74,90 +172,167 @@ def get_video_transcript(video_id):
         # Try to get English transcript first
         try:
             english_transcript = transcript_list.find_transcript(['en'])
-            transcript_data = english_transcript.fetch()
-            return ' '.join([entry['text'] for entry in transcript_data])
+            return english_transcript.fetch()
         except Exception:
             logger.info("English transcript not found, trying other available languages")
         
         # If English not available, get the first available transcript
         available_transcript = next(iter(transcript_list))
-        transcript_data = available_transcript.fetch()
-        return ' '.join([entry['text'] for entry in transcript_data])
+        return available_transcript.fetch()
             
     except Exception as e:
         logger.error(f"Error getting transcript: {str(e)}")
         return None
 
-def process_transcript_with_rag(transcript):
-    """Process the transcript using RAG."""
-    try:
-        # Split the transcript into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        documents = text_splitter.create_documents([transcript])
-
-        # Create vector store
-        vectors = Chroma.from_documents(documents, embeddings)
-
-        # Create prompt template for comprehensive analysis
-        prompt = ChatPromptTemplate.from_template(
-            """
-            Based on the video transcript provided in the context, please provide a comprehensive analysis including:
-            1. Main Topics:
-               - List and explain the key subjects covered
-               - Identify the primary themes and concepts
-            
-            2. Key Points and Takeaways:
-               - Summarize the most important information
-               - Highlight crucial insights and findings
-            
-            3. Technical Details:
-               - List any specific techniques, methods, or tools mentioned
-               - Explain any step-by-step processes described
-            
-            4. Practical Applications:
-               - Identify real-world applications discussed
-               - Note any examples or case studies mentioned
-            
-            Please structure your response clearly and provide specific examples from the transcript where relevant.
+def get_video_transcript(video_id):
+    """Get transcript for a YouTube video."""
+    segments = get_video_segments(video_id)
+    return join_segments(segments) if segments else None
 
-            <context>
-            {context}
-            </context>
+def retrieve_analysis_context(index):
+    """Embed the retrieval query once, search the index once and pack the hits.
 
-            Question: {input}
-            """
-        )
+    The same scored chunks feed the LLM prompt and the relevant sections of
+    the response. Returns ``(docs_with_scores, context, packing_stats, timings)``.
+    """
+    timings = {}
 
-        # Create and execute chains
-        document_chain = create_stuff_documents_chain(llm, prompt)
-        retriever = vectors.as_retriever()
-        retrieval_chain = create_retrieval_chain(retriever, document_chain)
+    started = time.perf_counter()
+    query_vector = embeddings.embed_query(RELEVANCE_QUERY)
+    timings['embed_query'] = time.perf_counter() - started
 
-        # Get similar chunks for context
-        docs_with_scores = vectors.similarity_search_with_score(
-            "What are the main points and key concepts discussed in this video?",
-            k=5
-        )
+    started = time.perf_counter()
+    docs_with_scores = [
+        (Document(page_content=match['text'], metadata={'start': match['start'], 'end': match['end']}), match['score'])
+        for match in index.search(query_vector, k=CONTEXT_CANDIDATES)
+    ]
+    timings['search'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    context, packing_stats = pack_documents(docs_with_scores, CONTEXT_TOKEN_BUDGET)
+    timings['pack'] = time.perf_counter() - started
+    logger.info(
+        f"Packed analysis context from {packing_stats['tokens_before']} "
+        f"to {packing_stats['tokens_after']} tokens"
+    )
+
+    # Optionally keep only the most central sentences before the LLM pass
+    if 0 < EXTRACTIVE_RATIO < 1:
+        started = time.perf_counter()
+        context, extractive_stats = compress_documents(context, embeddings, EXTRACTIVE_RATIO, EXTRACTIVE_METHOD)
+        timings['extractive'] = time.perf_counter() - started
+        packing_stats['extractive'] = extractive_stats
+        logger.info(f"Extractive stage kept {extractive_stats['compression_ratio']:.0%} of the context")
+
+    return docs_with_scores, context, packing_stats, timings
+
+def get_relevant_sections(docs_with_scores, k=5):
+    """Format the best scored chunks for the response payload."""
+    return [
+        {
+            'content': doc.page_content,
+            'relevance_score': float(score),
+            'start': doc.metadata['start'],
+            'end': doc.metadata['end']
+        } for doc, score in docs_with_scores[:k]
+    ]
+
+def process_transcript_with_rag(index):
+    """Process the transcript index using RAG."""
+    try:
+        docs_with_scores, context, packing_stats, timings = retrieve_analysis_context(index)
 
         # Get the analysis
-        response = retrieval_chain.invoke({
-            "input": "Please provide a detailed analysis of the video content."
-        })
+        started = time.perf_counter()
+        analysis = analysis_chain.invoke({"input": ANALYSIS_QUESTION, "context": context})
+        timings['llm'] = time.perf_counter() - started
 
         return {
-            'analysis': response['answer'],
-            'relevant_sections': [
-                {
-                    'content': doc.page_content,
-                    'relevance_score': float(score)
-                } for doc, score in docs_with_scores
-            ]
+            'analysis': analysis,
+            'relevant_sections': get_relevant_sections(docs_with_scores),
+            'context_tokens': packing_stats,
+            'timings': timings
         }
 
+    except PromptBudgetExceeded as e:
+        logger.warning(str(e))
+        raise AnalysisError('Transcript context exceeds the prompt budget', 413)
     except Exception as e:
         logger.error(f"Error in RAG processing: {str(e)}")
         return None
 
+def stream_transcript_with_rag(index):
+    """Process the transcript index using RAG, yielding answer tokens as they arrive.
+
+    The last item yielded is the complete result dict, as returned by
+    process_transcript_with_rag.
+    """
+    docs_with_scores, context, packing_stats, timings = retrieve_analysis_context(index)
+
+    started = time.perf_counter()
+    answer_parts = []
+    for token in analysis_chain.stream({"input": ANALYSIS_QUESTION, "context": context}):
+        if token:
+            answer_parts.append(token)
+            yield token
+    timings['llm'] = time.perf_counter() - started
+
+    yield {
+        'analysis': ''.join(answer_parts),
+        'relevant_sections': get_relevant_sections(docs_with_scores),
+        'context_tokens': packing_stats,
+        'timings': timings
+    }
+
+def get_transcript_index(video_id):
+    """Return the timestamped index of a video, fetching and embedding its transcript if needed."""
+    def build():
+        segments = get_video_segments(video_id)
+        if not segments:
+            logger.error(f"Could not retrieve transcript for video ID: {video_id}")
+            raise AnalysisError('Could not retrieve video transcript', 400)
+        logger.info("Successfully retrieved video transcript")
+        return TranscriptIndex.build(segments, embeddings)
+
+    return transcript_indexes.get_or_build(video_id, build)
+
+def analysis_cache_key(video_id):
+    """Cache key of a video analysis; anything that changes the output is part of it."""
+    return (video_id, ANALYSIS_PROMPT_VERSION, MODEL_NAME, EXTRACTIVE_RATIO, EXTRACTIVE_METHOD)
+
+def analyze_video(video_id):
+    """Analyze a video with RAG over its timestamped transcript chunks."""
+    started = time.perf_counter()
+    index = get_transcript_index(video_id)
+    index_time = time.perf_counter() - started
+
+    rag_result = process_transcript_with_rag(index)
+    if not rag_result:
+        logger.error("RAG processing failed")
+        raise AnalysisError('Could not analyze transcript', 500)
+    rag_result['timings']['transcript_index'] = index_time
+    logger.info(f"Successfully processed transcript with RAG: {rag_result['timings']}")
+    return rag_result
+
+def analyze_batch_item(item):
+    """Analyze one video of a batch job, sharing the analysis cache with /process_video."""
+    video_id = item['video_id']
+    if not video_id:
+        raise AnalysisError('Invalid YouTube URL', 400)
+
+    cache_key = analysis_cache_key(video_id)
+    rag_result, cache_status = analysis_cache.get(cache_key)
+    if rag_result is None:
+        with index_build_slots:
+            get_transcript_index(video_id)
+        rag_result, cache_status = analysis_cache.get_or_compute(cache_key, lambda: analyze_video(video_id))
+    return {
+        'analysis': rag_result['analysis'],
+        'context_tokens': rag_result.get('context_tokens'),
+        'timings': rag_result.get('timings'),
+        'cache': cache_status
+    }
+
 @app.route('/process_video', methods=['POST'])
 def process_video():
     """
@@ -186,24 +361,23 @@ def process_video():
 
         logger.info(f"Extracted video ID: {video_id}")
 
-        # Get video transcript
-        transcript = get_video_transcript(video_id)
-        if not transcript:
-            logger.error(f"Could not retrieve transcript for video ID: {video_id}")
-            return jsonify({'error': 'Could not retrieve video transcript'}), 400
-        logger.info("Successfully retrieved video transcript")
+        # Serve from the cache, analyzing the video only when needed
+        cache_key = analysis_cache_key(video_id)
+        try:
+            rag_result, cache_status = analysis_cache.get_or_compute(
+                cache_key, lambda: analyze_video(video_id)
+            )
+        except AnalysisError as e:
+            return jsonify({'error': e.message}), e.status_code
+        logger.info(f"Analysis cache {cache_status} for video ID: {video_id}")
 
-        # Process with RAG
-        rag_result = process_transcript_with_rag(transcript)
-        if not rag_result:
-            logger.error("RAG processing failed")
-            return jsonify({'error': 'Could not analyze transcript'}), 500
-        logger.info("Successfully processed transcript with RAG")
-        
         # Format the response
         result = {
             'success': True,
-            'analysis': rag_result['analysis']
+            'analysis': rag_result['analysis'],
+            'context_tokens': rag_result.get('context_tokens'),
+            'timings': rag_result.get('timings'),
+            'cache': cache_status
         }
 
         logger.info("Successfully completed video processing")
@@ -213,5 +387,224 @@ def process_video():
         logger.error(f"Unexpected error processing request: {str(e)}", exc_info=True)
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/video_index/search', methods=['POST'])
+def search_video_index():
+    """
+    API endpoint to find where in a video a topic is discussed.
+    Expects a JSON payload with 'video_url' and 'query' fields and an optional 'k'.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data or 'video_url' not in data or not data.get('query'):
+            return jsonify({'error': 'Invalid request, "video_url" and "query" fields are required'}), 400
+
+        video_id = get_youtube_video_id(data['video_url'])
+        if not video_id:
+            return jsonify({'error': 'Invalid YouTube URL'}), 400
+
+        try:
+            index = get_transcript_index(video_id)
+        except AnalysisError as e:
+            return jsonify({'error': e.message}), e.status_code
+
+        # Exact identifiers are matched by BM25 alone; other queries fuse BM25 with the vectors.
+        # Identical concurrent searches share one query embedding.
+        try:
+            k = int(data.get('k', 5))
+        except (TypeError, ValueError):
+            k = 0
+        if k < 1:
+            return jsonify({'error': 'Invalid request, "k" must be a positive integer'}), 400
+        query, k = data['query'], min(k, SEARCH_MAX_K)
+        (matches, mode), _ = search_flights.do(
+            (video_id, 'video_index/search', query, k),
+            lambda: index.hybrid_search(query, embeddings.embed_query, k=k)
+        )
+        return jsonify({
+            'success': True,
+            'video_id': video_id,
+            'mode': mode,
+            'matches': [
+                {
+                    'content': match['text'],
+                    'start': match['start'],
+                    'end': match['end'],
+                    'timestamp': format_timestamp(match['start']),
+                    'url': f"https://www.youtube.com/watch?v={video_id}&t={int(match['start'])}s",
+                    'score': match['score']
+                } for match in matches
+            ]
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error searching video index: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+def stream_done(video_id, rag_result, cache_status, start, time_to_first_token):
+    """Payload of the 'done' event of /process_video/stream, the same on every path."""
+    return {
+        'success': True,
+        'video_id': video_id,
+        'cache': cache_status,
+        'sections': rag_result.get('relevant_sections'),
+        'context_tokens': rag_result.get('context_tokens'),
+        'timings': rag_result.get('timings'),
+        'time_to_first_token': time_to_first_token,
+        'response_time': time.perf_counter() - start
+    }
+
+def stream_analysis(video_id, cache_key, flight, start):
+    """Stream a fresh analysis as server-sent events.
+
+    The caller leads ``flight``: the result is cached and handed to concurrent
+    requests for the same analysis as soon as the LLM finishes, and they get an
+    error if this stream fails or the client disconnects first.
+    """
+    finished = False
+    error = AnalysisError('Could not analyze transcript', 500)
+    try:
+        try:
+            index = get_transcript_index(video_id)
+        except AnalysisError as e:
+            error = e
+            yield sse_event('error', {'error': e.message})
+            return
+
+        time_to_first_token = None
+        try:
+            for item in stream_transcript_with_rag(index):
+                if isinstance(item, dict):
+                    rag_result = item
+                    break
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                yield sse_event('token', {'text': item})
+        except PromptBudgetExceeded as e:
+            logger.warning(str(e))
+            error = AnalysisError('Transcript context exceeds the prompt budget', 413)
+            yield sse_event('error', {'error': error.message})
+            return
+
+        analysis_cache.finish(cache_key, flight, value=rag_result)
+        finished = True
+        yield sse_event('done', stream_done(video_id, rag_result, 'miss', start, time_to_first_token))
+    finally:
+        if not finished:
+            analysis_cache.finish(cache_key, flight, error=error)
+
+@app.route('/process_video/stream', methods=['POST'])
+def process_video_stream():
+    """
+    Streaming variant of /process_video.
+    Sends the analysis as server-sent 'token' events while the LLM generates it,
+    followed by a 'done' event with the metadata (or an 'error' event).
+    """
+    data = request.get_json(silent=True)
+    if not data or 'video_url' not in data:
+        return jsonify({'error': 'Invalid request, "video_url" field is required'}), 400
+
+    video_url = data['video_url']
+    video_id = get_youtube_video_id(video_url)
+    if not video_id:
+        logger.error(f"Invalid YouTube URL: {video_url}")
+        return jsonify({'error': 'Invalid YouTube URL'}), 400
+
+    cache_key = analysis_cache_key(video_id)
+
+    def generate():
+        start = time.perf_counter()
+        try:
+            # A stale entry is served at once and refreshed in the background, as on /process_video
+            rag_result, cache_status = analysis_cache.get(cache_key, refresh=lambda: analyze_video(video_id))
+            if rag_result is None:
+                flight, leader = analysis_cache.claim(cache_key)
+                if leader:
+                    yield from stream_analysis(video_id, cache_key, flight, start)
+                    return
+
+                # Another request is already analyzing this video; share its result
+                logger.info(f"Joining in-flight analysis of video ID: {video_id}")
+                try:
+                    rag_result = flight.result()
+                except AnalysisError as e:
+                    yield sse_event('error', {'error': e.message})
+                    return
+                if rag_result is None:
+                    yield sse_event('error', {'error': 'Could not analyze transcript'})
+                    return
+                cache_status = 'shared'
+
+            yield sse_event('token', {'text': rag_result['analysis']})
+            yield sse_event('done', stream_done(
+                video_id, rag_result, cache_status, start, time.perf_counter() - start
+            ))
+
+        except Exception as e:
+            logger.error(f"Error streaming analysis: {str(e)}", exc_info=True)
+            yield sse_event('error', {'error': 'Internal server error'})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/process_video/batch', methods=['POST'])
+def process_video_batch():
+    """
+    Start analyzing many videos at once.
+    Expects a JSON payload with a 'video_urls' list and returns 202 with the job ID;
+    follow it with GET /process_video/batch/<job_id> or its /stream.
+    """
+    data = request.get_json(silent=True)
+    video_urls = data.get('video_urls') if data else None
+    if not isinstance(video_urls, list) or not video_urls:
+        return jsonify({'error': 'Invalid request, "video_urls" must be a non-empty list'}), 400
+    if len(video_urls) > BATCH_MAX_VIDEOS:
+        return jsonify({'error': f'At most {BATCH_MAX_VIDEOS} videos per batch'}), 400
+
+    items = [{'video_url': url, 'video_id': get_youtube_video_id(str(url))} for url in video_urls]
+    job = batch_runner.submit(items, analyze_batch_item)
+    logger.info(f"Started batch {job.id} with {len(items)} videos")
+    return jsonify(job.summary(include_results=False)), 202
+
+@app.route('/process_video/batch/<job_id>', methods=['GET'])
+def get_video_batch(job_id):
+    """Per-video status of a batch job, with the analyses finished so far."""
+    include_results = request.args.get('results', '1') != '0'
+    job = batch_runner.get(job_id)
+    if job is not None:
+        return jsonify(job.summary(include_results=include_results)), 200
+
+    # Started by another worker process
+    summary = batch_runner.load(job_id)
+    if summary is None:
+        return jsonify({'error': 'Unknown batch job'}), 404
+    return jsonify(summary if include_results else without_results(summary)), 200
+
+@app.route('/process_video/batch/<job_id>/stream', methods=['GET'])
+def stream_video_batch(job_id):
+    """
+    Server-sent 'video' events as each video of the batch finishes,
+    then a 'done' event with the per-video status.
+    """
+    job = batch_runner.get(job_id)
+    if job is None and batch_runner.load(job_id) is None:
+        return jsonify({'error': 'Unknown batch job'}), 404
+
+    def generate():
+        items = job.follow() if job is not None else batch_runner.follow_saved(job_id)
+        for item in items:
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield sse_event('video', item)
+        summary = job.summary() if job is not None else batch_runner.load(job_id)
+        yield sse_event('done', without_results(summary) if summary else {'job_id': job_id})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/metrics/llm', methods=['GET'])
+def llm_usage():
+    """Prompt/completion tokens, latency and time to first token per call site, endpoint and request."""
+    return jsonify(llm_metrics.snapshot()), 200
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001, use_reloader=False)
\ No newline at end of file
+    # The Werkzeug debugger runs code from the browser; only enable it on a development machine
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", port=5001, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+Batch jobs over many videos with bounded concurrency.
+
+Each job is a list of items run on a shared worker pool, so several jobs
+together never exceed the configured number of workers. Per-item status is
+kept on the job, and finished items can be followed as they complete.
+
+When the service runs as several processes (serve.py), a status request may
+reach a process that did not start the job; with ``state_dir`` set, jobs save
+a snapshot after every finished item that the other processes read instead.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_ERROR = 'error'
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def without_results(summary):
+    """Copy of a job summary without the per-item results."""
+    return dict(summary, items=[
+        {key: value for key, value in item.items() if key != 'result'} for item in summary['items']
+    ])
+
+
+class BatchJob:
+    """Items of one batch request and the order in which they finished."""
+
+    def __init__(self, items):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.items = [dict(item, status=STATUS_QUEUED) for item in items]
+        self.finished = []  # item indexes in completion order
+        self.condition = threading.Condition()
+        self.state_path = None  # set by BatchRunner when jobs are saved
+        self.save_lock = threading.Lock()
+
+    @property
+    def done(self):
+        return len(self.finished) == len(self.items)
+
+    def _update(self, index, **fields):
+        with self.condition:
+            self.items[index].update(fields)
+            finished = fields.get('status') in (STATUS_DONE, STATUS_ERROR)
+            if finished:
+                self.finished.append(index)
+            self.condition.notify_all()
+        if finished:
+            self.save()
+
+    def save(self):
+        """Write the job snapshot for other processes, if the runner keeps state on disk."""
+        if self.state_path is None:
+            return
+        # Snapshots are taken under the lock so a newer one is never overwritten by an older one
+        with self.save_lock:
+            temporary = self.state_path.with_suffix('.tmp')
+            try:
+                with open(temporary, 'w', encoding='utf-8') as f:
+                    json.dump(self.summary(), f)
+                os.replace(temporary, self.state_path)
+            except OSError as e:
+                logger.error(f"Error saving batch {self.id}: {str(e)}")
+
+    def summary(self, include_results=True):
+        """Job status with every item; results are left out when not wanted."""
+        with self.condition:
+            counts = {}
+            for item in self.items:
+                counts[item['status']] = counts.get(item['status'], 0) + 1
+            summary = {
+                'job_id': self.id,
+                'total': len(self.items),
+                'counts': counts,
+                'done': self.done,
+                'elapsed': time.time() - self.created_at,
+                'items': [dict(item) for item in self.items]
+            }
+        return summary if include_results else without_results(summary)
+
+    def follow(self, timeout=15.0):
+        """Yield finished items as they complete, and None after ``timeout`` seconds without one."""
+        position = 0
+        while True:
+            with self.condition:
+                if position == len(self.finished) and not self.done:
+                    self.condition.wait(timeout)
+                ready = self.finished[position:]
+                position += len(ready)
+                items = [dict(self.items[index]) for index in ready]
+                finished = self.done
+            if not items and not finished:
+                yield None
+            for item in items:
+                yield item
+            if finished and position == len(self.finished):
+                return
+
+
+class BatchRunner:
+    """Runs batch jobs on a bounded worker pool and remembers recent jobs."""
+
+    def __init__(self, max_workers=8, max_jobs=100, state_dir=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.state_dir = Path(state_dir) if state_dir else None
+        if self.state_dir:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    def submit(self, items, process):
+        """Start a job; ``process(item)`` returns the item's result or raises."""
+        job = BatchJob(items)
+        if self.state_dir is not None:
+            job.state_path = self.state_dir / f"{job.id}.json"
+            job.save()
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+
+        for index, item in enumerate(items):
+            self.executor.submit(self._run, job, index, item, process)
+        return job
+
+    def _run(self, job, index, item, process):
+        started = time.perf_counter()
+        job._update(index, status=STATUS_RUNNING)
+        try:
+            result = process(item)
+        except Exception as e:
+            logger.error(f"Batch {job.id} item {index} failed: {str(e)}")
+            job._update(index, status=STATUS_ERROR, error=getattr(e, 'message', str(e)),
+                        duration=time.perf_counter() - started)
+            return
+        job._update(index, status=STATUS_DONE, result=result, duration=time.perf_counter() - started)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def load(self, job_id):
+        """Saved summary of a job started by another process, or None."""
+        if self.state_dir is None or not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self.state_dir / f"{job_id}.json", encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def follow_saved(self, job_id, interval=1.0, keepalive=15.0):
+        """Like BatchJob.follow for a job of another process, by polling its snapshot."""
+        sent = set()
+        idle = 0.0
+        while True:
+            summary = self.load(job_id)
+            if summary is None:
+                return
+            ready = [
+                index for index, item in enumerate(summary['items'])
+                if index not in sent and item['status'] in (STATUS_DONE, STATUS_ERROR)
+            ]
+            for index in ready:
+                sent.add(index)
+                yield summary['items'][index]
+            if summary['done']:
+                return
+            idle = 0.0 if ready else idle + interval
+            if idle >= keepalive:
+                idle = 0.0
+                yield None
+            time.sleep(interval)
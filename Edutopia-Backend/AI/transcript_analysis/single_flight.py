@@ -0,0 +1,70 @@
+"""
+Request coalescing: concurrent calls with the same key share one computation.
+
+The first caller for a key runs the work; callers arriving while it is in
+flight wait for it and receive the same result (or exception). Nothing is kept
+once the computation finishes, so this complements the caches rather than
+replacing them.
+"""
+import threading
+
+
+class Flight:
+    """A computation in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Coalesces concurrent calls by key."""
+
+    def __init__(self):
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.stats = {'leaders': 0, 'shared': 0}
+
+    def claim(self, key):
+        """Return ``(flight, leader)``; the leader must call ``finish`` on the flight."""
+        with self.lock:
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.stats['shared'] += 1
+                return flight, False
+            flight = self.in_flight[key] = Flight()
+            self.stats['leaders'] += 1
+            return flight, True
+
+    def finish(self, key, flight, value=None, error=None):
+        """Publish the leader's result to every waiter."""
+        flight.value = value
+        flight.error = error
+        with self.lock:
+            if self.in_flight.get(key) is flight:
+                del self.in_flight[key]
+        flight.done.set()
+
+    def is_running(self, key):
+        with self.lock:
+            return key in self.in_flight
+
+    def do(self, key, compute):
+        """Return ``(value, shared)``; ``shared`` is True when another caller computed it."""
+        flight, leader = self.claim(key)
+        if not leader:
+            return flight.result(), True
+        try:
+            value = compute()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, value=value)
+        return value, False
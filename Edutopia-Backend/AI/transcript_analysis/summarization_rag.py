@@ -1,17 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 import os
+import sys
 import time
-from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEmbeddings
+from pathlib import Path
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
 from langchain_community.vectorstores import Chroma  
 from youtube_transcript_api import YouTubeTranscriptApi
 from dotenv import load_dotenv
 import logging
 
+# Make the shared AI helpers importable when running this service directly
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.embeddings import get_embeddings
+from shared.llm import create_llm, PRIORITY_BATCH
+from shared.llm_metrics import metrics as llm_metrics, PromptBudgetExceeded
+from shared.sse import sse_event, SSE_HEADERS
+from shared.context_packing import pack_documents
+from shared.extractive import compress_documents
+
 load_dotenv()
 
 import os
@@ -20,7 +28,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-groq_api_key = os.environ['GROQ_API_KEY']
+# Not needed when LLM_CASSETTE_MODE=replay
+groq_api_key = os.getenv('GROQ_API_KEY')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,8 +39,8 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # Initialize Embeddings & LLM
-embeddings = HuggingFaceEmbeddings()
-llm = ChatGroq(groq_api_key=groq_api_key, model_name="llama-3.2-90b-vision-preview", temperature=0)
+embeddings = get_embeddings()
+llm = create_llm("llama-3.2-90b-vision-preview", temperature=0, priority=PRIORITY_BATCH, api_key=groq_api_key, call_site="summarize")
 
 # Prompt for summarization
 summary_prompt = ChatPromptTemplate.from_template(
@@ -43,6 +52,15 @@ summary_prompt = ChatPromptTemplate.from_template(
     """
 )
 
+# Chunks retrieved for the summary, then packed into the token budget
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Fraction of context sentences kept by the extractive stage (0 disables it);
+# requests can override it with "extractive_ratio"
+EXTRACTIVE_RATIO = float(os.getenv("EXTRACTIVE_RATIO", "0"))
+EXTRACTIVE_METHOD = os.getenv("EXTRACTIVE_METHOD", "textrank")
+
 # Initialize Vector Storage
 vectors = None  # Will be initialized when processing text
 
@@ -78,21 +96,36 @@ def get_youtube_transcript(video_id):
         logger.error(f"Error getting transcript: {str(e)}")
         return None
 
-def process_text(text):
+def process_text(text, extractive_ratio=None):
     """
-    Splits the text into chunks, stores embeddings in ChromaDB, and creates a retrieval chain.
+    Splits the text into chunks, stores embeddings in ChromaDB, and packs the most
+    relevant chunks into the token budget, optionally keeping only the top
+    ``extractive_ratio`` of their sentences.
+    Returns the document chain, the packed context and the packing statistics.
     """
     global vectors
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
     final_documents = text_splitter.create_documents([text])
 
     # Initialize ChromaDB
     vectors = Chroma.from_documents(final_documents, embeddings)
 
-    # Create retrieval chain
-    retriever = vectors.as_retriever()
+    # Merge overlapping chunks and fill the token budget by relevance
+    docs_with_scores = vectors.similarity_search_with_relevance_scores(text, k=CONTEXT_CANDIDATES)
+    context, packing_stats = pack_documents(docs_with_scores, CONTEXT_TOKEN_BUDGET)
+    logger.info(
+        f"Packed summary context from {packing_stats['tokens_before']} "
+        f"to {packing_stats['tokens_after']} tokens"
+    )
+
+    extractive_ratio = EXTRACTIVE_RATIO if extractive_ratio is None else float(extractive_ratio)
+    if 0 < extractive_ratio < 1:
+        context, extractive_stats = compress_documents(context, embeddings, extractive_ratio, EXTRACTIVE_METHOD)
+        packing_stats['extractive'] = extractive_stats
+        logger.info(f"Extractive stage kept {extractive_stats['compression_ratio']:.0%} of the context")
+
     document_chain = create_stuff_documents_chain(llm, summary_prompt)
-    return create_retrieval_chain(retriever, document_chain)
+    return document_chain, context, packing_stats
 
 @app.route('/summarize/video', methods=['POST'])
 def summarize():
@@ -116,18 +149,21 @@ def summarize():
             return jsonify({"error": "Could not retrieve transcript"}), 500
         
         # ✅ Process transcript into vector storage
-        retrieval_chain = process_text(transcript)
+        document_chain, context, packing_stats = process_text(transcript, data.get("extractive_ratio"))
         
         # ✅ Generate Summary
-        response = retrieval_chain.invoke({"input": transcript})
+        summary = document_chain.invoke({"context": context})
         elapsed_time = time.process_time() - start
         
-        logger.info(f"Summary: {response['answer']}")
+        logger.info(f"Summary: {summary}")
         return jsonify({
-            'summary': response['answer'],
+            'summary': summary,
+            'context_tokens': packing_stats,
             'response_time': elapsed_time
         }), 200
 
+    except PromptBudgetExceeded as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -143,20 +179,88 @@ def summarize_text():
             return jsonify({"error": "Missing text parameter"}), 400
 
         # ✅ Process transcript into vector storage
-        retrieval_chain = process_text(text)
+        document_chain, context, packing_stats = process_text(text, data.get("extractive_ratio"))
         
         # ✅ Generate Summary
-        response = retrieval_chain.invoke({"input": text})
+        summary = document_chain.invoke({"context": context})
         elapsed_time = time.process_time() - start
         
-        logger.info(f"Summary: {response['answer']}")
+        logger.info(f"Summary: {summary}")
         return jsonify({
-            'summary': response['answer'],
+            'summary': summary,
+            'context_tokens': packing_stats,
             'response_time': elapsed_time
         }), 200
 
+    except PromptBudgetExceeded as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def stream_summary(text, start, extractive_ratio=None):
+    """Yield server-sent events with the summary tokens of a text, then a 'done' event."""
+    try:
+        document_chain, context, packing_stats = process_text(text, extractive_ratio)
+
+        answer_parts = []
+        time_to_first_token = None
+        for token in document_chain.stream({"context": context}):
+            if token:
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                answer_parts.append(token)
+                yield sse_event('token', {'text': token})
+
+        logger.info(f"Summary: {''.join(answer_parts)}")
+        yield sse_event('done', {
+            'context_tokens': packing_stats,
+            'time_to_first_token': time_to_first_token,
+            'response_time': time.perf_counter() - start
+        })
+
+    except Exception as e:
+        logger.error(f"Error streaming summary: {str(e)}")
+        yield sse_event('error', {'error': str(e)})
+
+@app.route('/summarize/video/stream', methods=['POST'])
+def summarize_video_stream():
+    """Streaming variant of /summarize/video using server-sent events."""
+    start = time.perf_counter()
+
+    data = request.get_json(silent=True) or {}
+    video_url = data.get("video_url")
+    if not video_url:
+        return jsonify({"error": "Missing video_url parameter"}), 400
+
+    video_id = get_youtube_video_id(video_url)
+    if not video_id:
+        return jsonify({"error": "Invalid YouTube URL"}), 400
+
+    def generate():
+        transcript = get_youtube_transcript(video_id)
+        if transcript is None:
+            yield sse_event('error', {'error': 'Could not retrieve transcript'})
+            return
+        yield from stream_summary(transcript, start, data.get("extractive_ratio"))
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/summarize/text/stream', methods=['POST'])
+def summarize_text_stream():
+    """Streaming variant of /summarize/text using server-sent events."""
+    start = time.perf_counter()
+
+    data = request.get_json(silent=True) or {}
+    text = data.get("text")
+    if not text:
+        return jsonify({"error": "Missing text parameter"}), 400
+
+    return Response(stream_with_context(stream_summary(text, start, data.get("extractive_ratio"))), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/metrics/llm', methods=['GET'])
+def llm_usage():
+    """Prompt/completion tokens, latency and time to first token per call site, endpoint and request."""
+    return jsonify(llm_metrics.snapshot()), 200
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,20 +1,23 @@
 import os
 import sys
 import json
+import time
 import logging
 from pathlib import Path
 from flask import Flask, request, jsonify
-from langchain_groq import ChatGroq
 from youtube_transcript_api import YouTubeTranscriptApi
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 
+# Make the shared AI helpers importable when running this service directly
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.embeddings import get_embeddings
+from shared.llm import create_llm, PRIORITY_BATCH
+
 # Initialize Flask app
 app = Flask(__name__)
 
@@ -27,13 +30,16 @@ logger = logging.getLogger(__name__)
 
 # Initialize resources
 os.environ["HF_HOME"] = os.path.expanduser("~/.cache/huggingface")
-embeddings = HuggingFaceEmbeddings()
-llm = ChatGroq(
-    groq_api_key=os.getenv('GROQ_API_KEY'),
-    model_name="llama-3.3-70b-versatile",
-    temperature=0
+embeddings = get_embeddings()
+llm = create_llm(
+    "llama-3.3-70b-versatile",
+    temperature=0,
+    priority=PRIORITY_BATCH,
+    call_site="analysis"
 )
 
+ANALYSIS_QUERY = "Please analyze this video content"
+
 def get_youtube_video_id(url):
     """Extract video ID from YouTube URL."""
     try:
@@ -120,21 +126,33 @@ def process_transcript_with_rag(transcript):
             """
         )
 
-        # Create and execute chains
-        document_chain = create_stuff_documents_chain(llm, prompt)
-        retriever = vectors.as_retriever()
-        retrieval_chain = create_retrieval_chain(retriever, document_chain)
+        # Embed the query once and search once; the same scored chunks feed
+        # the prompt and the relevant sections of the response
+        timings = {}
+        started = time.perf_counter()
+        query_vector = embeddings.embed_query(ANALYSIS_QUERY)
+        timings['embed_query'] = time.perf_counter() - started
 
-        response = retrieval_chain.invoke({
-            "input": "Please analyze this video content"
+        started = time.perf_counter()
+        docs_with_scores = vectors.similarity_search_by_vector_with_relevance_scores(query_vector, k=4)
+        timings['search'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        document_chain = create_stuff_documents_chain(llm, prompt)
+        analysis = document_chain.invoke({
+            "input": ANALYSIS_QUERY,
+            "context": [doc for doc, _ in docs_with_scores]
         })
+        timings['llm'] = time.perf_counter() - started
+        logger.info(f"RAG stage timings: {timings}")
 
         return {
-            'analysis': response['answer'],
+            'analysis': analysis,
             'relevant_sections': [
-                {'content': doc.page_content} 
-                for doc in vectors.similarity_search("summary", k=3)
-            ]
+                {'content': doc.page_content, 'distance': float(distance)}
+                for doc, distance in docs_with_scores[:3]
+            ],
+            'timings': timings
         }
 
     except Exception as e:
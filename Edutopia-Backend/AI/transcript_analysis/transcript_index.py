@@ -0,0 +1,236 @@
+"""
+Timestamped vector index over transcript segments.
+
+Transcripts are chunked on segment boundaries so every chunk keeps the video
+time it covers. Indexes are persisted per video and kept in memory, so a
+"where is X discussed" lookup is one query embedding and one matrix product.
+A BM25 index over the same chunks is built on first use for exact terms.
+"""
+import re
+import json
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+import numpy as np
+from shared.hybrid_retrieval import BM25Index, is_identifier_query, reciprocal_rank_fusion
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Bump when the chunking changes so persisted indexes are rebuilt
+INDEX_VERSION = "1"
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def join_segments(segments):
+    """Join transcript segments into plain text."""
+    return ' '.join(segment['text'] for segment in segments)
+
+
+def chunk_segments(segments, max_chars=1000, overlap_segments=1):
+    """Group consecutive segments into chunks of about ``max_chars`` characters.
+
+    Each chunk repeats the last ``overlap_segments`` segments of the previous
+    one, unless that would take it over ``max_chars``, and records the start
+    and end time it covers. Only a single segment longer than ``max_chars``
+    makes a chunk over the budget.
+    """
+    chunks = []
+    current = []
+    length = 0
+    for segment in segments:
+        text = segment['text'].strip()
+        if not text:
+            continue
+        if current and length + len(text) + 1 > max_chars:
+            chunks.append(current)
+            current = current[-overlap_segments:] if overlap_segments else []
+            length = sum(len(s['text'].strip()) + 1 for s in current)
+            if length + len(text) + 1 > max_chars:
+                current, length = [], 0
+        current.append(segment)
+        length += len(text) + 1
+    if current:
+        chunks.append(current)
+
+    return [
+        {
+            'text': join_segments(chunk),
+            'start': float(chunk[0]['start']),
+            'end': float(chunk[-1]['start']) + float(chunk[-1].get('duration', 0))
+        } for chunk in chunks
+    ]
+
+
+def format_timestamp(seconds):
+    """Format seconds as H:MM:SS or M:SS."""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+class TranscriptIndex:
+    """Chunks of one transcript with their embeddings."""
+
+    def __init__(self, chunks, vectors):
+        self.chunks = chunks
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.unit_vectors = self.vectors / np.maximum(norms, 1e-12)
+        self._keyword_index = None
+
+    @classmethod
+    def build(cls, segments, embeddings, max_chars=1000, overlap_segments=1):
+        """Chunk the segments and embed every chunk in one call."""
+        chunks = chunk_segments(segments, max_chars, overlap_segments)
+        vectors = embeddings.embed_documents([chunk['text'] for chunk in chunks])
+        return cls(chunks, vectors)
+
+    def _rank(self, query_vector, k):
+        """Chunk positions and cosine scores of the ``k`` nearest chunks, best first."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        scores = self.unit_vectors @ query
+
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search(self, query_vector, k=5):
+        """Return the ``k`` chunks closest to the query by cosine similarity."""
+        if not self.chunks:
+            return []
+        return [dict(self.chunks[i], score=score) for i, score in self._rank(query_vector, k)]
+
+    @property
+    def keyword_index(self):
+        # Cheap to build from the chunk texts, so it is not persisted
+        if self._keyword_index is None:
+            self._keyword_index = BM25Index([chunk['text'] for chunk in self.chunks])
+        return self._keyword_index
+
+    def hybrid_search(self, query, embed_query, k=5, candidates=20):
+        """Fuse dense and BM25 rankings with reciprocal rank fusion.
+
+        Identifier queries (``sns.barplot``) with keyword hits are answered from
+        BM25 alone and never call ``embed_query``. Returns ``(matches, mode)``.
+        """
+        keyword_hits = self.keyword_index.search(query, candidates)
+        if keyword_hits and is_identifier_query(query):
+            return [dict(self.chunks[i], score=score) for i, score in keyword_hits[:k]], 'keyword'
+
+        if not self.chunks:
+            return [], 'hybrid'
+        dense_hits = self._rank(embed_query(query), candidates)
+        fused = reciprocal_rank_fusion([[i for i, _ in dense_hits], [i for i, _ in keyword_hits]])
+        return [dict(self.chunks[i], score=score) for i, score in fused[:k]], 'hybrid'
+
+    def save(self, directory, embedding=None):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / 'vectors.npy', self.vectors)
+        with open(directory / 'chunks.json', 'w', encoding='utf-8') as f:
+            json.dump(self.chunks, f)
+        # Written last, so an index whose save was interrupted is rebuilt
+        with open(directory / 'manifest.json', 'w', encoding='utf-8') as f:
+            json.dump({'index_version': INDEX_VERSION, 'embedding': embedding}, f)
+
+    @staticmethod
+    def manifest(directory):
+        """The manifest saved with an index, or None for indexes saved without one."""
+        path = Path(directory) / 'manifest.json'
+        if not path.exists():
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @classmethod
+    def load(cls, directory):
+        directory = Path(directory)
+        with open(directory / 'chunks.json', encoding='utf-8') as f:
+            chunks = json.load(f)
+        return cls(chunks, np.load(directory / 'vectors.npy'))
+
+
+class TranscriptIndexStore:
+    """Per-video indexes persisted on disk with an in-memory LRU of loaded ones.
+
+    ``embedding`` is the signature of the embeddings the indexes are built and
+    queried with; a persisted index built with other embeddings is rebuilt.
+    """
+
+    def __init__(self, directory, max_loaded=32, embedding=None):
+        self.directory = Path(directory)
+        self.embedding = embedding
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+        # Concurrent requests for a video share one transcript fetch and embedding
+        self.builds = SingleFlight()
+
+    def _path(self, video_id):
+        return self.directory / f"v{INDEX_VERSION}" / video_id
+
+    def _remember(self, video_id, index):
+        with self.lock:
+            self.loaded[video_id] = index
+            self.loaded.move_to_end(video_id)
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+
+    def get(self, video_id):
+        """Return the index for a video from memory or disk, or None."""
+        with self.lock:
+            index = self.loaded.get(video_id)
+            if index is not None:
+                self.loaded.move_to_end(video_id)
+                return index
+
+        if not VIDEO_ID_PATTERN.match(video_id):
+            return None
+        path = self._path(video_id)
+        if not (path / 'chunks.json').exists():
+            return None
+        try:
+            manifest = TranscriptIndex.manifest(path)
+            if manifest is None or manifest.get('embedding') != self.embedding:
+                logger.info(f"Transcript index for {video_id} was built with other embeddings, rebuilding")
+                return None
+            index = TranscriptIndex.load(path)
+        except Exception as e:
+            logger.error(f"Error loading transcript index for {video_id}: {str(e)}")
+            return None
+        self._remember(video_id, index)
+        return index
+
+    def get_or_build(self, video_id, build):
+        """Return the index for a video, calling ``build()`` and persisting it if missing.
+
+        Concurrent calls for the same video wait for a single build.
+        """
+        index = self.get(video_id)
+        if index is not None:
+            return index
+        index, _ = self.builds.do(video_id, lambda: self._build(video_id, build))
+        return index
+
+    def _build(self, video_id, build):
+        # A build that finished just before this one was claimed is reused
+        index = self.get(video_id)
+        if index is not None:
+            return index
+
+        index = build()
+        if VIDEO_ID_PATTERN.match(video_id):
+            try:
+                index.save(self._path(video_id), self.embedding)
+            except Exception as e:
+                logger.error(f"Error saving transcript index for {video_id}: {str(e)}")
+        self._remember(video_id, index)
+        return index
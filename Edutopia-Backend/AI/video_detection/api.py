@@ -30,7 +30,6 @@ import torch
 from ultralytics.nn.tasks import DetectionModel
 from torch.nn import Sequential, Module, Conv2d, BatchNorm2d, SiLU, ModuleList, Upsample, MaxPool2d
 from ultralytics.nn.modules import C2f, SPPF, Detect, Conv
-import yt_dlp
 import shutil
 from classification import infer_and_save
 import threading
@@ -77,6 +76,9 @@ processing_results = {}
 
 def download_video(video_url):
     """Download video from URL using yt-dlp."""
+    # Only needed for downloads, so it is not imported at startup
+    import yt_dlp
+
     try:
         # Create a temporary directory for the video
         temp_dir = tempfile.mkdtemp()
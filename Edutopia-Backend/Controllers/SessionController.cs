@@ -47,6 +47,7 @@ namespace Edutopia.Controllers
                 context     = context,
                 user_str=   session.usr_msgs,
                 ai_str=session.ai_response,
+                session_id = id.ToString(),
             };
 
             // Serialize and send the request
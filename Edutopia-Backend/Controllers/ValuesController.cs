@@ -41,6 +41,7 @@ namespace Edutopia.Controllers
                 var requestBody = new
                 {
                     query = query,
+                    session_id = chatId.ToString(),
                 };
 
                 // Serialize and send the request